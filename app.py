@@ -1,36 +1,85 @@
 # -*- coding: utf-8 -*-
 import os
-from flask import Flask, request, jsonify, send_file
+import json
+import base64
+import hashlib
+import hmac
+import functools
+import threading
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 from openai import OpenAI
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from history_store import HistoryStore, HISTORY_TAIL, recent_messages
+from prompt_window import (
+    InvalidHistory, validate_history,
+    assemble_prompt, precompute_prompt_tokens,
+    OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE
+)
+from summarizer import ConversationSummarizer
+from cache import TTLCache, canonical_key
+from singleflight import SingleFlight
+from transport import TransportConfig, build_transport, build_http_client, pool_stats, KeepWarm
+from storage import create_storage
+from write_behind import WriteBehindQueue
+from idempotency import IdempotencyStore, IdempotencyConflict, IdempotencyInProgress
+from batch import BatchRunner
+from export import iter_export, ndjson_batches, gzip_stream, check_export_cursor
+from supabase_jwt import InvalidToken, token_subject
+
+# Prompts vindos do registro (cache compilado + recarga sem reinício); sem prompts, o app não sobe
+from prompts import AGENT_PROMPTS, extract_greetings, registry as prompt_registry
+
+# O cache semântico depende do NumPy; sem ele, o recurso fica desligado
+try:
+    from semantic_cache import SemanticCache, HashingEmbedder, OpenAIEmbedder
+except ImportError:
+    print("!!! AVISO: 'numpy' não instalado. Cache semântico desativado.")
+    SemanticCache = None
 
-# Tenta importar os prompts, mas lida com o erro se o arquivo não existir
 try:
-    from prompts import AGENT_PROMPTS
+    from persona import PersonaIndex
 except ImportError:
-    print("!!! AVISO: Arquivo 'prompts.py' não encontrado. Usando dicionário vazio.")
-    AGENT_PROMPTS = {}
+    PersonaIndex = None
 
 # ===== CARREGA VARIÁVEIS DE AMBIENTE =====
 load_dotenv()
 
-# ===== INICIALIZAR SUPABASE =====
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SECRET_KEY")
+# ===== POOL HTTP COMPARTILHADO =====
+# Um único transporte (keep-alive, HTTP/2, timeouts configuráveis) atende OpenAI e Supabase
+transport_config = TransportConfig()
+http_transport = build_transport(transport_config)
 
-if not supabase_url or not supabase_key:
-    raise ValueError("As variáveis de ambiente SUPABASE_URL e SUPABASE_SECRET_KEY não foram definidas.")
-
-supabase: Client = create_client(supabase_url, supabase_key)
+# ===== INICIALIZAR ARMAZENAMENTO =====
+# Supabase (padrão), SQLite em modo WAL ou memória, conforme STORAGE_BACKEND (ver storage/)
+storage = create_storage(http_transport=http_transport, transport_config=transport_config)
 
 # --- Configuração do Cliente OpenAI ---
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("A variável de ambiente OPENAI_API_KEY não foi definida.")
 
-client = OpenAI(api_key=openai_api_key)
+client = OpenAI(
+    api_key=openai_api_key,
+    http_client=build_http_client(http_transport, transport_config),
+    timeout=transport_config.timeout
+)
+
+
+def _warm_storage():
+    storage.ping()
+
+
+def _warm_openai():
+    client.models.list()
+
+
+# Aquecimento das conexões na subida do worker (gunicorn.conf.py) e periodicamente depois disso
+keep_warm = KeepWarm({"Armazenamento": _warm_storage, "OpenAI": _warm_openai}, transport_config.keepwarm_interval)
 
 # --- Configuração do Servidor Flask ---
 app = Flask(__name__)
@@ -38,42 +87,766 @@ CORS(app, resources={
     r"/*": {
         "origins": ["*"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "Idempotency-Key"],
+        "expose_headers": ["ETag", "Idempotent-Replayed", "X-Next-Offset", "X-Job-Status", "X-Results-Complete"]
     }
 })
 
+# Tokens fixos de cada prompt: calculados uma única vez por versão dos prompts
+prompt_registry.add_deriver("system_tokens", precompute_prompt_tokens)
+
+
+# --- Recuperação de seções das personas (opcional) ---
+# Com PERSONA_RETRIEVAL=true, o prompt de sistema passa a ser o núcleo fixo da persona
+# + as seções mais relevantes para a pergunta atual (ver persona.py).
+# O índice é remontado a cada nova versão dos prompts.
+if os.getenv("PERSONA_RETRIEVAL", "false").lower() in ("1", "true", "yes", "on"):
+    if PersonaIndex is None:
+        print("!!! AVISO: 'numpy' não instalado. Recuperação de seções das personas desativada.")
+    else:
+        try:
+            if os.getenv("PERSONA_EMBEDDER", "hashing") == "openai":
+                persona_embedder = OpenAIEmbedder(client)
+            else:
+                persona_embedder = HashingEmbedder()
+            prompt_registry.add_deriver("persona_index", lambda prompts: PersonaIndex(
+                persona_embedder,
+                top_k=int(os.getenv("PERSONA_TOP_K", 2)),
+                min_score=float(os.getenv("PERSONA_MIN_SCORE", 0.05))
+            ).build(prompts))
+            print(f">>> Índice das personas montado: {prompt_registry.current.derived['persona_index'].stats()['sections']} seções recuperáveis.")
+        except Exception as e:
+            print(f"!!! Erro ao montar o índice das personas; usando os prompts completos: {e}")
+
+
+def build_messages(agent_id, history, summary=None):
+    """Monta o prompt do agente dentro do seu orçamento de tokens. Retorna (mensagens, contexto)."""
+    # Uma única leitura da versão ativa: prompt, tokens e índice sempre da mesma versão
+    snapshot = prompt_registry.current
+    system_prompt = snapshot.prompts.get(agent_id, "")
+    system_tokens = snapshot.derived["system_tokens"].get(agent_id, 0)
+    persona_index = snapshot.derived.get("persona_index")
+    sections = None
+    if persona_index is not None and agent_id in persona_index:
+        query = next((m.get('content') for m in reversed(history) if m.get('role') == 'user'), None)
+        system_prompt, system_tokens, sections = persona_index.system_prompt(agent_id, query)
+
+    messages, context = assemble_prompt(agent_id, system_prompt, system_tokens, history, summary)
+    if sections is not None:
+        context["persona_sections"] = sections
+    return messages, context
+
+
+# --- Cache de respostas idênticas ---
+# Opcional e por agente: RESPONSE_CACHE_AGENTS="allex,lucas" (ou "*" para todos).
+RESPONSE_CACHE_AGENTS = {a.strip() for a in os.getenv("RESPONSE_CACHE_AGENTS", "").split(",") if a.strip()}
+response_cache = TTLCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+)
+
+
+# --- Cache semântico (perguntas parecidas em conversas curtas) ---
+# Opcional e por agente: SEMANTIC_CACHE_AGENTS="gabriela" (ou "*"); embedder "openai" ou "hashing" (local).
+SEMANTIC_CACHE_AGENTS = {a.strip() for a in os.getenv("SEMANTIC_CACHE_AGENTS", "").split(",") if a.strip()}
+SEMANTIC_CACHE_MAX_HISTORY = int(os.getenv("SEMANTIC_CACHE_MAX_HISTORY", 2))
+semantic_cache = None
+if SemanticCache is not None and SEMANTIC_CACHE_AGENTS:
+    if os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai") == "hashing":
+        embedder = HashingEmbedder()
+    else:
+        embedder = OpenAIEmbedder(client)
+    semantic_cache = SemanticCache(
+        embedder,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 500)),
+        ttl=int(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+    )
+
+
+def _agent_enabled(agents, agent_id):
+    return "*" in agents or agent_id in agents
+
+
+# Requisições idênticas simultâneas (duplo envio, retentativas) compartilham uma única chamada à OpenAI
+completion_flight = SingleFlight()
+
+
+def cache_plan(agent_id, messages, history):
+    """
+    Decide quais caches valem para esta completion:
+    `flight` é a chave canônica usada para agrupar chamadas simultâneas idênticas,
+    `key` é a chave do cache exato (ou None) e `query` é a pergunta usada no cache semântico (ou None),
+    que só se aplica a primeiros turnos e conversas curtas. O cache exato já muda de chave com o prompt
+    (vai em `messages`); o semântico compara só a pergunta, então leva a versão dos prompts em `version`.
+    """
+    flight_key = canonical_key(agent_id, OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, messages=messages)
+    plan = {"agent_id": agent_id, "flight": flight_key, "key": None, "query": None, "vector": None,
+            "version": prompt_registry.current.version}
+    if _agent_enabled(RESPONSE_CACHE_AGENTS, agent_id):
+        plan["key"] = flight_key
+    if (semantic_cache is not None and _agent_enabled(SEMANTIC_CACHE_AGENTS, agent_id)
+            and history and history[-1].get('role') == 'user' and len(history) <= SEMANTIC_CACHE_MAX_HISTORY):
+        plan["query"] = history[-1].get('content')
+    return plan
+
+
+def cache_lookup(plan):
+    """Consulta o cache exato e depois o semântico; devolve a resposta em cache ou None."""
+    if not plan:
+        return None
+    if plan["key"]:
+        cached = response_cache.get(plan["key"])
+        if cached is not None:
+            return cached
+    if plan["query"]:
+        try:
+            plan["vector"] = semantic_cache.embed(plan["query"])
+            cached, _ = semantic_cache.lookup(plan["agent_id"], plan["query"], plan["vector"], plan["version"])
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"!!! Erro no cache semântico: {e}")
+    return None
+
+
+def cache_store(plan, ai_response):
+    if not plan or not ai_response:
+        return
+    if plan["key"]:
+        response_cache.set(plan["key"], ai_response)
+    if plan["query"] and plan["vector"] is not None:
+        semantic_cache.add(plan["agent_id"], plan["query"], ai_response, plan["vector"], plan["version"])
+
+
+def create_completion(messages, cache=None):
+    """
+    Chama a OpenAI de forma bloqueante e devolve o texto da resposta (consultando os caches do plano).
+    Chamadas simultâneas com a mesma chave canônica esperam a primeira e recebem o mesmo resultado.
+    """
+    cached = cache_lookup(cache)
+    if cached is not None:
+        return cached
+
+    def call_openai():
+        completion = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            max_tokens=OPENAI_MAX_TOKENS,
+            temperature=OPENAI_TEMPERATURE
+        )
+        ai_response = completion.choices[0].message.content
+        cache_store(cache, ai_response)
+        return ai_response
+
+    if cache and cache.get("flight"):
+        return completion_flight.do(cache["flight"], call_openai)
+    return call_openai()
+
+
+def sse_event(event, payload):
+    """Formata um evento Server-Sent Events com payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def stream_completion(messages, on_complete=None, context=None, cache=None):
+    """Gera eventos SSE com os deltas da OpenAI e um evento final 'done' com o uso de tokens.
+
+    Se `on_complete` for informado, é chamado com o texto completo antes do evento 'done'.
+    Em um acerto do cache, a resposta inteira sai em um único evento 'token'.
+    """
+    parts = []
+    usage = None
+    try:
+        cached = cache_lookup(cache)
+        if cached is not None:
+            yield sse_event("token", {"delta": cached})
+            if on_complete:
+                on_complete(cached)
+            yield sse_event("done", {"response": cached, "usage": None, "context": context, "cached": True})
+            return
+
+        stream = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            max_tokens=OPENAI_MAX_TOKENS,
+            temperature=OPENAI_TEMPERATURE,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage.model_dump()
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+
+        ai_response = "".join(parts)
+        cache_store(cache, ai_response)
+        if on_complete:
+            on_complete(ai_response)
+        yield sse_event("done", {"response": ai_response, "usage": usage, "context": context})
+
+    except Exception as e:
+        print(f"!!! Erro no streaming da API da OpenAI: {e}")
+        yield sse_event("error", {"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"})
+
+
+def sse_response(events):
+    """Embrulha um gerador de eventos SSE em uma resposta HTTP sem buffering."""
+    return Response(events, mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# --- Resumo acumulado das conversas ---
+# As mensagens antigas são resumidas em segundo plano; o prompt usa o resumo + as mensagens posteriores
+# à última resumida.
+summarizer = ConversationSummarizer(
+    client, storage, OPENAI_MODEL,
+    every=int(os.getenv("SUMMARY_EVERY_MESSAGES", 20)),
+    keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", 30)),
+    fold_chunk=int(os.getenv("SUMMARY_FOLD_CHUNK", 100)),
+    max_chunk_chars=int(os.getenv("SUMMARY_MAX_CHUNK_CHARS", 24000))
+)
+
+# --- Persistência de mensagens (write-behind) ---
+# As mensagens são confirmadas assim que chegam ao spool local e gravadas no armazenamento em lotes
+# por um flusher em segundo plano (ver write_behind.py). O resumo conta as mensagens só depois do flush,
+# quando elas já aparecem nas consultas ao armazenamento.
+message_queue = WriteBehindQueue(
+    storage.insert_messages,
+    spool_dir=os.getenv("WRITE_BEHIND_SPOOL_DIR", "spool"),
+    batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 200)),
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.5)),
+    max_retries=int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 3)),
+    fsync=os.getenv("WRITE_BEHIND_FSYNC", "true").lower() in ("1", "true", "yes", "on"),
+    on_flush=summarizer.note_messages,
+    # Com o banco respondendo, uma linha que falha sozinha vai para o spool de descarte em vez de travar a fila
+    probe=storage.ping
+)
+
+
+def persist_message_async(conversation_id, content, role, message_id=None):
+    """Enfileira a gravação da mensagem fora do caminho crítico da requisição."""
+    storage.note_pending_write(conversation_id)
+    row = message_queue.enqueue({'id': message_id, 'conversation_id': conversation_id, 'content': content, 'role': role})
+    history_store.append(conversation_id, role, content, row['created_at'], row['id'])
+
+
+# --- Paginação por cursor (keyset) em (created_at, id) ---
+MESSAGES_PAGE_SIZE = HISTORY_TAIL
+MESSAGES_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row):
+    """Cursor opaco apontando para uma mensagem: base64 de 'created_at|id'."""
+    raw = f"{row['created_at']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    created_at, message_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    return created_at, message_id
+
+
+def fetch_messages_page(conversation_id, before=None, limit=MESSAGES_PAGE_SIZE):
+    """
+    Carrega uma página de mensagens, da mais nova para a mais antiga, a partir de `before` (cursor).
+    Retorna (mensagens em ordem cronológica, next_cursor), onde next_cursor aponta para a página
+    anterior ou é None quando não há mais mensagens.
+    """
+    rows = storage.messages_before(conversation_id, decode_cursor(before) if before else None, limit + 1)
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return list(reversed(rows[:limit])), next_cursor
+
+
+# --- Sincronização incremental pela ordem de gravação (`seq`) ---
+# O created_at vem do enfileiramento em cada worker: uma mensagem com (created_at, id) menor pode ser
+# gravada depois de o cliente já ter sincronizado além dela. `since` e o ETag usam o `seq` do armazenamento.
+
+
+def encode_sync_cursor(seq):
+    """Cursor opaco de sincronização: base64 de 'seq|<seq>' (None se a conversa está vazia)."""
+    if seq is None:
+        return None
+    return base64.urlsafe_b64encode(f"seq|{seq}".encode('utf-8')).decode('ascii')
+
+
+def decode_sync_cursor(cursor):
+    kind, seq = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    if kind != 'seq':
+        raise ValueError("cursor de sincronização em formato antigo")
+    return int(seq)
+
+
+def fetch_messages_since(conversation_id, since, limit=MESSAGES_MAX_PAGE_SIZE):
+    """
+    Carrega apenas as mensagens gravadas depois do cursor `since`, na ordem de gravação.
+    Retorna (mensagens, has_more); has_more indica que há mais de `limit` mensagens novas.
+    """
+    rows = storage.messages_since(conversation_id, decode_sync_cursor(since), limit + 1)
+    return rows[:limit], len(rows) > limit
+
+
+def latest_sync_cursor(conversation_id):
+    """Cursor da última mensagem gravada na conversa (None se vazia): consulta de uma linha."""
+    return encode_sync_cursor(storage.latest_seq(conversation_id))
+
+
+def conversation_etag(conversation_id, latest_cursor, *params):
+    """
+    Versão da conversa para o ETag: muda a cada mensagem nova e quando o histórico é apagado.
+    `params` diferencia representações distintas da mesma versão (ex.: páginas de /messages).
+    """
+    raw = "|".join([str(conversation_id), latest_cursor or "vazia", *[str(p) for p in params]])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def fetch_history(conversation_id):
+    """Carrega do armazenamento as últimas HISTORY_TAIL mensagens da conversa (com created_at e id)."""
+    rows, _ = fetch_messages_page(conversation_id, limit=HISTORY_TAIL)
+    return rows
+
+# --- Histórico em memória ---
+# Guarda o final de cada conversa para que o cliente não precise reenviar a transcrição inteira.
+history_store = HistoryStore(max_bytes=int(os.getenv("HISTORY_STORE_MAX_BYTES", 32 * 1024 * 1024)))
+
+
+def load_history(conversation_id, client_hash=None, summarized_until=None):
+    """
+    Devolve o histórico recente da conversa a partir do cache em memória, sem as mensagens que o resumo
+    já cobre (até `summarized_until`, inclusive). Se a conversa não estiver em cache, ou se o hash enviado
+    pelo cliente não bater com o do cache (ex.: o turno anterior foi atendido por outro worker), recarrega
+    do armazenamento.
+    """
+    history = history_store.get(conversation_id, summarized_until, client_hash)
+    if history is None:
+        rows = fetch_history(conversation_id)
+        history_store.set(conversation_id, rows)
+        history = recent_messages(rows, summarized_until)
+    return history
+
+# --- Resolução de conversa (user_id, agent_id) -> conversation_id ---
+# Conversas já abertas neste worker não precisam consultar a tabela 'conversations' de novo.
+conversation_ids = TTLCache(
+    max_entries=int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", 50000)),
+    ttl=int(os.getenv("CONVERSATION_CACHE_TTL", 86400))
+)
+conversation_owners = TTLCache(max_entries=conversation_ids.max_entries, ttl=conversation_ids.ttl)
+
+
+def resolve_conversation_id(user_id, agent_id):
+    """
+    Devolve o id da conversa do usuário com o agente, criando-a se necessário.
+    Em cache miss, faz um único upsert atômico (on_conflict em user_id, agent_id), que também
+    elimina a corrida que criava conversas duplicadas em aberturas simultâneas.
+    """
+    key = (user_id, agent_id)
+    conversation_id = conversation_ids.get(key)
+    if conversation_id:
+        return conversation_id
+
+    row = storage.upsert_conversation(user_id, agent_id)
+    if not row:
+        return None
+    summarizer.remember(row['id'], row.get('summary'), row.get('summarized_count'))
+    conversation_ids.set(key, row['id'])
+    conversation_owners.set(row['id'], key)
+    return row['id']
+
+
+def conversation_exists(conversation_id):
+    """Verdadeiro se a conversa existe (ids são UUIDs): evita enfileirar gravações que nunca vão passar."""
+    try:
+        uuid.UUID(str(conversation_id))
+    except ValueError:
+        return False
+    if conversation_owners.get(conversation_id):
+        return True
+    row = storage.get_conversation(conversation_id)
+    if not row:
+        return False
+    conversation_owners.set(row['id'], (row['user_id'], row['agent_id']))
+    return True
+
+
+def forget_conversation(conversation_id):
+    """Remove a conversa do cache de resolução (ex.: quando ela é apagada)."""
+    key = conversation_owners.pop(conversation_id)
+    if key:
+        conversation_ids.pop(key)
+
 # ===================================================================
 # == ROTA PRINCIPAL DA IA: /ask                                  ==
 # ===================================================================
+# --- Idempotência (Idempotency-Key) ---
+# Retentativas do cliente com a mesma chave recebem a resposta original, sem nova gravação nem nova completion.
+idempotency_store = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000)),
+    ttl=int(os.getenv("IDEMPOTENCY_TTL", 86400))
+)
+
+
+def idempotent(view):
+    """
+    Aplica o cabeçalho opcional Idempotency-Key à rota; sem ele, a rota se comporta como antes.
+    Respostas SSE seguem em streaming; a repetição recebe só o evento final 'done' (com a resposta completa).
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+
+        def execute():
+            response = app.make_response(view(*args, **kwargs))
+            body = response.response if response.is_streamed else response.get_data()
+            return response.status_code, body, response.mimetype
+
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        try:
+            (status, body, mimetype), replayed = idempotency_store.run(
+                request.path, key, fingerprint, execute, keep=lambda event: event.startswith("event: done\n")
+            )
+        except IdempotencyConflict:
+            return jsonify({"error": "Idempotency-Key já usada com outro conteúdo de requisição"}), 422
+        except IdempotencyInProgress:
+            return jsonify({"error": "A requisição original com esta Idempotency-Key ainda está em andamento"}), 409
+
+        if mimetype == 'text/event-stream':
+            response = sse_response(body)
+        else:
+            response = Response(body, status=status, mimetype=mimetype)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    return wrapper
+
+
+def idempotent_message_id(conversation_id, role):
+    """
+    Id da mensagem gravada por uma requisição com Idempotency-Key (None sem a chave): derivado da chave,
+    para que reexecutar um turno interrompido não duplique linhas (a gravação é idempotente por id).
+    """
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{request.path}\x1f{conversation_id}\x1f{key}\x1f{role}"))
+
+
+def resolve_history(data):
+    """
+    Obtém o histórico de uma requisição do /ask: ou a lista `history` enviada pelo cliente,
+    ou, quando vier `conversation_id`, o resumo e o histórico do servidor mais a nova mensagem (`message`).
+    Retorna (histórico, resumo). Levanta InvalidHistory se o histórico ou a mensagem enviados forem inválidos.
+    """
+    conversation_id = data.get('conversation_id')
+    if conversation_id and 'history' not in data:
+        message = data.get('message')
+        if message is not None and not isinstance(message, str):
+            raise InvalidHistory("message deve ser um texto")
+        summary, summarized_until = summarizer.get_summary(conversation_id)
+        history = load_history(conversation_id, data.get('history_hash'), summarized_until)
+        if message:
+            history = history + [{"role": "user", "content": message}]
+        return history, summary
+    return validate_history(data.get('history', [])), None
+
+
 @app.route('/ask', methods=['POST'])
+@idempotent
 def ask_agent():
     data = request.get_json()
     agent_id = data.get('agent_id')
-    history = data.get('history', [])
 
     if not agent_id or agent_id not in AGENT_PROMPTS:
         return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
 
-    messages = [{"role": "system", "content": AGENT_PROMPTS.get(agent_id, "")}]
-    messages.extend(history)
+    try:
+        history, summary = resolve_history(data)
+    except InvalidHistory as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /ask: {e}")
+        return jsonify({"error": str(e)}), 500
 
-    force_format_instruction = "\n\nLembre-se: Responda em no máximo 3 frases curtas, com cada frase em um novo parágrafo."
-    messages.append({"role": "user", "content": force_format_instruction})
+    messages, context = build_messages(agent_id, history, summary)
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=150,
-            temperature=0.7
-        )
-        ai_response = completion.choices[0].message.content
-        return jsonify({"response": ai_response})
+        ai_response = create_completion(messages, cache_plan(agent_id, messages, history))
+        return jsonify({"response": ai_response, "context": context})
 
     except Exception as e:
         print(f"!!! Erro ao chamar a API da OpenAI: {e}")
         return jsonify({"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"}), 500
 
+# Variante em streaming do /ask: repassa os tokens ao navegador à medida que chegam
+@app.route('/ask/stream', methods=['POST'])
+def ask_agent_stream():
+    data = request.get_json()
+    agent_id = data.get('agent_id')
+
+    if not agent_id or agent_id not in AGENT_PROMPTS:
+        return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
+
+    try:
+        history, summary = resolve_history(data)
+    except InvalidHistory as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /ask/stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    messages, context = build_messages(agent_id, history, summary)
+    return sse_response(stream_completion(messages, context=context, cache=cache_plan(agent_id, messages, history)))
+
+# Turno completo em uma única requisição: grava a mensagem do usuário, gera a resposta
+# e grava a resposta do agente, com as escritas no armazenamento feitas em segundo plano.
+@app.route('/turn', methods=['POST'])
+@idempotent
+def chat_turn():
+    data = request.get_json()
+    conversation_id = data.get('conversation_id')
+    agent_id = data.get('agent_id')
+    content = data.get('content')
+    stream = data.get('stream', False)
+
+    if not all([conversation_id, agent_id, content]):
+        return jsonify({"error": "conversation_id, agent_id e content são obrigatórios"}), 400
+    if not isinstance(content, str):
+        return jsonify({"error": "content deve ser um texto"}), 400
+    if agent_id not in AGENT_PROMPTS:
+        return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
+
+    try:
+        if not conversation_exists(conversation_id):
+            return jsonify({"error": "Conversa não encontrada"}), 404
+        # O histórico é lido antes de agendar a gravação para não duplicar a mensagem nova
+        summary, summarized_until = summarizer.get_summary(conversation_id)
+        history = load_history(conversation_id, data.get('history_hash'), summarized_until)
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /turn: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    # Reexecução de um turno interrompido (mesma Idempotency-Key): a pergunta já pode estar no histórico
+    user_message_id = idempotent_message_id(conversation_id, 'user')
+    persist_message_async(conversation_id, content, 'user', user_message_id)
+    if not (user_message_id and history and history[-1] == {"role": "user", "content": content}):
+        history.append({"role": "user", "content": content})
+    messages, context = build_messages(agent_id, history, summary)
+    reply_message_id = idempotent_message_id(conversation_id, 'assistant')
+
+    def persist_reply(ai_response):
+        persist_message_async(conversation_id, ai_response, 'assistant', reply_message_id)
+
+    cache = cache_plan(agent_id, messages, history)
+    if stream:
+        return sse_response(stream_completion(messages, on_complete=persist_reply, context=context, cache=cache))
+
+    try:
+        ai_response = create_completion(messages, cache)
+    except Exception as e:
+        print(f"!!! Erro ao chamar a API da OpenAI em /turn: {e}")
+        return jsonify({"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"}), 500
+
+    persist_reply(ai_response)
+    return jsonify({"response": ai_response, "conversation_id": conversation_id, "context": context})
+
+# --- Conselho: a mesma pergunta para vários agentes em paralelo ---
+# O pool é compartilhado por todas as requisições do worker e limita as chamadas simultâneas à OpenAI.
+COUNCIL_MAX_CONCURRENCY = int(os.getenv("COUNCIL_MAX_CONCURRENCY", 8))
+council_executor = ThreadPoolExecutor(max_workers=COUNCIL_MAX_CONCURRENCY, thread_name_prefix="council")
+# Contadores do pool para o /stats (o executor não expõe o tamanho da fila)
+council_counts = {"submitted": 0, "started": 0, "completed": 0, "cancelled": 0}
+council_counts_lock = threading.Lock()
+
+
+def count_council(key):
+    with council_counts_lock:
+        council_counts[key] += 1
+
+
+def council_done(future):
+    count_council("cancelled" if future.cancelled() else "completed")
+
+
+def ask_council_member(agent_id, history):
+    count_council("started")
+    messages, context = build_messages(agent_id, history)
+    return create_completion(messages, cache_plan(agent_id, messages, history)), context
+
+
+def council_events(agent_ids, history):
+    """Gera um evento SSE 'agent' (ou 'agent_error') por agente, na ordem em que cada um termina."""
+    futures = {}
+    for agent_id in agent_ids:
+        count_council("submitted")
+        future = council_executor.submit(ask_council_member, agent_id, history)
+        future.add_done_callback(council_done)
+        futures[future] = agent_id
+    errors = 0
+    try:
+        for future in as_completed(futures):
+            agent_id = futures[future]
+            try:
+                ai_response, context = future.result()
+                yield sse_event("agent", {"agent_id": agent_id, "response": ai_response, "context": context})
+            except Exception as e:
+                errors += 1
+                print(f"!!! Erro ao consultar o agente {agent_id} no conselho: {e}")
+                yield sse_event("agent_error", {"agent_id": agent_id, "error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"})
+        yield sse_event("done", {"agents": len(futures), "errors": errors})
+    finally:
+        # Cliente desconectou: os agentes que ainda não começaram não chegam a chamar a OpenAI
+        for future in futures:
+            future.cancel()
+
+
+def council_stats():
+    with council_counts_lock:
+        counts = dict(council_counts)
+    return {
+        "max_concurrency": COUNCIL_MAX_CONCURRENCY,
+        "queued": counts["submitted"] - counts["started"] - counts["cancelled"],
+        "running": counts["started"] - counts["completed"],
+        **counts
+    }
+
+
+@app.route('/council', methods=['POST'])
+def ask_council():
+    data = request.get_json()
+    message = data.get('message')
+    agent_ids = list(dict.fromkeys(data.get('agent_ids') or []))
+
+    if not message or not agent_ids:
+        return jsonify({"error": "message e agent_ids são obrigatórios"}), 400
+    invalid = [agent_id for agent_id in agent_ids if agent_id not in AGENT_PROMPTS]
+    if invalid:
+        return jsonify({"error": f"Agent IDs inválidos: {', '.join(map(str, invalid))}"}), 400
+    try:
+        history = validate_history(data.get('history', []) + [{"role": "user", "content": message}])
+    except (InvalidHistory, TypeError):
+        return jsonify({"error": "history deve ser uma lista de {role, content} e message, um texto"}), 400
+    return sse_response(council_events(agent_ids, history))
+
+# ===================================================================
+# == LOTES DE PERGUNTAS (JOBS INTERNOS): /ask/batch                ==
+# ===================================================================
+# Pool próprio, separado do /council, para que os lotes noturnos não disputem vagas com usuários.
+# As rotas de lote exigem `Authorization: Bearer <BATCH_TOKEN>`; sem o token configurado, ficam desligadas.
+BATCH_TOKEN = os.getenv("BATCH_TOKEN")
+BATCH_MAX_SYNC_ITEMS = int(os.getenv("BATCH_MAX_SYNC_ITEMS", 50))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 5000))
+
+
+def has_bearer_token(token):
+    """Verdadeiro se a requisição traz `Authorization: Bearer <token>` (sempre falso sem token configurado)."""
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(authorization.encode('utf-8'), f"Bearer {token}".encode('utf-8'))
+
+
+def requires_batch_token(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not has_bearer_token(BATCH_TOKEN):
+            return jsonify({"error": "As rotas de lote exigem o token BATCH_TOKEN"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def run_batch_item(item):
+    """Executa um item do lote ({agent_id, history}) como um /ask e devolve {response, context}."""
+    agent_id = item.get('agent_id')
+    if not agent_id or agent_id not in AGENT_PROMPTS:
+        raise ValueError("Agent ID é inválido ou não foi fornecido.")
+    history = validate_history(item.get('history', []))
+    messages, context = build_messages(agent_id, history)
+    return {"response": create_completion(messages, cache_plan(agent_id, messages, history)), "context": context}
+
+
+batch_runner = BatchRunner(
+    run_batch_item,
+    jobs_dir=os.getenv("BATCH_JOBS_DIR", "batch_jobs"),
+    max_workers=int(os.getenv("BATCH_MAX_WORKERS", 8)),
+    job_ttl=int(os.getenv("BATCH_JOB_TTL", 86400)),
+    heartbeat_timeout=int(os.getenv("BATCH_HEARTBEAT_TIMEOUT", 30))
+)
+
+
+@app.route('/ask/batch', methods=['POST'])
+@requires_batch_token
+def ask_batch():
+    data = request.get_json()
+    items = data.get('items')
+    run_async = data.get('async', False)
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items deve ser uma lista não vazia de {agent_id, history}"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"O lote aceita no máximo {BATCH_MAX_ITEMS} itens"}), 400
+    if not run_async and len(items) > BATCH_MAX_SYNC_ITEMS:
+        return jsonify({"error": f"Lotes com mais de {BATCH_MAX_SYNC_ITEMS} itens devem usar \"async\": true"}), 400
+
+    if not run_async:
+        results = batch_runner.run(items)
+        return jsonify({"results": results, "failed": sum(1 for result in results if "error" in result)})
+
+    try:
+        job_id = batch_runner.submit_job(items)
+    except OSError as e:
+        print(f"!!! Erro ao criar job de lote: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "job_id": job_id,
+        "total": len(items),
+        "status_url": f"/ask/batch/{job_id}",
+        "results_url": f"/ask/batch/{job_id}/results"
+    }), 202
+
+
+@app.route('/ask/batch/<job_id>', methods=['GET'])
+@requires_batch_token
+def ask_batch_status(job_id):
+    status = batch_runner.job_status(job_id)
+    if status is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(status)
+
+
+# Resultados em NDJSON (um JSON por linha), enviados conforme os itens terminam
+@app.route('/ask/batch/<job_id>/results', methods=['GET'])
+@requires_batch_token
+def ask_batch_results(job_id):
+    # Devolve só o que já foi gravado: o cliente repete com ?offset=<X-Next-Offset> até X-Results-Complete
+    try:
+        offset = int(request.args.get('offset', '0'))
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        return jsonify({"error": "offset deve ser um inteiro >= 0"}), 400
+    result = batch_runner.read_results(job_id, offset)
+    if result is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    lines, next_offset, status, finished = result
+    return Response(lines, mimetype='application/x-ndjson', headers={
+        "Cache-Control": "no-store",
+        "X-Next-Offset": str(next_offset),
+        "X-Job-Status": status,
+        "X-Results-Complete": "true" if finished else "false"
+    })
+
 # ===================================================================
 # == ROTAS PARA GERENCIAR O HISTÓRICO NO SUPABASE                ==
 # ===================================================================
@@ -88,31 +861,88 @@ def get_or_create_conversation():
         return jsonify({"error": "user_id e agent_id são obrigatórios"}), 400
 
     try:
-        response = supabase.table('conversations').select('id').eq('user_id', user_id).eq('agent_id', agent_id).execute()
-        
-        conversation_id = None
-        if response.data:
-            conversation_id = response.data[0]['id']
-        else:
-            insert_response = supabase.table('conversations').insert({'user_id': user_id, 'agent_id': agent_id}).execute()
-            if insert_response.data:
-                conversation_id = insert_response.data[0]['id']
-            else:
-                return jsonify({"error": "Falha ao criar a conversa no Supabase"}), 500
+        conversation_id = resolve_conversation_id(user_id, agent_id)
+        if not conversation_id:
+            return jsonify({"error": "Falha ao criar a conversa"}), 500
 
-        messages_response = supabase.table('messages').select('content, role, created_at').eq('conversation_id', conversation_id).order('created_at', desc=False).execute()
+        # Cliente já tem uma versão: se nada mudou, basta um 304 (consulta de uma linha)
+        if request.if_none_match:
+            etag = conversation_etag(conversation_id, latest_sync_cursor(conversation_id))
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
 
-        return jsonify({
+        # Sincronização incremental: apenas as mensagens gravadas depois do cursor `since`
+        since = data.get('since')
+        messages = None
+        if since:
+            try:
+                messages, has_more = fetch_messages_since(conversation_id, since)
+            except (ValueError, UnicodeDecodeError):
+                # Cursor de uma versão anterior (created_at|id): o cliente recebe a página mais recente
+                has_more = True
+            if has_more:
+                messages = None
+
+        if messages is None:
+            # Apenas a página mais recente; as anteriores vêm de /conversation/<id>/messages sob demanda
+            since = None
+            messages, next_cursor = fetch_messages_page(conversation_id)
+            history_store.set(conversation_id, messages)
+            latest_cursor = encode_sync_cursor(max((row['seq'] for row in messages if row.get('seq') is not None), default=None))
+        else:
+            next_cursor = None
+            latest_cursor = encode_sync_cursor(messages[-1]['seq']) if messages else since
+        response = jsonify({
             "success": True,
             "conversation_id": conversation_id,
-            "messages": messages_response.data
+            "messages": messages,
+            "next_cursor": next_cursor,
+            "latest_cursor": latest_cursor,
+            # False: `messages` contém só as novidades e deve ser anexado ao que o cliente já tem
+            "full": since is None
         })
+        response.set_etag(conversation_etag(conversation_id, latest_cursor))
+        return response
 
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Cursor inválido"}), 400
     except Exception as e:
         print(f"!!! Erro em /conversation: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Páginas mais antigas do histórico, carregadas quando o usuário rola para cima
+@app.route('/conversation/<conversation_id>/messages', methods=['GET'])
+def list_messages(conversation_id):
+    before = request.args.get('before')
+    since = request.args.get('since')
+    try:
+        limit = max(min(int(request.args.get('limit', MESSAGES_PAGE_SIZE)), MESSAGES_MAX_PAGE_SIZE), 1)
+    except ValueError:
+        return jsonify({"error": "limit deve ser um número inteiro"}), 400
+
+    try:
+        etag = conversation_etag(conversation_id, latest_sync_cursor(conversation_id), before, since, limit)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        if since:
+            messages, has_more = fetch_messages_since(conversation_id, since, limit=limit)
+            latest_cursor = encode_sync_cursor(messages[-1]['seq']) if messages else since
+            response = jsonify({"success": True, "messages": messages, "latest_cursor": latest_cursor, "has_more": has_more})
+        else:
+            messages, next_cursor = fetch_messages_page(conversation_id, before=before, limit=limit)
+            response = jsonify({"success": True, "messages": messages, "next_cursor": next_cursor})
+        response.set_etag(etag)
+        return response
+
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Cursor inválido"}), 400
+    except Exception as e:
+        print(f"!!! Erro em /conversation/{conversation_id}/messages: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/message', methods=['POST'])
+@idempotent
 def add_message():
     data = request.get_json()
     conversation_id = data.get('conversation_id')
@@ -121,13 +951,16 @@ def add_message():
 
     if not all([conversation_id, content, role]):
         return jsonify({"error": "conversation_id, content, e role são obrigatórios"}), 400
+    if not isinstance(content, str) or not isinstance(role, str):
+        return jsonify({"error": "content e role devem ser textos"}), 400
 
     try:
-        response = supabase.table('messages').insert({'conversation_id': conversation_id, 'content': content, 'role': role}).execute()
-        if response.data:
-            return jsonify({"success": True, "message": "Mensagem salva com sucesso"})
-        else:
-            return jsonify({"success": False, "error": "Falha ao salvar a mensagem"}), 500
+        # A mensagem só entra no spool se puder ser gravada: uma linha inválida travaria a fila
+        if not conversation_exists(conversation_id):
+            return jsonify({"error": "Conversa não encontrada"}), 404
+        # Confirmada após a gravação no spool local; o insert sai no próximo lote
+        persist_message_async(conversation_id, content, role)
+        return jsonify({"success": True, "message": "Mensagem salva com sucesso"})
 
     except Exception as e:
         print(f"!!! Erro em /message: {e}")
@@ -140,14 +973,110 @@ def delete_conversation_history(conversation_id):
         return jsonify({"error": "ID da conversa é obrigatório"}), 400
 
     try:
-        response = supabase.table('messages').delete().eq('conversation_id', conversation_id).execute()
-        print(f">>> Histórico da conversa {conversation_id} limpo. Mensagens removidas: {len(response.data)}")
+        # Mensagens ainda na fila não podem ressuscitar depois da limpeza
+        message_queue.discard(lambda row: row['conversation_id'] == conversation_id)
+        removed = storage.delete_messages(conversation_id)
+        history_store.set(conversation_id, [])
+        summarizer.reset(conversation_id)
+        forget_conversation(conversation_id)
+        print(f">>> Histórico da conversa {conversation_id} limpo. Mensagens removidas: {removed}")
         return jsonify({"success": True, "message": "Histórico limpo com sucesso."}), 200
 
     except Exception as e:
         print(f"!!! Erro ao deletar histórico da conversa {conversation_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ===================================================================
+# == EXPORTAÇÃO DAS CONVERSAS (NDJSON)                             ==
+# ===================================================================
+# As conversas e mensagens saem em streaming, página por página (ver export.py): a memória usada não
+# depende do tamanho da exportação. A exportação de um usuário exige o access token do Supabase Auth desse
+# usuário (conferido com SUPABASE_JWT_SECRET); a de outro usuário ou de todos exige EXPORT_ADMIN_TOKEN.
+EXPORT_ADMIN_TOKEN = os.getenv("EXPORT_ADMIN_TOKEN")
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 500))
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+
+def is_export_admin():
+    return has_bearer_token(EXPORT_ADMIN_TOKEN)
+
+
+def authenticated_user_id():
+    """`sub` do access token em `Authorization: Bearer <token>`, ou None se não houver token válido."""
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+    try:
+        return token_subject(authorization[len('Bearer '):], SUPABASE_JWT_SECRET)
+    except InvalidToken:
+        return None
+
+
+def attachment_header(filename):
+    """Content-Disposition com um nome ASCII seguro e o nome original em `filename*` (RFC 5987)."""
+    fallback = secure_filename(filename) or "export.ndjson"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+@app.route('/export', methods=['GET'])
+def export_conversations():
+    user_id = request.args.get('user_id')
+    if not is_export_admin():
+        if not user_id:
+            return jsonify({"error": "user_id é obrigatório (a exportação completa exige o token de administrador)"}), 403
+        authenticated = authenticated_user_id()
+        if authenticated is None:
+            return jsonify({"error": "A exportação exige o access token do usuário (Authorization: Bearer)"}), 401
+        if authenticated != user_id:
+            return jsonify({"error": "O token não pertence a este user_id"}), 403
+
+    # Retomada: o cursor do último registro "checkpoint" recebido, válido só para o mesmo user_id
+    cursor = request.args.get('cursor')
+    try:
+        if cursor:
+            check_export_cursor(storage, cursor, user_id)
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Cursor inválido para esta exportação"}), 400
+
+    body = ndjson_batches(iter_export(storage, user_id, cursor, EXPORT_PAGE_SIZE))
+    headers = {
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": attachment_header(f"export-{user_id or 'all'}.ndjson")
+    }
+    if 'gzip' in request.accept_encodings:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype='application/x-ndjson', headers=headers)
+
+# ===================================================================
+# == SAUDAÇÕES INICIAIS DOS AGENTES                                ==
+# ===================================================================
+# Texto fixo extraído dos prompts a cada versão: a primeira tela de um chat vazio não chama a OpenAI.
+GREETINGS_MAX_AGE = int(os.getenv("GREETINGS_MAX_AGE", 3600))
+
+
+def greetings_payload(prompts):
+    """Corpo JSON e ETag da rota /greetings, montados uma vez por versão dos prompts."""
+    body = json.dumps({"greetings": extract_greetings(prompts)}, ensure_ascii=False, sort_keys=True)
+    return body, hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+
+
+prompt_registry.add_deriver("greetings_payload", greetings_payload)
+
+
+@app.route('/greetings', methods=['GET'])
+def agent_greetings():
+    body, etag = prompt_registry.current.derived["greetings_payload"]
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = GREETINGS_MAX_AGE
+    return response
+
 # ===================================================================
 # == ROTAS DE SERVIÇO E INICIALIZAÇÃO                            ==
 # ===================================================================
@@ -155,6 +1084,27 @@ def delete_conversation_history(conversation_id):
 def home():
     return send_file('index.html')
 
+# Métricas internas dos caches deste worker
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "single_flight": completion_flight.stats(),
+        "http_pool": pool_stats(http_transport),
+        "history_store": history_store.stats(),
+        "conversation_ids": conversation_ids.stats(),
+        "storage": storage.stats(),
+        "write_behind": message_queue.stats(),
+        "idempotency": idempotency_store.stats(),
+        "council": council_stats(),
+        "batch": batch_runner.stats(),
+        "prompts": prompt_registry.stats(),
+        "persona_index": prompt_registry.current.derived["persona_index"].stats() if "persona_index" in prompt_registry.current.derived else None
+    })
+
 if __name__ == '__main__':
+    message_queue.start()
+    prompt_registry.start_watching()
     app.run(debug=True, port=5001, host='0.0.0.0')
 
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == ARQUIVAMENTO DAS MENSAGENS ANTIGAS                            ==
+# ===================================================================
+# Move as mensagens mais antigas que ARCHIVE_AFTER_DAYS dias da camada quente (Supabase/SQLite) para
+# segmentos comprimidos em ARCHIVE_DIR. O histórico continua completo para o usuário: o app lê as
+# páginas arquivadas sob demanda. Pode rodar com o app no ar (ex.: cron diário) e ser repetido.
+#
+# Uso:
+#   python archive_messages.py                          # todas as conversas
+#   python archive_messages.py --days 30                # mensagens com mais de 30 dias
+#   python archive_messages.py --conversation <id>      # uma única conversa
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+from storage import create_storage, MessageArchive
+from storage.archive import archive_cutoff, archive_conversation, archive_old_messages
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Arquiva as mensagens antigas em segmentos comprimidos")
+    parser.add_argument("--days", type=float, default=float(os.getenv("ARCHIVE_AFTER_DAYS", 90)))
+    parser.add_argument("--block-size", type=int, default=int(os.getenv("ARCHIVE_BLOCK_SIZE", 200)),
+                        help="mensagens por bloco comprimido (unidade de leitura do arquivo)")
+    parser.add_argument("--conversation", help="arquiva só esta conversa")
+    args = parser.parse_args()
+
+    archive_dir = os.getenv("ARCHIVE_DIR")
+    if not archive_dir:
+        raise SystemExit("!!! Erro: defina ARCHIVE_DIR (o mesmo diretório lido pelo app).")
+
+    hot = create_storage(archived=False)
+    archive = MessageArchive(archive_dir)
+    cutoff = archive_cutoff(args.days)
+    print(f">>> Arquivando mensagens anteriores a {cutoff} em {archive_dir}...")
+
+    started = time.perf_counter()
+    try:
+        if args.conversation:
+            messages = archive_conversation(hot, archive, args.conversation, cutoff, args.block_size)
+            conversations = 1 if messages else 0
+        else:
+            conversations, messages = archive_old_messages(hot, archive, cutoff, args.block_size)
+    finally:
+        archive.close()
+    print(f">>> {messages} mensagem(ns) de {conversations} conversa(s) arquivada(s) em {time.perf_counter() - started:.1f}s.")
+    print(f">>> Arquivo: {archive.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == MODO ASSÍNCRONO (ASGI) DO APP                                 ==
+# ===================================================================
+# As rotas do chat servidas em asyncio: a chamada à OpenAI (AsyncOpenAI) e as leituras do armazenamento
+# (cliente assíncrono do Supabase, ver storage/async_storage.py) esperam sem ocupar um worker, e um único
+# processo sustenta centenas de conversas simultâneas. O app.py (WSGI, com o Gunicorn) continua disponível
+# para comparação.
+# Configuração e estado vêm do próprio app.py (storage, fila write-behind, resumo, caches, prompts), então
+# os dois modos gravam e leem da mesma forma.
+# Fora deste modo (só no app.py): /council, /ask/batch, /export, o replay de Idempotency-Key e o
+# agrupamento de chamadas idênticas (single-flight).
+# Execução: hypercorn asgi_app:app --bind 0.0.0.0:5000
+import os
+import asyncio
+import uuid
+from quart import Quart, request, jsonify, Response, send_file
+from quart_cors import cors
+from openai import AsyncOpenAI
+from transport import build_transport, build_http_client, pool_stats
+from history_store import recent_messages
+from prompt_window import (
+    InvalidHistory, validate_history,
+    OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE
+)
+from storage.async_storage import create_async_storage
+
+import app as wsgi
+from app import AGENT_PROMPTS, prompt_registry, sse_event, conversation_etag
+
+# Pool HTTP assíncrono, compartilhado pela OpenAI e pelo Supabase
+transport_config = wsgi.transport_config
+http_transport = build_transport(transport_config, asynchronous=True)
+
+client = AsyncOpenAI(
+    api_key=wsgi.openai_api_key,
+    http_client=build_http_client(http_transport, transport_config),
+    timeout=transport_config.timeout
+)
+
+# Criado em start_background_tasks, dentro do loop de eventos
+storage = None
+
+# --- Configuração do Servidor Quart ---
+app = Quart(__name__)
+app = cors(
+    app,
+    allow_origin="*",
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match", "Idempotency-Key"],
+    expose_headers=["ETag"]
+)
+
+
+async def warm_connections():
+    for name, warm in (("Armazenamento", storage.ping), ("OpenAI", client.models.list)):
+        try:
+            await warm()
+        except Exception as e:
+            print(f"!!! Falha ao aquecer conexões ({name}): {e}")
+
+
+async def keep_connections_warm():
+    while True:
+        await asyncio.sleep(transport_config.keepwarm_interval)
+        await warm_connections()
+
+
+@app.before_serving
+async def start_background_tasks():
+    global storage
+    storage = await create_async_storage(wsgi.storage, http_transport, transport_config)
+    print(f">>> Armazenamento assíncrono: {storage.name}")
+    await warm_connections()
+    # Recupera spools de workers anteriores e inicia o flusher das mensagens
+    wsgi.message_queue.start()
+    prompt_registry.start_watching()
+    if transport_config.keepwarm_interval > 0:
+        app.add_background_task(keep_connections_warm)
+
+
+@app.after_serving
+async def flush_messages():
+    # Envia o que ainda está na fila antes de encerrar; o que falhar fica no spool para o próximo processo
+    await asyncio.to_thread(wsgi.message_queue.flush)
+
+
+def not_modified(etag):
+    response = Response("", status=304)
+    response.set_etag(etag)
+    return response
+
+# ===================================================================
+# == HISTÓRICO E CONVERSAS (versões assíncronas das do app.py)     ==
+# ===================================================================
+async def fetch_messages_page(conversation_id, before=None, limit=wsgi.MESSAGES_PAGE_SIZE):
+    rows = await storage.messages_before(conversation_id, wsgi.decode_cursor(before) if before else None, limit + 1)
+
+    next_cursor = wsgi.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return list(reversed(rows[:limit])), next_cursor
+
+
+async def fetch_messages_since(conversation_id, since, limit=wsgi.MESSAGES_MAX_PAGE_SIZE):
+    rows = await storage.messages_since(conversation_id, wsgi.decode_sync_cursor(since), limit + 1)
+    return rows[:limit], len(rows) > limit
+
+
+async def latest_sync_cursor(conversation_id):
+    return wsgi.encode_sync_cursor(await storage.latest_seq(conversation_id))
+
+
+async def load_history(conversation_id, client_hash=None, summarized_until=None):
+    history = wsgi.history_store.get(conversation_id, summarized_until, client_hash)
+    if history is None:
+        rows, _ = await fetch_messages_page(conversation_id, limit=wsgi.HISTORY_TAIL)
+        wsgi.history_store.set(conversation_id, rows)
+        history = recent_messages(rows, summarized_until)
+    return history
+
+
+async def resolve_conversation_id(user_id, agent_id):
+    key = (user_id, agent_id)
+    conversation_id = wsgi.conversation_ids.get(key)
+    if conversation_id:
+        return conversation_id
+
+    row = await storage.upsert_conversation(user_id, agent_id)
+    if not row:
+        return None
+    wsgi.summarizer.remember(row['id'], row.get('summary'), row.get('summarized_count'))
+    wsgi.conversation_ids.set(key, row['id'])
+    wsgi.conversation_owners.set(row['id'], key)
+    return row['id']
+
+
+async def conversation_exists(conversation_id):
+    try:
+        uuid.UUID(str(conversation_id))
+    except ValueError:
+        return False
+    if wsgi.conversation_owners.get(conversation_id):
+        return True
+    row = await storage.get_conversation(conversation_id)
+    if not row:
+        return False
+    wsgi.conversation_owners.set(row['id'], (row['user_id'], row['agent_id']))
+    return True
+
+
+async def get_summary(conversation_id):
+    # Acerto no cache do resumo na maioria dos turnos (preenchido por /conversation); em cache miss, a
+    # consulta sai pelo backend síncrono, em uma thread
+    return await asyncio.to_thread(wsgi.summarizer.get_summary, conversation_id)
+
+
+async def persist_message(conversation_id, content, role, message_id=None):
+    # Gravação no spool local (com fsync): fora do loop de eventos
+    await asyncio.to_thread(wsgi.persist_message_async, conversation_id, content, role, message_id)
+
+
+async def resolve_history(data):
+    """Versão assíncrona do resolve_history do app.py: retorna (histórico, resumo)."""
+    conversation_id = data.get('conversation_id')
+    if conversation_id and 'history' not in data:
+        message = data.get('message')
+        if message is not None and not isinstance(message, str):
+            raise InvalidHistory("message deve ser um texto")
+        summary, summarized_until = await get_summary(conversation_id)
+        history = await load_history(conversation_id, data.get('history_hash'), summarized_until)
+        if message:
+            history = history + [{"role": "user", "content": message}]
+        return history, summary
+    return validate_history(data.get('history', [])), None
+
+
+def idempotent_message_id(conversation_id, role):
+    """Mesmos ids do app.py: reexecutar um turno com a mesma Idempotency-Key não duplica as mensagens."""
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{request.path}\x1f{conversation_id}\x1f{key}\x1f{role}"))
+
+# ===================================================================
+# == COMPLETIONS                                                   ==
+# ===================================================================
+async def create_completion(messages, cache=None):
+    # O cache semântico pode chamar o embedder da OpenAI (síncrono): consulta e gravação em uma thread
+    cached = await asyncio.to_thread(wsgi.cache_lookup, cache)
+    if cached is not None:
+        return cached
+
+    completion = await client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        max_tokens=OPENAI_MAX_TOKENS,
+        temperature=OPENAI_TEMPERATURE
+    )
+    ai_response = completion.choices[0].message.content
+    await asyncio.to_thread(wsgi.cache_store, cache, ai_response)
+    return ai_response
+
+
+async def stream_completion(messages, on_complete=None, context=None, cache=None):
+    """Mesmos eventos SSE do stream_completion do app.py ('token', 'done' com o uso de tokens, 'error')."""
+    parts = []
+    usage = None
+    try:
+        cached = await asyncio.to_thread(wsgi.cache_lookup, cache)
+        if cached is not None:
+            yield sse_event("token", {"delta": cached})
+            if on_complete:
+                await on_complete(cached)
+            yield sse_event("done", {"response": cached, "usage": None, "context": context, "cached": True})
+            return
+
+        stream = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            max_tokens=OPENAI_MAX_TOKENS,
+            temperature=OPENAI_TEMPERATURE,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage.model_dump()
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield sse_event("token", {"delta": delta})
+
+        ai_response = "".join(parts)
+        await asyncio.to_thread(wsgi.cache_store, cache, ai_response)
+        if on_complete:
+            await on_complete(ai_response)
+        yield sse_event("done", {"response": ai_response, "usage": usage, "context": context})
+
+    except Exception as e:
+        print(f"!!! Erro no streaming da API da OpenAI: {e}")
+        yield sse_event("error", {"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"})
+
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# ===================================================================
+# == ROTA PRINCIPAL DA IA: /ask                                  ==
+# ===================================================================
+@app.route('/ask', methods=['POST'])
+async def ask_agent():
+    data = await request.get_json()
+    agent_id = data.get('agent_id')
+
+    if not agent_id or agent_id not in AGENT_PROMPTS:
+        return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
+
+    try:
+        history, summary = await resolve_history(data)
+    except InvalidHistory as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /ask: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    messages, context = wsgi.build_messages(agent_id, history, summary)
+
+    try:
+        ai_response = await create_completion(messages, wsgi.cache_plan(agent_id, messages, history))
+        return jsonify({"response": ai_response, "context": context})
+
+    except Exception as e:
+        print(f"!!! Erro ao chamar a API da OpenAI: {e}")
+        return jsonify({"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"}), 500
+
+
+@app.route('/ask/stream', methods=['POST'])
+async def ask_agent_stream():
+    data = await request.get_json()
+    agent_id = data.get('agent_id')
+
+    if not agent_id or agent_id not in AGENT_PROMPTS:
+        return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
+
+    try:
+        history, summary = await resolve_history(data)
+    except InvalidHistory as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /ask/stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    messages, context = wsgi.build_messages(agent_id, history, summary)
+    return sse_response(stream_completion(messages, context=context, cache=wsgi.cache_plan(agent_id, messages, history)))
+
+# Turno completo (usado pelo index.html): grava a pergunta, gera a resposta e grava a resposta.
+# A Idempotency-Key só deriva os ids das mensagens; a resposta original não é guardada para replay.
+@app.route('/turn', methods=['POST'])
+async def chat_turn():
+    data = await request.get_json()
+    conversation_id = data.get('conversation_id')
+    agent_id = data.get('agent_id')
+    content = data.get('content')
+    stream = data.get('stream', False)
+
+    if not all([conversation_id, agent_id, content]):
+        return jsonify({"error": "conversation_id, agent_id e content são obrigatórios"}), 400
+    if not isinstance(content, str):
+        return jsonify({"error": "content deve ser um texto"}), 400
+    if agent_id not in AGENT_PROMPTS:
+        return jsonify({"error": "Agent ID é inválido ou não foi fornecido."}), 400
+
+    try:
+        if not await conversation_exists(conversation_id):
+            return jsonify({"error": "Conversa não encontrada"}), 404
+        summary, summarized_until = await get_summary(conversation_id)
+        history = await load_history(conversation_id, data.get('history_hash'), summarized_until)
+    except Exception as e:
+        print(f"!!! Erro ao carregar histórico em /turn: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    user_message_id = idempotent_message_id(conversation_id, 'user')
+    await persist_message(conversation_id, content, 'user', user_message_id)
+    if not (user_message_id and history and history[-1] == {"role": "user", "content": content}):
+        history.append({"role": "user", "content": content})
+    messages, context = wsgi.build_messages(agent_id, history, summary)
+    reply_message_id = idempotent_message_id(conversation_id, 'assistant')
+
+    async def persist_reply(ai_response):
+        await persist_message(conversation_id, ai_response, 'assistant', reply_message_id)
+
+    cache = wsgi.cache_plan(agent_id, messages, history)
+    if stream:
+        return sse_response(stream_completion(messages, on_complete=persist_reply, context=context, cache=cache))
+
+    try:
+        ai_response = await create_completion(messages, cache)
+    except Exception as e:
+        print(f"!!! Erro ao chamar a API da OpenAI em /turn: {e}")
+        return jsonify({"error": f"Desculpe, não consegui processar sua solicitação. Detalhe: {str(e)}"}), 500
+
+    await persist_reply(ai_response)
+    return jsonify({"response": ai_response, "conversation_id": conversation_id, "context": context})
+
+# ===================================================================
+# == ROTAS PARA GERENCIAR O HISTÓRICO                              ==
+# ===================================================================
+@app.route('/conversation', methods=['POST'])
+async def get_or_create_conversation():
+    data = await request.get_json()
+    user_id = data.get('user_id')
+    agent_id = data.get('agent_id')
+
+    if not user_id or not agent_id:
+        return jsonify({"error": "user_id e agent_id são obrigatórios"}), 400
+
+    try:
+        conversation_id = await resolve_conversation_id(user_id, agent_id)
+        if not conversation_id:
+            return jsonify({"error": "Falha ao criar a conversa"}), 500
+
+        if request.if_none_match:
+            etag = conversation_etag(conversation_id, await latest_sync_cursor(conversation_id))
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
+
+        since = data.get('since')
+        messages = None
+        if since:
+            try:
+                messages, has_more = await fetch_messages_since(conversation_id, since)
+            except (ValueError, UnicodeDecodeError):
+                has_more = True
+            if has_more:
+                messages = None
+
+        if messages is None:
+            since = None
+            messages, next_cursor = await fetch_messages_page(conversation_id)
+            wsgi.history_store.set(conversation_id, messages)
+            latest_cursor = wsgi.encode_sync_cursor(max((row['seq'] for row in messages if row.get('seq') is not None), default=None))
+        else:
+            next_cursor = None
+            latest_cursor = wsgi.encode_sync_cursor(messages[-1]['seq']) if messages else since
+        response = jsonify({
+            "success": True,
+            "conversation_id": conversation_id,
+            "messages": messages,
+            "next_cursor": next_cursor,
+            "latest_cursor": latest_cursor,
+            "full": since is None
+        })
+        response.set_etag(conversation_etag(conversation_id, latest_cursor))
+        return response
+
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Cursor inválido"}), 400
+    except Exception as e:
+        print(f"!!! Erro em /conversation: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/conversation/<conversation_id>/messages', methods=['GET'])
+async def list_messages(conversation_id):
+    before = request.args.get('before')
+    since = request.args.get('since')
+    try:
+        limit = max(min(int(request.args.get('limit', wsgi.MESSAGES_PAGE_SIZE)), wsgi.MESSAGES_MAX_PAGE_SIZE), 1)
+    except ValueError:
+        return jsonify({"error": "limit deve ser um número inteiro"}), 400
+
+    try:
+        etag = conversation_etag(conversation_id, await latest_sync_cursor(conversation_id), before, since, limit)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+
+        if since:
+            messages, has_more = await fetch_messages_since(conversation_id, since, limit=limit)
+            latest_cursor = wsgi.encode_sync_cursor(messages[-1]['seq']) if messages else since
+            response = jsonify({"success": True, "messages": messages, "latest_cursor": latest_cursor, "has_more": has_more})
+        else:
+            messages, next_cursor = await fetch_messages_page(conversation_id, before=before, limit=limit)
+            response = jsonify({"success": True, "messages": messages, "next_cursor": next_cursor})
+        response.set_etag(etag)
+        return response
+
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({"error": "Cursor inválido"}), 400
+    except Exception as e:
+        print(f"!!! Erro em /conversation/{conversation_id}/messages: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/message', methods=['POST'])
+async def add_message():
+    data = await request.get_json()
+    conversation_id = data.get('conversation_id')
+    content = data.get('content')
+    role = data.get('role')
+
+    if not all([conversation_id, content, role]):
+        return jsonify({"error": "conversation_id, content, e role são obrigatórios"}), 400
+    if not isinstance(content, str) or not isinstance(role, str):
+        return jsonify({"error": "content e role devem ser textos"}), 400
+
+    try:
+        if not await conversation_exists(conversation_id):
+            return jsonify({"error": "Conversa não encontrada"}), 404
+        await persist_message(conversation_id, content, role)
+        return jsonify({"success": True, "message": "Mensagem salva com sucesso"})
+
+    except Exception as e:
+        print(f"!!! Erro em /message: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/conversation/<conversation_id>', methods=['DELETE'])
+async def delete_conversation_history(conversation_id):
+    if not conversation_id:
+        return jsonify({"error": "ID da conversa é obrigatório"}), 400
+
+    try:
+        # Mesma ordem do app.py: mensagens ainda na fila não podem ressuscitar depois da limpeza
+        await asyncio.to_thread(wsgi.message_queue.discard, lambda row: row['conversation_id'] == conversation_id)
+        removed = await storage.delete_messages(conversation_id)
+        wsgi.history_store.set(conversation_id, [])
+        await asyncio.to_thread(wsgi.summarizer.reset, conversation_id)
+        wsgi.forget_conversation(conversation_id)
+        print(f">>> Histórico da conversa {conversation_id} limpo. Mensagens removidas: {removed}")
+        return jsonify({"success": True, "message": "Histórico limpo com sucesso."}), 200
+
+    except Exception as e:
+        print(f"!!! Erro ao deletar histórico da conversa {conversation_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ===================================================================
+# == SAUDAÇÕES, PÁGINA E SERVIÇO                                   ==
+# ===================================================================
+@app.route('/greetings', methods=['GET'])
+async def agent_greetings():
+    body, etag = prompt_registry.current.derived["greetings_payload"]
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = wsgi.GREETINGS_MAX_AGE
+    return response
+
+
+@app.route('/')
+async def home():
+    return await send_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html'))
+
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    return jsonify({
+        "storage": storage.name if storage is not None else None,
+        "http_pool": pool_stats(http_transport),
+        "response_cache": wsgi.response_cache.stats(),
+        "semantic_cache": wsgi.semantic_cache.stats() if wsgi.semantic_cache is not None else None,
+        "history_store": wsgi.history_store.stats(),
+        "conversation_ids": wsgi.conversation_ids.stats(),
+        "write_behind": wsgi.message_queue.stats(),
+        "prompts": prompt_registry.stats()
+    })
+
+if __name__ == '__main__':
+    app.run(debug=True, port=5001, host='0.0.0.0')
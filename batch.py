@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class BatchRunner:
+    """
+    Executa lotes de itens em um pool de threads limitado, com resultado (ou erro) por item.
+
+    - Modo síncrono (`run`): devolve a lista de resultados na ordem dos itens.
+    - Modo job (`submit_job`): devolve um id na hora; cada resultado é anexado, assim que termina,
+      a `<jobs_dir>/<id>.ndjson`, e o estado do job fica em `<id>.json`. Como tudo está em disco,
+      qualquer worker da mesma máquina responde à consulta de estado e aos resultados.
+    - O estado guarda o pid do worker dono do job e um heartbeat renovado a cada `heartbeat_interval`
+      segundos. Se o dono morre (processo inexistente ou heartbeat mais velho que `heartbeat_timeout`),
+      o job passa a constar como "failed" e a leitura dos resultados termina com uma linha de erro.
+    """
+
+    def __init__(self, run_item, jobs_dir, max_workers=8, job_ttl=86400, max_read_bytes=1024 * 1024,
+                 heartbeat_interval=5, heartbeat_timeout=30):
+        self.run_item = run_item
+        self.jobs_dir = jobs_dir
+        self.job_ttl = job_ttl
+        self.max_read_bytes = max_read_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+        self._lock = threading.Lock()
+        self._running_jobs = {}
+        self._heartbeat_thread = None
+        self.items_submitted = 0
+        self.items_started = 0
+        self.items_done = 0
+        self.items_failed = 0
+        self.jobs_started = 0
+
+    def _submit(self, index, item):
+        with self._lock:
+            self.items_submitted += 1
+        return self._executor.submit(self._run_one, index, item)
+
+    def _run_one(self, index, item):
+        with self._lock:
+            self.items_started += 1
+        result = {"index": index, "agent_id": item.get("agent_id") if isinstance(item, dict) else None}
+        try:
+            result.update(self.run_item(item))
+        except Exception as e:
+            result["error"] = str(e)
+        with self._lock:
+            self.items_done += 1
+            if "error" in result:
+                self.items_failed += 1
+        return result
+
+    # --- Modo síncrono ---
+
+    def run(self, items):
+        futures = [self._submit(index, item) for index, item in enumerate(items)]
+        return [future.result() for future in futures]
+
+    # --- Modo job ---
+
+    def _paths(self, job_id):
+        base = os.path.join(self.jobs_dir, job_id)
+        return base + ".json", base + ".ndjson"
+
+    def _write_meta(self, job_id, meta):
+        meta_path, _ = self._paths(job_id)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _read_meta(self, job_id):
+        meta_path, _ = self._paths(job_id)
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _heartbeat(self):
+        """Renova o heartbeat dos jobs em andamento neste worker."""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                for job_id, meta in self._running_jobs.items():
+                    try:
+                        self._write_meta(job_id, dict(meta, heartbeat_at=time.time()))
+                    except OSError as e:
+                        print(f"!!! Erro ao renovar o heartbeat do job {job_id}: {e}")
+
+    def _owner_lost(self, meta):
+        """Verdadeiro se o job ainda consta como em andamento, mas o worker dono morreu."""
+        if meta["status"] != "running":
+            return False
+        if time.time() - meta.get("heartbeat_at", meta["created_at"]) > self.heartbeat_timeout:
+            return True
+        try:
+            os.kill(meta["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except (KeyError, OSError):
+            pass
+        return False
+
+    def _sweep(self):
+        """Apaga arquivos de jobs mais antigos que `job_ttl`."""
+        cutoff = time.time() - self.job_ttl
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def submit_job(self, items):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._sweep()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        meta = {"job_id": job_id, "status": "running", "total": len(items), "created_at": now, "finished_at": None,
+                "pid": os.getpid(), "heartbeat_at": now}
+        _, results_path = self._paths(job_id)
+        results_file = open(results_path, "a", encoding="utf-8")
+        self._write_meta(job_id, meta)
+        with self._lock:
+            self.jobs_started += 1
+            if items:
+                self._running_jobs[job_id] = meta
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="batch-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+
+        def finish():
+            with self._lock:
+                self._running_jobs.pop(job_id, None)
+                self._write_meta(job_id, dict(meta, status="done", finished_at=time.time(), heartbeat_at=time.time()))
+
+        write_lock = threading.Lock()
+        remaining = [len(items)]
+
+        def on_done(future):
+            with write_lock:
+                results_file.write(json.dumps(future.result(), ensure_ascii=False) + "\n")
+                results_file.flush()
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                results_file.close()
+                finish()
+
+        if not items:
+            results_file.close()
+            finish()
+        for index, item in enumerate(items):
+            self._submit(index, item).add_done_callback(on_done)
+        return job_id
+
+    def job_status(self, job_id):
+        """Estado do job (com contagem de itens concluídos e com erro) ou None se não existir."""
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        _, results_path = self._paths(job_id)
+        try:
+            meta = self._read_meta(job_id)
+            completed = failed = 0
+            with open(results_path, encoding="utf-8") as f:
+                for line in f:
+                    # Uma linha ainda sem "\n" está sendo escrita: entra na próxima consulta
+                    if not line.endswith("\n"):
+                        break
+                    completed += 1
+                    if "error" in json.loads(line):
+                        failed += 1
+        except FileNotFoundError:
+            return None
+        if self._owner_lost(meta):
+            meta.update({"status": "failed", "error": "O worker que executava o job parou de responder"})
+        meta.update({"completed": completed, "failed": failed})
+        return meta
+
+    def read_results(self, job_id, offset=0):
+        """
+        Resultados já gravados a partir de `offset` (posição em bytes no arquivo), sem esperar pelos próximos:
+        a requisição nunca fica presa enquanto o job roda. Devolve (linhas NDJSON, próximo offset, estado,
+        terminou) ou None se o job não existir; o cliente repete a leitura com o próximo offset até `terminou`.
+        Se o worker dono do job morreu, o estado é "failed" e a última leitura termina com uma linha
+        {"error": ...} (os itens que faltam não serão executados).
+        """
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        _, results_path = self._paths(job_id)
+        try:
+            # O estado é lido antes dos resultados: "done" só é gravado depois que o arquivo foi fechado
+            meta = self._read_meta(job_id)
+            with open(results_path, "rb") as f:
+                f.seek(offset)
+                chunk = f.read(self.max_read_bytes)
+                if chunk and b"\n" not in chunk:
+                    # Uma linha maior que o limite vai inteira
+                    chunk += f.readline()
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+        status = "failed" if self._owner_lost(meta) else meta["status"]
+
+        # Só linhas completas: uma linha ainda sendo escrita fica para a próxima leitura
+        lines = chunk[:chunk.rfind(b"\n") + 1]
+        next_offset = offset + len(lines)
+        # Job com dono morto pode ter deixado uma linha pela metade: ela nunca será completada
+        finished = next_offset >= size if status == "done" else status == "failed" and not lines
+        if status == "failed" and finished:
+            lines += (json.dumps({"job_id": job_id, "error": "O worker que executava o job parou de responder"},
+                                 ensure_ascii=False) + "\n").encode("utf-8")
+        return lines, next_offset, status, finished
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.items_submitted - self.items_started,
+                "running": self.items_started - self.items_done,
+                "items_submitted": self.items_submitted,
+                "items_done": self.items_done,
+                "items_failed": self.items_failed,
+                "jobs_started": self.jobs_started
+            }
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Compara tokens de entrada e tempo de montagem do prompt: prompt completo x núcleo + seções recuperadas da persona.
+
+Uso:
+  python benchmark_persona.py                 # só contagem de tokens e montagem (sem rede)
+  python benchmark_persona.py --live 3        # também chama a OpenAI 3x por agente em cada modo
+"""
+import argparse
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from prompts import AGENT_PROMPTS
+from prompt_window import assemble_prompt, precompute_prompt_tokens, OPENAI_MODEL, OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE
+from persona import PersonaIndex
+from semantic_cache import HashingEmbedder
+
+QUESTIONS = [
+    "Minhas vendas caíram este mês, o que devo fazer?",
+    "Como posso me comunicar melhor com a minha equipe?",
+    "Estou sem energia e cansado o tempo todo, por onde começo?",
+    "Qual é o primeiro passo para organizar as finanças da empresa?",
+    "Me dá um exemplo de como você responderia a um cliente insatisfeito?",
+    "Que tipo de pessoa você costuma atender?",
+]
+
+
+def build(agent_id, question, full_tokens, index=None):
+    history = [{"role": "user", "content": question}]
+    if index is None:
+        return assemble_prompt(agent_id, AGENT_PROMPTS[agent_id], full_tokens[agent_id], history)
+    system_prompt, system_tokens, sections = index.system_prompt(agent_id, question)
+    messages, context = assemble_prompt(agent_id, system_prompt, system_tokens, history)
+    context["persona_sections"] = sections
+    return messages, context
+
+
+def measure_local(agents, full_tokens, index):
+    results = {}
+    for mode, mode_index in (("completo", None), ("recuperação", index)):
+        tokens, timings = [], []
+        for agent_id in agents:
+            for question in QUESTIONS:
+                started = time.perf_counter()
+                _, context = build(agent_id, question, full_tokens, mode_index)
+                timings.append((time.perf_counter() - started) * 1000)
+                tokens.append(context["prompt_tokens"])
+        results[mode] = (tokens, timings)
+    return results
+
+
+def measure_live(agents, full_tokens, index, repeat):
+    from openai import OpenAI
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    results = {}
+    for mode, mode_index in (("completo", None), ("recuperação", index)):
+        usage, latencies = [], []
+        for agent_id in agents:
+            for question in QUESTIONS[:repeat]:
+                messages, _ = build(agent_id, question, full_tokens, mode_index)
+                started = time.perf_counter()
+                completion = client.chat.completions.create(
+                    model=OPENAI_MODEL, messages=messages, max_tokens=OPENAI_MAX_TOKENS, temperature=OPENAI_TEMPERATURE
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                usage.append(completion.usage.prompt_tokens)
+        results[mode] = (usage, latencies)
+    return results
+
+
+def report(title, results, unit):
+    print(f"\n{title}")
+    print(f"{'modo':<14}{'tokens/req (média)':>20}{'p50 ' + unit:>14}{'p95 ' + unit:>14}")
+    for mode, (tokens, timings) in results.items():
+        ordered = sorted(timings)
+        p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        print(f"{mode:<14}{statistics.mean(tokens):>20.0f}{statistics.median(ordered):>14.3f}{p95:>14.3f}")
+    full, retrieval = (statistics.mean(results[mode][0]) for mode in ("completo", "recuperação"))
+    print(f"redução de tokens de entrada: {(1 - retrieval / full) * 100:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", help="ids separados por vírgula (padrão: todos)")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("PERSONA_TOP_K", 2)))
+    parser.add_argument("--live", type=int, default=0, metavar="N", help="chamadas reais à OpenAI por agente em cada modo")
+    args = parser.parse_args()
+
+    load_dotenv()
+    agents = args.agents.split(",") if args.agents else list(AGENT_PROMPTS)
+    full_tokens = precompute_prompt_tokens(AGENT_PROMPTS)
+
+    started = time.perf_counter()
+    index = PersonaIndex(HashingEmbedder(), top_k=args.top_k).build(AGENT_PROMPTS)
+    print(f">>> Índice montado em {(time.perf_counter() - started) * 1000:.0f} ms: {index.stats()}")
+
+    report("Montagem do prompt (local)", measure_local(agents, full_tokens, index), "ms")
+    if args.live:
+        report("Chamadas reais à OpenAI", measure_live(agents, full_tokens, index, args.live), "ms")
+
+
+if __name__ == "__main__":
+    main()
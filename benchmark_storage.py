@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == DESEMPENHO DOS BACKENDS DE ARMAZENAMENTO                      ==
+# ===================================================================
+# Roda as mesmas medições em cada backend de storage/. O contrato (mesmo comportamento em todos)
+# é verificado pelos testes: python -m pytest tests/test_storage_*.py
+#
+# Uso:
+#   python benchmark_storage.py                          # memory e sqlite (arquivo temporário)
+#   python benchmark_storage.py --backends supabase      # projeto do .env (grava e apaga dados de teste)
+#   python benchmark_storage.py --messages 20000 --conversations 200
+#   python benchmark_storage.py --backends replicated --replica-lag 0.2   # réplica local com atraso injetado
+#   python benchmark_storage.py --backends sharded --shards 3             # shards locais em memória
+#   python benchmark_storage.py --backends archived                       # memória + arquivo em diretório temporário
+#
+# O benchmark grava e apaga dados: memory, sqlite e archived nunca usam SQLITE_PATH nem ARCHIVE_DIR do .env
+# (arquivos temporários, a menos que --sqlite-path/--archive-dir sejam informados).
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from storage import create_storage, MemoryStorage, SQLiteStorage
+from storage.testing import create_archived, create_replicated, create_sharded, make_messages
+
+def _timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(timings)
+    return statistics.median(ordered), ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+def run_performance(storage, conversations, messages, batch_size):
+    user = f"benchmark-{uuid.uuid4().hex[:12]}"
+    conversation_ids = [storage.upsert_conversation(user, f"agente-{i}")["id"] for i in range(conversations)]
+    per_conversation = max(messages // conversations, 1)
+
+    started = time.perf_counter()
+    total = 0
+    for conversation_id in conversation_ids:
+        rows = make_messages(conversation_id, per_conversation)
+        for offset in range(0, len(rows), batch_size):
+            storage.insert_messages(rows[offset:offset + batch_size])
+        total += len(rows)
+    elapsed = time.perf_counter() - started
+    print(f"  insert em lotes de {batch_size}: {total} mensagens em {elapsed:.2f}s ({total / elapsed:,.0f} msg/s)")
+
+    target = conversation_ids[len(conversation_ids) // 2]
+    middle = storage.messages_range(target, per_conversation // 2, per_conversation // 2)[0]
+    cursor = (middle["created_at"], middle["id"])
+    print(f"{'  operação':<34}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, fn in (
+            ("upsert_conversation (existente)", lambda: storage.upsert_conversation(user, "agente-0")),
+            ("messages_before (últimas 50)", lambda: storage.messages_before(target, limit=51)),
+            ("messages_before (cursor, 50)", lambda: storage.messages_before(target, cursor, limit=51)),
+            ("messages_after (cursor, 200)", lambda: storage.messages_after(target, cursor, limit=201)),
+            ("count_messages", lambda: storage.count_messages(target)),
+            ("insert_messages (1 linha)", lambda: storage.insert_messages(make_messages(target, 1, "extra")))):
+        p50, p95 = _timed(fn, 50)
+        print(f"  {label:<32}{p50:>10.3f}{p95:>10.3f}")
+
+    for conversation_id in conversation_ids:
+        storage.delete_messages(conversation_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Desempenho dos backends de armazenamento")
+    parser.add_argument("--backends", default="memory,sqlite",
+                        help="separados por vírgula: memory, sqlite, supabase, replicated, sharded, archived")
+    parser.add_argument("--replica-lag", type=float, default=0.2, help="atraso (s) da réplica local do backend 'replicated'")
+    parser.add_argument("--shards", type=int, default=3, help="quantidade de shards locais do backend 'sharded'")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5000, help="total de mensagens do teste de desempenho")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 200)))
+    parser.add_argument("--sqlite-path", help="banco do backend 'sqlite' (padrão: arquivo temporário)")
+    parser.add_argument("--archive-dir", help="diretório-base do backend 'archived' (padrão: diretório temporário)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends.split(","):
+            if backend == "memory":
+                storage = MemoryStorage()
+            elif backend == "sqlite":
+                storage = SQLiteStorage(args.sqlite_path or os.path.join(directory, "benchmark.db"))
+            elif backend == "replicated":
+                storage = create_replicated(args.replica_lag, directory)
+            elif backend == "sharded":
+                storage = create_sharded(args.shards)
+            elif backend == "archived":
+                storage = create_archived(args.archive_dir or directory)
+            else:
+                # Projeto do .env, sem a camada de arquivo: ARCHIVE_DIR não entra no teste
+                storage = create_storage(backend, archived=False)
+            print(f"\n>>> Backend {backend}")
+            run_performance(storage, args.conversations, args.messages, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache em memória com despejo LRU (limite de entradas) e expiração por tempo (TTL).
+    Seguro para uso entre threads; mantém contadores de acertos e erros.
+    `clock` é a fonte de tempo (segundos, monotônica); os testes injetam um relógio controlado.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+def normalize_text(text):
+    """Normaliza Unicode (NFC) e espaços para que variações triviais gerem a mesma chave."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def canonical_key(*parts, messages=()):
+    """Hash SHA-256 de uma representação canônica (JSON ordenado) dos parâmetros e das mensagens."""
+    payload = {
+        "params": list(parts),
+        "messages": [[message.get("role"), normalize_text(message.get("content"))] for message in messages]
+    }
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+import zlib
+
+_CONVERSATION_FIELDS = ("id", "user_id", "agent_id", "summary", "summarized_count")
+_MESSAGE_FIELDS = ("id", "conversation_id", "role", "content", "created_at")
+
+
+def encode_export_cursor(conversation_id, after_message=None, done=False, user_id=None):
+    """
+    Cursor opaco de retomada: base64 de {"u": user_id | null, "c": conversa, "m": [created_at, id] | null,
+    "done": bool}. O "u" é o escopo da exportação (null = todos os usuários).
+    """
+    raw = json.dumps({"u": user_id, "c": conversation_id, "m": list(after_message) if after_message else None, "done": done})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_export_cursor(cursor, user_id=None):
+    """Decodifica o cursor; ValueError se for inválido ou de uma exportação com outro escopo (`user_id`)."""
+    state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    if not isinstance(state, dict) or not state.get("c"):
+        raise ValueError("cursor de exportação inválido")
+    if state.get("u") != user_id:
+        raise ValueError("cursor de exportação de outro usuário")
+    return state
+
+
+def check_export_cursor(storage, cursor, user_id=None):
+    """
+    Decodifica o cursor e confere que a conversa interrompida pertence a `user_id` (ValueError se não).
+    Uma conversa apagada desde o checkpoint é aceita: a retomada a pula.
+    """
+    state = decode_export_cursor(cursor, user_id)
+    if user_id is not None and not state.get("done"):
+        row = storage.get_conversation(state["c"])
+        if row is not None and row["user_id"] != user_id:
+            raise ValueError("cursor de exportação de outro usuário")
+        state["done"] = row is None
+    return state
+
+
+def _checkpoint(conversation_id, after_message=None, done=False, user_id=None):
+    return {"type": "checkpoint", "cursor": encode_export_cursor(conversation_id, after_message, done, user_id)}
+
+
+def _message_pages(storage, conversation_id, after, page_size):
+    while True:
+        if after is None:
+            page = storage.messages_range(conversation_id, 0, page_size - 1)
+        else:
+            page = storage.messages_after(conversation_id, after, page_size)
+        if page:
+            yield page
+            after = (page[-1]["created_at"], page[-1]["id"])
+        if len(page) < page_size:
+            return
+
+
+def iter_export(storage, user_id=None, cursor=None, page_size=500):
+    """
+    Gera os registros da exportação, página por página (memória constante): para cada conversa
+    (de `user_id`, ou de todos), um registro "conversation" seguido das mensagens em ordem cronológica.
+    Depois de cada página de mensagens e de cada conversa vem um "checkpoint" com o cursor de retomada;
+    o último registro é "end", com os totais exportados nesta execução.
+    O cursor só vale para o mesmo `user_id` da exportação que o gerou (ValueError se não).
+    """
+    state = check_export_cursor(storage, cursor, user_id) if cursor else None
+    conversations = messages = 0
+
+    def export_messages(conversation_id, after):
+        nonlocal messages
+        for page in _message_pages(storage, conversation_id, after, page_size):
+            for row in page:
+                yield dict({field: row.get(field) for field in _MESSAGE_FIELDS}, type="message")
+            messages += len(page)
+            if len(page) == page_size:
+                yield _checkpoint(conversation_id, (page[-1]["created_at"], page[-1]["id"]), user_id=user_id)
+        yield _checkpoint(conversation_id, done=True, user_id=user_id)
+
+    after_conversation = None
+    if state:
+        after_conversation = state["c"]
+        if not state.get("done"):
+            # A conversa interrompida continua de onde parou, sem repetir o cabeçalho
+            yield from export_messages(state["c"], tuple(state["m"]) if state.get("m") else None)
+
+    while True:
+        page = storage.list_conversations(user_id=user_id, after=after_conversation, limit=page_size)
+        for row in page:
+            yield dict({field: row.get(field) for field in _CONVERSATION_FIELDS}, type="conversation")
+            conversations += 1
+            yield from export_messages(row["id"], None)
+        if len(page) < page_size:
+            break
+        after_conversation = page[-1]["id"]
+
+    yield {"type": "end", "conversations": conversations, "messages": messages}
+
+
+def ndjson_batches(records):
+    """Agrupa as linhas NDJSON (bytes) em lotes que terminam em um checkpoint (ou no fim)."""
+    batch = []
+    for record in records:
+        batch.append(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        if record["type"] in ("checkpoint", "end"):
+            yield b"".join(batch)
+            batch = []
+    if batch:
+        yield b"".join(batch)
+
+
+def gzip_stream(batches, level=6):
+    """
+    Comprime os lotes em um único fluxo gzip, na hora. Cada lote é descarregado (Z_SYNC_FLUSH) assim que
+    fica pronto, então o cliente recebe os dados aos poucos e tudo até o último checkpoint é legível.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for batch in batches:
+        yield compressor.compress(batch) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
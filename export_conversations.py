@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == EXPORTAÇÃO DAS CONVERSAS (NDJSON)                             ==
+# ===================================================================
+# Grava as conversas e mensagens de um usuário (ou de todos) como NDJSON, uma linha por registro, lendo
+# o armazenamento página por página: a memória usada é a mesma para dez ou milhões de mensagens.
+# O arquivo termina sempre em um checkpoint; se a execução for interrompida, o cursor para continuar é
+# mostrado no final e --cursor acrescenta o restante ao mesmo arquivo (no gzip, como um novo membro).
+#
+# Uso:
+#   python export_conversations.py --user <user_id> --output usuario.ndjson
+#   python export_conversations.py --all --gzip --output tudo.ndjson.gz
+#   python export_conversations.py --all --gzip --output tudo.ndjson.gz --cursor <cursor>
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+from export import iter_export, ndjson_batches, check_export_cursor
+from storage import create_storage
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Exporta conversas e mensagens como NDJSON")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--user", help="só as conversas deste user_id")
+    scope.add_argument("--all", action="store_true", help="todas as conversas de todos os usuários")
+    parser.add_argument("--output", help="arquivo de saída (padrão: stdout)")
+    parser.add_argument("--gzip", action="store_true", help="comprime a saída com gzip")
+    parser.add_argument("--cursor", help="retoma a partir deste cursor (acrescenta ao arquivo de saída)")
+    parser.add_argument("--page-size", type=int, default=int(os.getenv("EXPORT_PAGE_SIZE", 500)))
+    args = parser.parse_args()
+
+    storage = create_storage()
+    if args.cursor:
+        try:
+            check_export_cursor(storage, args.cursor, args.user)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise SystemExit(f"!!! Erro: cursor inválido ({e}); use o cursor de uma exportação com o mesmo --user/--all.")
+
+    out = open(args.output, "ab" if args.cursor else "wb") if args.output else sys.stdout.buffer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if args.gzip else None
+    cursor = args.cursor
+    summary = None
+    started = time.perf_counter()
+    try:
+        # Cada lote termina em um checkpoint e só é escrito inteiro: o que está no arquivo vai até `cursor`
+        for batch in ndjson_batches(iter_export(storage, args.user, args.cursor, args.page_size)):
+            out.write(compressor.compress(batch) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else batch)
+            last = json.loads(batch.rstrip(b"\n").rsplit(b"\n", 1)[-1])
+            if last["type"] == "checkpoint":
+                cursor = last["cursor"]
+            else:
+                summary = last
+    except (Exception, KeyboardInterrupt) as e:
+        print(f"!!! Exportação interrompida: {e!r}", file=sys.stderr)
+    finally:
+        if compressor:
+            out.write(compressor.flush())
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    if summary is None:
+        raise SystemExit(f"!!! Para continuar, repita o comando com: --cursor {cursor}" if cursor
+                         else "!!! Para continuar, repita o comando.")
+    print(f">>> Exportação concluída em {time.perf_counter() - started:.1f}s: {summary['conversations']} conversa(s), "
+          f"{summary['messages']} mensagem(ns).", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
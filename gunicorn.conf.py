@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Configuração lida automaticamente pelo Gunicorn (diretório de trabalho da aplicação)
+
+
+def post_worker_init(worker):
+    # Abre as conexões com OpenAI e Supabase antes do primeiro request do worker
+    import app
+    app.keep_warm.start()
+    # Recupera spools de workers anteriores e inicia o flusher das mensagens
+    app.message_queue.start()
+    # Acompanha o arquivo de prompts e o rollback para trocar de versão sem reiniciar
+    app.prompt_registry.start_watching()
+
+
+def worker_exit(server, worker):
+    # Envia o que ainda está na fila antes de encerrar; o que falhar fica no spool para o próximo worker
+    import app
+    app.message_queue.flush()
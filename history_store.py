@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+# Quantidade de mensagens mais recentes mantidas por conversa e cobertas pelo hash de prefixo.
+# O index.html usa o mesmo valor ao calcular o hash do histórico que já possui.
+HISTORY_TAIL = 50
+
+# Custo aproximado (em bytes) de cada registro além do texto em si
+_RECORD_OVERHEAD = 64
+
+_ROLES = ('user', 'assistant', 'system')
+
+
+def history_hash(messages):
+    """
+    Calcula o hash SHA-256 das últimas HISTORY_TAIL mensagens de um histórico.
+    Cada mensagem é serializada como `role + "\\x1f" + content + "\\x1e"`.
+    """
+    digest = hashlib.sha256()
+    for message in messages[-HISTORY_TAIL:]:
+        digest.update(f"{message['role']}\x1f{message['content']}\x1e".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def message_key(created_at, message_id):
+    """
+    Posição comparável de uma mensagem na ordem (created_at, id). O created_at é normalizado (UTC, com
+    microssegundos): o mesmo instante pode vir escrito de formas diferentes (fila write-behind x banco).
+    """
+    try:
+        created_at = datetime.datetime.fromisoformat(created_at).astimezone(datetime.timezone.utc).isoformat(timespec="microseconds")
+    except (TypeError, ValueError):
+        pass
+    return (created_at, message_id)
+
+
+def _compact(message):
+    role = message['role']
+    role_code = _ROLES.index(role) if role in _ROLES else sys.intern(role)
+    content = message['content']
+    key = message_key(message['created_at'], message['id']) if message.get('created_at') and message.get('id') else None
+    return (role_code, content, len(content.encode('utf-8')) + _RECORD_OVERHEAD, key)
+
+
+def _expand(record):
+    role_code, content, _, _ = record
+    role = _ROLES[role_code] if isinstance(role_code, int) else role_code
+    return {"role": role, "content": content}
+
+
+def _visible(records, after):
+    after = message_key(*after) if after else None
+    return [_expand(record) for record in records if after is None or record[3] is None or record[3] > after]
+
+
+def recent_messages(messages, after=None):
+    """
+    Converte mensagens do armazenamento (com created_at e id) para o formato da OpenAI, deixando de fora
+    as até `after` ((created_at, id) da última mensagem resumida), inclusive.
+    """
+    return _visible([_compact(message) for message in messages], after)
+
+
+class HistoryStore:
+    """
+    Cache em memória do histórico recente de cada conversa, com despejo LRU limitado por bytes.
+    Cada mensagem é guardada como uma tupla compacta (papel, texto, tamanho, posição), onde a posição
+    é o (created_at, id) da mensagem, quando conhecido.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_messages=HISTORY_TAIL):
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conversation_id, after=None, expected_hash=None):
+        """
+        Devolve o histórico em cache (lista de dicts) ou None se não estiver presente ou se `expected_hash`
+        (hash do histórico que o cliente tem) não bater com o do cache. Com `after` ((created_at, id) da
+        última mensagem resumida), as mensagens até ela, inclusive, ficam de fora: o resumo já as cobre.
+        """
+        with self._lock:
+            records = self._entries.get(conversation_id)
+            if records is None:
+                self.misses += 1
+                return None
+            records = list(records)
+            messages = [_expand(record) for record in records]
+            if expected_hash and history_hash(messages) != expected_hash:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+        return _visible(records, after) if after else messages
+
+    def set(self, conversation_id, messages):
+        """Substitui o histórico da conversa pelas últimas `max_messages` mensagens informadas."""
+        records = [_compact(message) for message in messages[-self.max_messages:]]
+        with self._lock:
+            self._discard(conversation_id)
+            self._entries[conversation_id] = records
+            self._sizes[conversation_id] = sum(record[2] for record in records)
+            self._total_bytes += self._sizes[conversation_id]
+            self._evict()
+
+    def append(self, conversation_id, role, content, created_at=None, message_id=None):
+        """Acrescenta uma mensagem a uma conversa já presente no cache (ignora se não estiver ou se o id já estiver)."""
+        record = _compact({"role": role, "content": content, "created_at": created_at, "id": message_id})
+        with self._lock:
+            records = self._entries.get(conversation_id)
+            if records is None or (record[3] and any(other[3] and other[3][1] == message_id for other in records)):
+                return
+            records.append(record)
+            self._sizes[conversation_id] += record[2]
+            self._total_bytes += record[2]
+            while len(records) > self.max_messages:
+                removed = records.pop(0)
+                self._sizes[conversation_id] -= removed[2]
+                self._total_bytes -= removed[2]
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._discard(conversation_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _discard(self, conversation_id):
+        if conversation_id in self._entries:
+            del self._entries[conversation_id]
+            self._total_bytes -= self._sizes.pop(conversation_id)
+
+    def _evict(self):
+        # Remove as conversas usadas há mais tempo até caber no orçamento de bytes
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            conversation_id, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(conversation_id)
+            self.evictions += 1
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from cache import TTLCache
+
+
+class IdempotencyConflict(Exception):
+    """A mesma Idempotency-Key foi reutilizada com um corpo de requisição diferente."""
+
+
+class IdempotencyInProgress(Exception):
+    """A primeira requisição com a mesma Idempotency-Key ainda não terminou dentro do tempo de espera."""
+
+
+class _Relay:
+    """
+    Repassa ao cliente os pedaços de uma resposta em streaming e chama `finish(último pedaço)` ao terminar,
+    ou `finish(None)` se o streaming falhar ou for fechado antes do fim (ex.: o cliente desconectou).
+    """
+
+    def __init__(self, chunks, finish):
+        self._chunks = iter(chunks)
+        self._finish = finish
+        self._last = None
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            self._last = next(self._chunks)
+        except StopIteration:
+            self._done(self._last)
+            raise
+        except BaseException:
+            self._done(None)
+            raise
+        return self._last
+
+    def close(self):
+        self._done(None)
+        close = getattr(self._chunks, "close", None)
+        if close:
+            close()
+
+    def _done(self, last):
+        if not self._finished:
+            self._finished = True
+            self._finish(last)
+
+
+class IdempotencyStore:
+    """
+    Respostas recentes indexadas por (rota, Idempotency-Key), com limite de entradas e TTL.
+    Uma repetição devolve a resposta original sem executar a rota de novo; repetições que chegam
+    enquanto a primeira ainda está em andamento (inclusive durante um streaming) esperam por ela.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400, wait_timeout=300):
+        self._responses = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.wait_timeout = wait_timeout
+        self._running = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.conflicts = 0
+
+    def run(self, scope, key, fingerprint, fn, keep=None):
+        """
+        Executa `fn` uma única vez por (scope, key). `fn` devolve (status, corpo, mimetype); respostas com
+        status 5xx não são guardadas, para que o cliente possa tentar de novo.
+
+        Em streaming, o corpo é um iterável de pedaços: eles vão ao cliente à medida que são gerados e, no
+        fim, só o último (ex.: o evento 'done' do SSE) é guardado, se `keep(último)` for verdadeiro. As
+        repetições recebem apenas esse pedaço. Um streaming interrompido não é guardado.
+        Retorna ((status, corpo, mimetype), replayed).
+        """
+        cache_key = f"{scope}\x1f{key}"
+        while True:
+            stored = self._responses.get(cache_key)
+            if stored is not None:
+                return self._replay(stored, fingerprint, key), True
+            with self._lock:
+                running = self._running.get(cache_key)
+                if running is None:
+                    done = threading.Event()
+                    self._running[cache_key] = (done, fingerprint)
+                    break
+            if running[1] != fingerprint:
+                self._conflict(key)
+            if not running[0].wait(self.wait_timeout):
+                raise IdempotencyInProgress(key)
+            # Terminou sem resposta guardada (erro ou streaming interrompido): a próxima volta executa de novo
+
+        def finish(stored=None):
+            if stored is not None:
+                self._responses.set(cache_key, stored)
+            with self._lock:
+                self._running.pop(cache_key, None)
+            done.set()
+
+        try:
+            status, body, mimetype = fn()
+        except BaseException:
+            finish()
+            raise
+
+        if isinstance(body, (bytes, str)):
+            finish((fingerprint, status, body, mimetype) if status < 500 else None)
+            return (status, body, mimetype), False
+
+        def finish_stream(last):
+            keep_last = last is not None and status < 500 and (keep is None or keep(last))
+            finish((fingerprint, status, last, mimetype) if keep_last else None)
+
+        return (status, _Relay(body, finish_stream), mimetype), False
+
+    def _replay(self, stored, fingerprint, key):
+        if stored[0] != fingerprint:
+            self._conflict(key)
+        with self._lock:
+            self.replayed += 1
+        return stored[1:]
+
+    def _conflict(self, key):
+        with self._lock:
+            self.conflicts += 1
+        raise IdempotencyConflict(key)
+
+    def stats(self):
+        stats = self._responses.stats()
+        with self._lock:
+            stats.update({"replayed": self.replayed, "conflicts": self.conflicts, "in_flight": len(self._running)})
+        return stats
@@ -9,6 +9,7 @@ import os
 import json
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from storage import shard_endpoints, supabase_key_for
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -45,6 +46,8 @@ print("🚀 Iniciando inserção de agentes no Supabase...\n")
 
 # Dicionário para armazenar o mapeamento
 agent_mapping = {}
+# Linhas inseridas (com id), replicadas depois nos demais shards
+agent_rows = []
 
 # Inserir cada agente
 for agent in AGENTS:
@@ -58,12 +61,24 @@ for agent in AGENTS:
         
         agent_id = response.data[0]['id']
         agent_mapping[agent['name']] = agent_id
+        agent_rows.append(response.data[0])
         
         print(f"✅ {agent['name'].upper():12} -> {agent_id}")
         
     except Exception as e:
         print(f"❌ Erro ao inserir {agent['name']}: {str(e)}")
 
+# Com STORAGE_SHARDS, o catálogo de agentes é replicado (mesmos ids) em todos os projetos
+for shard_name, shard_url in shard_endpoints().items():
+    if shard_url == supabase_url:
+        continue
+    try:
+        shard_client = create_client(shard_url, supabase_key_for(shard_name))
+        shard_client.table('agents').upsert(agent_rows, on_conflict='id').execute()
+        print(f"✅ Catálogo replicado no shard {shard_name} ({len(agent_rows)} agentes)")
+    except Exception as e:
+        print(f"❌ Erro ao replicar o catálogo no shard {shard_name}: {str(e)}")
+
 print("\n" + "="*80)
 print("📝 MAPEAMENTO PARA app.py:")
 print("="*80 + "\n")
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+
+import numpy as np
+
+from prompt_window import count_tokens, TOKENS_PER_MESSAGE
+
+# Títulos das seções dos prompts (ver "PROMPTS AGENTES.txt"), na forma "<emoji> Título"
+SECTION_HEADING = re.compile(
+    r"^(🧠 Identidade do Agente|🎯 Objetivo Principal|👥 Público-Alvo|🗣️ Tom de Comunicação|✍️ Estilo de Resposta"
+    r"|🤔 Modo de Raciocínio|📚 Domínios de Conhecimento|🚫 Limites e Restrições|💡 Exemplo de Resposta Ideal"
+    r"|📜 Resumo de Personalidade)\s*$",
+    re.MULTILINE
+)
+
+# Seções que definem quem o agente é e como responde: vão em todas as requisições
+CORE_SECTIONS = (
+    "Identidade do Agente",
+    "Objetivo Principal",
+    "Tom de Comunicação",
+    "Estilo de Resposta",
+    "Limites e Restrições",
+    "Resumo de Personalidade",
+)
+
+
+def _title(heading):
+    return heading.split(" ", 1)[1]
+
+
+def split_persona(prompt):
+    """
+    Divide o prompt em núcleo fixo (texto antes da primeira seção + CORE_SECTIONS)
+    e seções recuperáveis. Retorna (núcleo, [(título, texto), ...]) na ordem original.
+    """
+    matches = list(SECTION_HEADING.finditer(prompt))
+    if not matches:
+        return prompt, []
+
+    core = [prompt[:matches[0].start()].strip()]
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(prompt)
+        text = prompt[match.start():end].strip()
+        if _title(match.group(1)) in CORE_SECTIONS:
+            core.append(text)
+        else:
+            sections.append((_title(match.group(1)), text))
+    return "\n".join(part for part in core if part), sections
+
+
+class _AgentPersona:
+    def __init__(self, prompt, core, sections, vectors):
+        self.prompt = prompt
+        self.prompt_tokens = count_tokens(prompt)
+        self.core = core
+        self.core_tokens = count_tokens(core)
+        self.titles = [title for title, _ in sections]
+        self.texts = [text for _, text in sections]
+        self.tokens = [count_tokens(text) for text in self.texts]
+        self.vectors = vectors
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class PersonaIndex:
+    """
+    Índice vetorial local das seções recuperáveis de cada persona, montado uma única vez no carregamento.
+    A cada turno, o prompt de sistema é o núcleo fixo + as `top_k` seções mais parecidas com a pergunta
+    (similaridade de cosseno acima de `min_score`), mantidas na ordem em que aparecem no prompt.
+
+    Os vetores são centrados na média de todas as seções: o que é comum a todos os textos
+    (palavras frequentes do português, estrutura dos prompts) deixa de pesar na similaridade.
+
+    Se o embedding da pergunta falhar (ex.: erro na API de embeddings da OpenAI), o turno usa o prompt
+    completo da persona em vez de falhar.
+    """
+
+    def __init__(self, embedder, top_k=2, min_score=0.05):
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self._personas = {}
+        self._mean = None
+        self._lock = threading.Lock()
+        self.embed_errors = 0
+
+    def build(self, prompts):
+        split = {agent_id: split_persona(prompt) for agent_id, prompt in prompts.items()}
+        # O texto inclui o título da seção, que também ajuda a casar com o assunto da pergunta
+        texts = [text for _, sections in split.values() for _, text in sections]
+        vectors = self.embedder(texts) if texts else None
+        self._mean = vectors.mean(axis=0) if vectors is not None else None
+
+        offset = 0
+        for agent_id, (core, sections) in split.items():
+            agent_vectors = None
+            if sections:
+                agent_vectors = _normalize_rows(vectors[offset:offset + len(sections)] - self._mean)
+                offset += len(sections)
+            self._personas[agent_id] = _AgentPersona(prompts[agent_id], core, sections, agent_vectors)
+        return self
+
+    def _embed_query(self, query):
+        return _normalize_rows(self.embedder([query])[0] - self._mean)
+
+    def __contains__(self, agent_id):
+        return agent_id in self._personas
+
+    def system_prompt(self, agent_id, query):
+        """Devolve (prompt de sistema, tokens do prompt, títulos das seções anexadas)."""
+        persona = self._personas[agent_id]
+        selected = []
+        if query and persona.vectors is not None and self.top_k > 0:
+            try:
+                query_vector = self._embed_query(query)
+            except Exception as e:
+                with self._lock:
+                    self.embed_errors += 1
+                print(f"!!! Erro ao gerar o embedding da pergunta; usando o prompt completo de '{agent_id}': {e}")
+                return persona.prompt, persona.prompt_tokens + TOKENS_PER_MESSAGE, list(persona.titles)
+            scores = persona.vectors @ query_vector
+            ranked = np.argsort(scores)[::-1][:self.top_k]
+            selected = sorted(int(i) for i in ranked if scores[i] >= self.min_score)
+
+        prompt = "\n".join([persona.core] + [persona.texts[i] for i in selected])
+        tokens = persona.core_tokens + sum(persona.tokens[i] for i in selected) + TOKENS_PER_MESSAGE
+        return prompt, tokens, [persona.titles[i] for i in selected]
+
+    def stats(self):
+        return {
+            "agents": len(self._personas),
+            "sections": sum(len(persona.titles) for persona in self._personas.values()),
+            "top_k": self.top_k,
+            "min_score": self.min_score,
+            "embed_errors": self.embed_errors
+        }
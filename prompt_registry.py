@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == REGISTRO DE PROMPTS: CACHE COMPILADO, RECARGA E ROLLBACK      ==
+# ===================================================================
+# Uso pela linha de comando (vale para todos os workers em até PROMPTS_WATCH_INTERVAL segundos):
+#   python prompt_registry.py versions            # lista as versões compiladas
+#   python prompt_registry.py rollback <versão>   # fixa uma versão anterior
+#   python prompt_registry.py unpin               # volta a seguir o arquivo de prompts
+import hashlib
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+class PromptRegistryError(Exception):
+    """Nenhuma versão dos prompts pôde ser carregada."""
+
+
+class PromptSnapshot:
+    """Versão imutável dos prompts, com os dados derivados dela (tokens, saudações, índices)."""
+
+    def __init__(self, version, prompts, compiled_at):
+        self.version = version
+        self.prompts = MappingProxyType(dict(prompts))
+        self.compiled_at = compiled_at
+        self.derived = {}
+
+
+class LiveMapping(Mapping):
+    """Dicionário somente leitura que sempre consulta a versão ativa do registro."""
+
+    def __init__(self, registry, derived=None):
+        self._registry = registry
+        self._derived = derived
+
+    def _data(self):
+        snapshot = self._registry.current
+        return snapshot.prompts if self._derived is None else snapshot.derived[self._derived]
+
+    def __getitem__(self, key):
+        return self._data()[key]
+
+    def __iter__(self):
+        return iter(self._data())
+
+    def __len__(self):
+        return len(self._data())
+
+    def __contains__(self, key):
+        return key in self._data()
+
+
+class PromptRegistry:
+    """
+    Mantém a versão ativa dos prompts e troca por uma nova sem reiniciar os workers.
+
+    - Cache compilado: o arquivo-fonte é interpretado (`parse`) uma única vez por conteúdo e salvo em
+      `<cache_dir>/prompts-<versão>.json`, onde a versão é o SHA-256 do arquivo. Os outros workers
+      (e os próximos reinícios) apenas carregam o JSON.
+    - Recarga: `start_watching` verifica o arquivo a cada `watch_interval` segundos; a nova versão e
+      seus dados derivados são montados por completo antes de substituir a atual em uma única atribuição.
+      Requisições em andamento continuam com a versão que já tinham em mãos.
+    - Rollback: as versões compiladas ficam em disco; `rollback` grava `<cache_dir>/pinned.json`,
+      que todos os workers seguem até que o arquivo-fonte mude de novo (ou `unpin`).
+    """
+
+    def __init__(self, source_path, cache_dir, parse, watch_interval=2.0):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.parse = parse
+        self.watch_interval = watch_interval
+        self._current = None
+        self._derivers = {}
+        self._lock = threading.Lock()
+        self._seen = None
+        self._thread = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error = None
+
+    # --- Versões compiladas ---
+
+    def _compiled_path(self, version):
+        return os.path.join(self.cache_dir, f"prompts-{version}.json")
+
+    def _pin_path(self):
+        return os.path.join(self.cache_dir, "pinned.json")
+
+    def _read_source(self):
+        try:
+            with open(self.source_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None, None
+        return hashlib.sha256(raw).hexdigest(), raw
+
+    def _compile(self, version, raw):
+        """Interpreta o arquivo-fonte e grava a versão compilada (escrita atômica)."""
+        prompts = self.parse(raw.decode("utf-8"))
+        if not isinstance(prompts, dict) or not prompts or not all(
+                isinstance(k, str) and isinstance(v, str) for k, v in prompts.items()):
+            raise ValueError("o arquivo de prompts deve definir um dicionário não vazio de textos")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        payload = {"version": version, "compiled_at": time.time(), "source": self.source_path, "prompts": prompts}
+        tmp_path = f"{self._compiled_path(version)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, self._compiled_path(version))
+        print(f">>> Prompts compilados: versão {version[:12]} ({len(prompts)} agentes).")
+
+    def _load_compiled(self, version):
+        with open(self._compiled_path(version), encoding="utf-8") as f:
+            payload = json.load(f)
+        return PromptSnapshot(payload["version"], payload["prompts"], payload["compiled_at"])
+
+    def versions(self):
+        """Versões compiladas disponíveis, da mais recente para a mais antiga."""
+        found = []
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("prompts-") and name.endswith(".json"):
+                    version = name[len("prompts-"):-len(".json")]
+                    found.append({"version": version, "compiled_at": os.path.getmtime(os.path.join(self.cache_dir, name))})
+        found.sort(key=lambda item: item["compiled_at"], reverse=True)
+        active = self._current.version if self._current else None
+        for item in found:
+            item["active"] = item["version"] == active
+        return found
+
+    def _resolve(self, prefix):
+        matches = [item["version"] for item in self.versions() if item["version"].startswith(prefix)]
+        if len(matches) != 1:
+            raise PromptRegistryError(f"versão '{prefix}' não encontrada ou ambígua")
+        return matches[0]
+
+    # --- Versão ativa ---
+
+    def _active_version(self):
+        """Versão que deve estar ativa: a fixada por rollback ou a do arquivo-fonte (compilando se preciso)."""
+        source_version, raw = self._read_source()
+        try:
+            with open(self._pin_path(), encoding="utf-8") as f:
+                pin = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pin = None
+        # O rollback vale antes da compilação: funciona mesmo com um arquivo-fonte quebrado
+        if pin and (source_version is None or pin.get("source_version") == source_version):
+            return pin["version"]
+        if source_version:
+            if not os.path.exists(self._compiled_path(source_version)):
+                self._compile(source_version, raw)
+            return source_version
+
+        # Sem o arquivo-fonte: segue com a última versão compilada, mas avisa
+        available = self.versions()
+        if not available:
+            raise PromptRegistryError(f"arquivo de prompts '{self.source_path}' não encontrado e não há versão compilada")
+        print(f"!!! AVISO: Arquivo de prompts '{self.source_path}' não encontrado. Usando a última versão compilada.")
+        return available[0]["version"]
+
+    def _publish(self, snapshot):
+        for name, derive in self._derivers.items():
+            snapshot.derived[name] = derive(snapshot.prompts)
+        previous = self._current
+        self._current = snapshot
+        if previous is not None:
+            self.reloads += 1
+            print(f">>> Prompts trocados: versão {previous.version[:12]} -> {snapshot.version[:12]}.")
+
+    def load(self):
+        """Carrega a versão ativa; falha alto se não houver nenhuma."""
+        with self._lock:
+            self._seen = self._fingerprint()
+            self._publish(self._load_compiled(self._active_version()))
+        return self
+
+    def refresh(self):
+        """Troca de versão se o arquivo-fonte ou o rollback mudaram. Em erro, mantém a versão atual."""
+        with self._lock:
+            fingerprint = self._fingerprint()
+            if fingerprint == self._seen:
+                return False
+            self._seen = fingerprint
+            try:
+                version = self._active_version()
+                if version == self._current.version:
+                    return False
+                self._publish(self._load_compiled(version))
+                return True
+            except Exception as e:
+                self.reload_errors += 1
+                self.last_error = str(e)
+                print(f"!!! Erro ao recarregar os prompts; mantendo a versão {self._current.version[:12]}: {e}")
+                return False
+
+    def _fingerprint(self):
+        def stat(path):
+            try:
+                info = os.stat(path)
+                return info.st_mtime_ns, info.st_size
+            except FileNotFoundError:
+                return None
+        return stat(self.source_path), stat(self._pin_path())
+
+    @property
+    def current(self):
+        return self._current
+
+    def add_deriver(self, name, derive):
+        """
+        Registra um dado derivado dos prompts (ex.: tokens por agente), recalculado a cada nova versão
+        antes da troca. `derive` recebe o dicionário de prompts.
+        """
+        with self._lock:
+            self._current.derived[name] = derive(self._current.prompts)
+            self._derivers[name] = derive
+
+    def view(self, derived=None):
+        return LiveMapping(self, derived)
+
+    def rollback(self, version):
+        """Fixa uma versão compilada (prefixo aceito) enquanto o arquivo-fonte não mudar."""
+        version = self._resolve(version)
+        source_version, _ = self._read_source()
+        tmp_path = f"{self._pin_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "source_version": source_version, "pinned_at": time.time()}, f)
+        os.replace(tmp_path, self._pin_path())
+        return version
+
+    def unpin(self):
+        try:
+            os.remove(self._pin_path())
+        except FileNotFoundError:
+            pass
+
+    # --- Observação do arquivo ---
+
+    def start_watching(self):
+        if self.watch_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="prompt-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            self.refresh()
+
+    def stats(self):
+        snapshot = self._current
+        return {
+            "version": snapshot.version[:12] if snapshot else None,
+            "agents": len(snapshot.prompts) if snapshot else 0,
+            "compiled_at": snapshot.compiled_at if snapshot else None,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    # Sem carregar a versão ativa: o rollback precisa funcionar mesmo com o arquivo-fonte quebrado
+    registry = PromptRegistry(
+        os.getenv("PROMPTS_FILE", "PROMPTS AGENTES.txt"),
+        cache_dir=os.getenv("PROMPTS_CACHE_DIR", ".prompt_cache"),
+        parse=None
+    )
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "versions"
+    if command == "versions":
+        for item in registry.versions():
+            marker = "*" if item["active"] else " "
+            print(f"{marker} {item['version'][:12]}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['compiled_at']))}")
+    elif command == "rollback" and len(sys.argv) > 2:
+        print(f">>> Versão {registry.rollback(sys.argv[2])[:12]} fixada.")
+    elif command == "unpin":
+        registry.unpin()
+        print(">>> Rollback removido: os workers voltam a seguir o arquivo de prompts.")
+    else:
+        print("uso: python prompt_registry.py [versions | rollback <versão> | unpin]")
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+# Tenta usar o tokenizador oficial; sem ele, usa uma estimativa por caracteres
+try:
+    import tiktoken
+except ImportError:
+    print("!!! AVISO: 'tiktoken' não instalado. Contagem de tokens será estimada (4 caracteres por token).")
+    tiktoken = None
+
+_ENCODING = None
+if tiktoken is not None:
+    # O tiktoken baixa a codificação na primeira vez; sem rede, seguimos com a estimativa
+    try:
+        _ENCODING = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"!!! AVISO: Não foi possível carregar a codificação do tiktoken ({e}). Contagem de tokens será estimada.")
+
+# --- Parâmetros do modelo (compartilhados pelos modos WSGI e ASGI) ---
+OPENAI_MODEL = "gpt-3.5-turbo"
+OPENAI_MAX_TOKENS = 150
+OPENAI_TEMPERATURE = 0.7
+FORCE_FORMAT_INSTRUCTION = "\n\nLembre-se: Responda em no máximo 3 frases curtas, com cada frase em um novo parágrafo."
+
+# Tokens extras que a OpenAI consome por mensagem (papel e delimitadores)
+TOKENS_PER_MESSAGE = 4
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+
+
+def _load_agent_budgets():
+    # Ex.: PROMPT_TOKEN_BUDGETS='{"allex": 4000, "lucas": 2500}'
+    raw = os.getenv("PROMPT_TOKEN_BUDGETS")
+    if not raw:
+        return {}
+    try:
+        return {agent_id: int(budget) for agent_id, budget in json.loads(raw).items()}
+    except (ValueError, AttributeError) as e:
+        print(f"!!! AVISO: PROMPT_TOKEN_BUDGETS inválido, usando o orçamento padrão: {e}")
+        return {}
+
+
+AGENT_TOKEN_BUDGETS = _load_agent_budgets()
+
+
+def count_tokens(text):
+    """Conta os tokens de um texto (exato com tiktoken, estimado sem ele)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    return count_tokens(message.get('content', '')) + TOKENS_PER_MESSAGE
+
+
+class InvalidHistory(ValueError):
+    """O histórico enviado pelo cliente não é uma lista de {role: str, content: str}."""
+
+
+_HISTORY_ROLES = ('user', 'assistant', 'system')
+
+
+def validate_history(history):
+    """Confere o histórico enviado pelo cliente antes de montar o prompt; levanta InvalidHistory com o motivo."""
+    if not isinstance(history, list):
+        raise InvalidHistory("history deve ser uma lista de {role, content}")
+    for index, message in enumerate(history):
+        if not isinstance(message, dict) or message.get('role') not in _HISTORY_ROLES or not isinstance(message.get('content'), str):
+            raise InvalidHistory(f"history[{index}] deve ser um objeto {{role: 'user' | 'assistant' | 'system', content: str}}")
+    return history
+
+
+def token_budget(agent_id):
+    """Orçamento de tokens de entrada do agente (configurável por agente)."""
+    return AGENT_TOKEN_BUDGETS.get(agent_id, DEFAULT_TOKEN_BUDGET)
+
+
+def precompute_prompt_tokens(prompts):
+    """Conta uma única vez os tokens do prompt de sistema de cada agente."""
+    return {agent_id: count_tokens(prompt) + TOKENS_PER_MESSAGE for agent_id, prompt in prompts.items()}
+
+
+def fit_history(history, budget):
+    """
+    Mantém as mensagens mais recentes do histórico que cabem no orçamento.
+    A última mensagem (a pergunta atual) é sempre mantida.
+    Retorna (mensagens mantidas, quantidade descartada, tokens usados).
+    """
+    kept = []
+    used = 0
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        if kept and used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept, len(history) - len(kept), used
+
+
+FORCE_FORMAT_TOKENS = count_tokens(FORCE_FORMAT_INSTRUCTION) + TOKENS_PER_MESSAGE
+
+
+def assemble_prompt(agent_id, system_prompt, system_tokens, history, summary=None):
+    """
+    Monta a lista de mensagens enviada à OpenAI (prompt do agente + resumo da conversa + histórico
+    + instrução de formato), mantendo apenas os turnos mais recentes que cabem no orçamento de tokens do agente.
+    Retorna (mensagens, contexto), onde contexto informa tokens usados e turnos descartados.
+    """
+    fixed_tokens = system_tokens + FORCE_FORMAT_TOKENS
+    summary_message = None
+    if summary:
+        summary_message = {"role": "system", "content": f"Resumo da conversa até aqui:\n{summary}"}
+        fixed_tokens += count_tokens(summary_message["content"]) + TOKENS_PER_MESSAGE
+    budget = token_budget(agent_id)
+    window, dropped, history_tokens = fit_history(history, max(budget - fixed_tokens, 0))
+    if dropped:
+        print(f">>> Orçamento de {budget} tokens do agente {agent_id}: {dropped} turno(s) descartado(s) do histórico.")
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(window)
+    messages.append({"role": "user", "content": FORCE_FORMAT_INSTRUCTION})
+    context = {
+        "prompt_tokens": fixed_tokens + history_tokens,
+        "token_budget": budget,
+        "dropped_turns": dropped
+    }
+    return messages, context
@@ -1,31 +1,54 @@
 # -*- coding: utf-8 -*-
 import ast
+import os
+import re
+from prompt_registry import PromptRegistry
 
-def load_prompts_from_file(filepath="PROMPTS AGENTES.txt"):
+GREETING_HEADER = re.compile(r"FRASE DE APRESENTAÇÃO INICIAL:\s*\n\s*(.+)")
+
+PROMPTS_FILE = os.getenv("PROMPTS_FILE", "PROMPTS AGENTES.txt")
+
+
+def parse_prompts(content):
+    """Interpreta o conteúdo do arquivo de prompts (um dicionário Python literal)."""
+    # A variável no arquivo de texto se chama AGENT_PROMPTS
+    # Precisamos remover o nome da variável para avaliar apenas o dicionário
+    if 'AGENT_PROMPTS = ' in content:
+        content = content.split('AGENT_PROMPTS = ', 1)[1]
+
+    # ast.literal_eval avalia a string como um literal Python (dicionário, lista, etc.)
+    # É muito mais seguro do que usar eval()
+    return ast.literal_eval(content)
+
+
+def extract_greeting(prompt):
     """
-    Lê um arquivo de texto que contém um dicionário Python e o carrega de forma segura.
+    Devolve a frase do bloco "FRASE DE APRESENTAÇÃO INICIAL" do prompt (sem as aspas externas),
+    ou None se o agente não tiver esse bloco.
     """
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # A variável no arquivo de texto se chama AGENT_PROMPTS
-        # Precisamos remover o nome da variável para avaliar apenas o dicionário
-        if 'AGENT_PROMPTS = ' in content:
-            content = content.split('AGENT_PROMPTS = ', 1)[1]
-
-        # ast.literal_eval avalia a string como um literal Python (dicionário, lista, etc.)
-        # É muito mais seguro do que usar eval()
-        prompts = ast.literal_eval(content)
-        return prompts
-
-    except FileNotFoundError:
-        print(f"!!! ERRO CRÍTICO: O arquivo de prompts '{filepath}' não foi encontrado.")
-        return {}
-    except Exception as e:
-        print(f"!!! ERRO CRÍTICO: Falha ao ler e processar o arquivo de prompts: {e}")
-        return {}
-
-# Carrega os prompts quando este módulo é importado
-AGENT_PROMPTS = load_prompts_from_file()
+    match = GREETING_HEADER.search(prompt)
+    if not match:
+        return None
+    greeting = match.group(1).strip()
+    if len(greeting) >= 2 and greeting[0] == greeting[-1] == '"':
+        greeting = greeting[1:-1].strip()
+    return greeting or None
+
+
+def extract_greetings(prompts):
+    return {agent_id: extract_greeting(prompt) for agent_id, prompt in prompts.items()}
+
+
+# Carrega os prompts quando este módulo é importado: da versão compilada em cache quando existe,
+# interpretando o arquivo apenas quando o conteúdo mudou (ver prompt_registry.py).
+# Sem arquivo e sem versão compilada, a importação falha em vez de seguir com um dicionário vazio.
+registry = PromptRegistry(
+    PROMPTS_FILE,
+    cache_dir=os.getenv("PROMPTS_CACHE_DIR", ".prompt_cache"),
+    parse=parse_prompts,
+    watch_interval=float(os.getenv("PROMPTS_WATCH_INTERVAL", 2))
+).load()
+
+# Visão sempre atualizada da versão ativa (somente leitura)
+AGENT_PROMPTS = registry.view()
 
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# ===================================================================
+# == REBALANCEAMENTO DOS SHARDS DE CONVERSAS                       ==
+# ===================================================================
+# Depois de acrescentar um shard em STORAGE_SHARDS (e reiniciar os workers com a nova lista), move
+# para o shard certo as conversas cujo usuário passou a pertencer a outro shard no anel.
+# O app continua no ar: conversas ainda não movidas são encontradas no shard antigo, e uma mensagem gravada
+# lá durante a migração segue a conversa (ver ShardedStorage._follow_moved). A varredura final, depois de
+# --grace segundos, só recolhe o que workers ainda com a lista antiga de shards gravaram no shard de origem.
+#
+# Uso:
+#   python rebalance_shards.py --dry-run          # só mostra o que seria movido
+#   python rebalance_shards.py                    # move todas as conversas fora do lugar
+#   python rebalance_shards.py --user <user_id>   # move só as conversas de um usuário
+import argparse
+import os
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from storage import create_storage, ShardedStorage
+from storage.sharding import misplaced_conversations, move_conversation, move_messages
+
+
+def rebalance(sharded, user_id=None, page_size=500, grace=0, dry_run=False):
+    """Move as conversas fora do lugar; devolve (conversas movidas, mensagens movidas, mensagens recolhidas)."""
+    plan = Counter()
+    moved = []
+    messages = 0
+    for row, source, target in misplaced_conversations(sharded, user_id, page_size):
+        plan[(source, target)] += 1
+        if dry_run:
+            continue
+        messages += move_conversation(sharded, row, source, target, page_size)
+        moved.append((row["id"], source, target))
+
+    for (source, target), count in sorted(plan.items()):
+        print(f"  {source} -> {target}: {count} conversa(s)")
+    if dry_run or not moved:
+        return len(moved), messages, 0
+
+    # Workers ainda não reiniciados com a nova lista de shards não conferem as escritas: espera `grace` segundos
+    if grace > 0:
+        print(f">>> Aguardando {grace}s antes da varredura final...")
+        time.sleep(grace)
+    swept = sum(move_messages(sharded.shards[source], sharded.shards[target], conversation_id, page_size, keep_seq=False)
+                for conversation_id, source, target in moved)
+    return len(moved), messages, swept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move conversas para o shard do usuário no anel atual")
+    parser.add_argument("--user", help="só as conversas deste user_id")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--grace", type=float, default=None,
+                        help="espera (s) antes da varredura final (padrão: STORAGE_SHARD_LOCATION_TTL)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    sharded = create_storage(archived=False)
+    if not isinstance(sharded, ShardedStorage):
+        raise SystemExit("!!! Erro: defina STORAGE_SHARDS com a nova lista de shards.")
+    grace = args.grace if args.grace is not None else float(os.getenv("STORAGE_SHARD_LOCATION_TTL", 60))
+
+    started = time.perf_counter()
+    conversations, messages, swept = rebalance(sharded, args.user, args.page_size, grace, args.dry_run)
+    if args.dry_run:
+        print(">>> Simulação: nada foi movido.")
+    else:
+        print(f">>> {conversations} conversa(s) e {messages} mensagem(ns) movidas, {swept} recolhida(s) na varredura "
+              f"final, em {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+class HashingEmbedder:
+    """
+    Embedder local e determinístico: n-gramas de caracteres espalhados por hashing em um vetor fixo.
+    Não depende de rede, então serve para testes e ambientes sem a API de embeddings.
+    """
+
+    def __init__(self, dim=512, ngram=3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            normalized = unicodedata.normalize("NFKD", text.lower())
+            normalized = "".join(c for c in normalized if not unicodedata.combining(c))
+            for word in re.findall(r"\w+", normalized):
+                padded = f" {word} "
+                for i in range(max(len(padded) - self.ngram + 1, 1)):
+                    gram = padded[i:i + self.ngram]
+                    bucket = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+                    vectors[row, bucket % self.dim] += 1.0
+        return _normalize_rows(vectors)
+
+
+class OpenAIEmbedder:
+    """Embeddings da API da OpenAI (`text-embedding-3-small` por padrão)."""
+
+    def __init__(self, client, model="text-embedding-3-small"):
+        self.client = client
+        self.model = model
+
+    def __call__(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return _normalize_rows(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _AgentIndex:
+    # Matriz pré-alocada com as perguntas (linhas normalizadas) e as respostas de um agente, para uma versão dos prompts
+    def __init__(self, capacity, dim, version):
+        self.version = version
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.answers = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.expires_at = np.full(capacity, np.inf)
+        self.size = 0
+
+
+class SemanticCache:
+    """
+    Cache semântico de respostas: um índice vetorial em memória por agente (matriz NumPy),
+    busca por similaridade de cosseno acima de `threshold` e despejo da entrada usada há mais tempo
+    quando o índice de um agente atinge `max_entries`.
+
+    - Cada entrada vale por `ttl` segundos (0 = sem expiração); entradas vencidas não são devolvidas e
+      seus espaços são reaproveitados antes de despejar uma entrada válida.
+    - O índice de um agente pertence a uma versão dos prompts (`version`): uma consulta ou gravação com
+      outra versão descarta o índice, então respostas geradas com um prompt antigo não voltam depois de
+      uma recarga ou de um rollback.
+    `clock` é a fonte de tempo (segundos, monotônica); os testes injetam um relógio controlado.
+    """
+
+    def __init__(self, embedder, threshold=0.92, max_entries=500, ttl=3600, clock=time.monotonic):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._indexes = {}
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _index(self, agent_id, version):
+        # Chamado com self._lock: o índice do agente, ou None se não existir ou for de outra versão dos prompts
+        index = self._indexes.get(agent_id)
+        if index is not None and index.version != version:
+            del self._indexes[agent_id]
+            self.invalidations += 1
+            return None
+        return index
+
+    def embed(self, text):
+        return self.embedder([text])[0]
+
+    def lookup(self, agent_id, query, vector=None, version=None):
+        """Devolve (resposta, similaridade) da pergunta mais parecida acima do limiar, ou (None, melhor similaridade)."""
+        vector = self.embed(query) if vector is None else vector
+        with self._lock:
+            index = self._index(agent_id, version)
+            if index is None or index.size == 0:
+                self.misses += 1
+                return None, 0.0
+            scores = index.vectors[:index.size] @ vector
+            scores[index.expires_at[:index.size] <= self.clock()] = -np.inf
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None, score if np.isfinite(score) else 0.0
+            self._clock += 1
+            index.last_used[best] = self._clock
+            self.hits += 1
+            return index.answers[best], score
+
+    def add(self, agent_id, query, answer, vector=None, version=None):
+        vector = self.embed(query) if vector is None else vector
+        with self._lock:
+            now = self.clock()
+            index = self._index(agent_id, version)
+            if index is None:
+                index = self._indexes[agent_id] = _AgentIndex(self.max_entries, vector.shape[0], version)
+            if index.size < self.max_entries:
+                slot = index.size
+                index.size += 1
+            else:
+                slot = int(np.argmin(index.expires_at))
+                if index.expires_at[slot] > now:
+                    slot = int(np.argmin(index.last_used))
+                    self.evictions += 1
+            self._clock += 1
+            index.vectors[slot] = vector
+            index.answers[slot] = answer
+            index.last_used[slot] = self._clock
+            index.expires_at[slot] = now + self.ttl if self.ttl else np.inf
+
+    def stats(self):
+        with self._lock:
+            return {
+                "agents": len(self._indexes),
+                "entries": sum(index.size for index in self._indexes.values()),
+                "max_entries_per_agent": self.max_entries,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
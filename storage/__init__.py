@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Acesso a conversas e mensagens com backends intercambiáveis, escolhidos por STORAGE_BACKEND:
+
+- supabase (padrão): projeto Supabase em SUPABASE_URL / SUPABASE_SECRET_KEY
+- sqlite: arquivo local em SQLITE_PATH, modo WAL (implantações de um único nó)
+- memory: em memória, para testes e benchmarks
+
+Com STORAGE_READ_REPLICAS (URLs do Supabase ou caminhos SQLite, separados por vírgula), as leituras
+vão para as réplicas e as escritas para o primário, com leia-suas-escritas por conversa (replicas.py).
+
+Com STORAGE_SHARDS ("nome=endpoint,..."), as conversas são distribuídas entre vários backends por
+user_id com hash consistente (sharding.py).
+
+Com ARCHIVE_DIR, as mensagens antigas movidas pelo job de arquivamento (archive_messages.py) para
+segmentos comprimidos continuam aparecendo no histórico, lidas sob demanda (archive.py).
+"""
+import os
+
+from storage.archive import ArchivedStorage, MessageArchive
+from storage.base import Storage
+from storage.memory import MemoryStorage
+from storage.replicas import ReplicatedStorage, SharedWatermarks
+from storage.sharding import ShardedStorage
+from storage.sqlite import SQLiteStorage
+
+BACKENDS = ("supabase", "sqlite", "memory")
+
+
+def create_storage(backend=None, http_transport=None, transport_config=None, archived=True):
+    """
+    Cria o backend configurado. Para o Supabase, reaproveita o pool HTTP compartilhado, se informado.
+    Com `archived=False`, devolve só a camada quente (usado pelas ferramentas de migração e arquivamento).
+    """
+    storage = _create_hot(backend, http_transport, transport_config)
+    archive_dir = os.getenv("ARCHIVE_DIR")
+    if archived and archive_dir:
+        return ArchivedStorage(storage, MessageArchive(archive_dir))
+    return storage
+
+
+def _create_hot(backend, http_transport, transport_config):
+    backend = (backend or os.getenv("STORAGE_BACKEND", "supabase")).lower()
+    replica_endpoints = [endpoint.strip() for endpoint in os.getenv("STORAGE_READ_REPLICAS", "").split(",") if endpoint.strip()]
+
+    shards = shard_endpoints()
+    if shards:
+        if replica_endpoints:
+            raise ValueError("STORAGE_SHARDS e STORAGE_READ_REPLICAS não podem ser usados juntos.")
+        print(f">>> Conversas distribuídas entre {len(shards)} shard(s) de {backend}: {', '.join(shards)}.")
+        return ShardedStorage(
+            {name: _create_backend(backend, endpoint, http_transport, transport_config, key=supabase_key_for(name))
+             for name, endpoint in shards.items()},
+            vnodes=int(os.getenv("STORAGE_SHARD_VNODES", 128)),
+            location_ttl=int(os.getenv("STORAGE_SHARD_LOCATION_TTL", 60))
+        )
+
+    primary = _create_backend(backend, None, http_transport, transport_config)
+    if not replica_endpoints:
+        return primary
+    if backend == "memory":
+        raise ValueError("STORAGE_READ_REPLICAS não se aplica ao backend 'memory'.")
+    replicas = [_create_backend(backend, endpoint, http_transport, transport_config) for endpoint in replica_endpoints]
+    print(f">>> Leituras distribuídas entre {len(replicas)} réplica(s) de {backend}.")
+    max_lag = float(os.getenv("STORAGE_REPLICA_MAX_LAG", 5))
+    # Marcas d'água num arquivo do nó: a escrita de um worker vale para as leituras de todos
+    watermarks_path = os.getenv("STORAGE_REPLICA_WATERMARKS", "data/replica-watermarks.db")
+    watermarks = SharedWatermarks(watermarks_path, ttl=max_lag) if watermarks_path else None
+    return ReplicatedStorage(primary, replicas, max_lag=max_lag, watermarks=watermarks)
+
+
+def shard_endpoints():
+    """STORAGE_SHARDS como {nome: endpoint}, na ordem configurada (vazio sem sharding)."""
+    shards = {}
+    for entry in os.getenv("STORAGE_SHARDS", "").split(","):
+        if entry.strip():
+            name, _, endpoint = entry.partition("=")
+            shards[name.strip()] = endpoint.strip()
+    return shards
+
+
+def supabase_key_for(shard_name):
+    """Chave do projeto do shard: SUPABASE_SECRET_KEY_<NOME>, ou a chave padrão."""
+    return os.getenv(f"SUPABASE_SECRET_KEY_{shard_name.upper()}") or os.getenv("SUPABASE_SECRET_KEY")
+
+
+def _create_backend(backend, endpoint, http_transport, transport_config, key=None):
+    """`endpoint` substitui a URL (Supabase) ou o caminho (SQLite) configurados; usado por réplicas e shards."""
+    if backend == "supabase":
+        from supabase import create_client
+        from storage.supabase import SupabaseStorage
+
+        supabase_url = endpoint or os.getenv("SUPABASE_URL")
+        supabase_key = key or os.getenv("SUPABASE_SECRET_KEY")
+        if not supabase_url or not supabase_key:
+            raise ValueError("As variáveis de ambiente SUPABASE_URL e SUPABASE_SECRET_KEY não foram definidas.")
+        client = create_client(supabase_url, supabase_key)
+        if http_transport is not None:
+            from transport import attach_to_supabase
+            attach_to_supabase(client, http_transport, transport_config)
+        return SupabaseStorage(client)
+
+    if backend == "sqlite":
+        return SQLiteStorage(
+            endpoint or os.getenv("SQLITE_PATH", "data/quantum.db"),
+            busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+        )
+
+    if backend == "memory":
+        return MemoryStorage()
+
+    raise ValueError(f"STORAGE_BACKEND inválido: '{backend}' (use {', '.join(BACKENDS)}).")
+
+
+__all__ = [
+    "Storage", "MemoryStorage", "SQLiteStorage", "ReplicatedStorage", "ShardedStorage", "ArchivedStorage", "MessageArchive",
+    "BACKENDS", "create_storage", "shard_endpoints", "supabase_key_for"
+]
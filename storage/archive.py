@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+from storage.base import Storage
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    conversation_id TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    first_created_at TEXT NOT NULL,
+    first_id TEXT NOT NULL,
+    last_created_at TEXT NOT NULL,
+    last_id TEXT NOT NULL,
+    max_seq INTEGER
+);
+CREATE INDEX IF NOT EXISTS blocks_conversation_order ON blocks (conversation_id, last_created_at, last_id);
+"""
+
+
+def _key(row):
+    return (row["created_at"], row["id"])
+
+
+class MessageArchive:
+    """
+    Camada fria das mensagens: segmentos append-only em `<directory>/segments/` e um índice por conversa
+    em `<directory>/index.db` (SQLite).
+
+    Cada bloco guarda até `block_size` mensagens consecutivas de uma conversa como JSONL comprimido em um
+    membro gzip independente; o índice aponta (segmento, offset, tamanho) e o intervalo (created_at, id)
+    do bloco. Uma leitura descomprime só os blocos de que precisa, e os blocos lidos ficam em cache.
+    Só o job de arquivamento escreve; os workers apenas leem.
+    """
+
+    def __init__(self, directory, segment_max_bytes=64 * 1024 * 1024, cached_blocks=256):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self._segments_dir = os.path.join(directory, "segments")
+        os.makedirs(self._segments_dir, exist_ok=True)
+        self._local = threading.local()
+        self._blocks = TTLCache(max_entries=cached_blocks, ttl=3600)
+        self._segment = None
+        self._lock = threading.Lock()
+        self.block_reads = 0
+        self._index().executescript(INDEX_SCHEMA)
+        # Índices anteriores a `seq`: os blocos antigos ficam sem max_seq e não entram em messages_since
+        if "max_seq" not in [row[1] for row in self._index().execute("PRAGMA table_info(blocks)")]:
+            self._index().execute("ALTER TABLE blocks ADD COLUMN max_seq INTEGER")
+
+    def _index(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(os.path.join(self.directory, "index.db"), isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    # --- Escrita (job de arquivamento) ---
+
+    def _open_segment(self):
+        if self._segment is None or self._segment.tell() >= self.segment_max_bytes:
+            if self._segment is not None:
+                self._segment.close()
+            name = f"segment-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.time_ns() % 1000000:06d}.jsonl.gz"
+            self._segment = open(os.path.join(self._segments_dir, name), "ab")
+        return self._segment
+
+    def append(self, conversation_id, rows):
+        """Acrescenta mensagens (em ordem cronológica, mais novas que as já arquivadas) como um bloco."""
+        payload = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        block = gzip.compress(payload)
+        with self._lock:
+            segment = self._open_segment()
+            offset = segment.tell()
+            segment.write(block)
+            segment.flush()
+            os.fsync(segment.fileno())
+            # O índice só aponta para o bloco depois que ele está em disco
+            self._index().execute(
+                "INSERT INTO blocks (conversation_id, segment, offset, length, count, first_created_at, first_id, "
+                "last_created_at, last_id, max_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, os.path.basename(segment.name), offset, len(block), len(rows),
+                 rows[0]["created_at"], rows[0]["id"], rows[-1]["created_at"], rows[-1]["id"],
+                 max((row["seq"] for row in rows if row.get("seq") is not None), default=None))
+            )
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def forget(self, conversation_id):
+        """Remove a conversa do índice (limpeza do histórico); os bytes ficam nos segmentos, inalcançáveis."""
+        self._index().execute("DELETE FROM blocks WHERE conversation_id = ?", (conversation_id,))
+
+    # --- Leitura ---
+
+    def _block_list(self, conversation_id, order="ASC"):
+        return self._index().execute(
+            "SELECT segment, offset, length, count, first_created_at, first_id, last_created_at, last_id FROM blocks "
+            f"WHERE conversation_id = ? ORDER BY last_created_at {order}, last_id {order}", (conversation_id,)
+        ).fetchall()
+
+    def _read_block(self, segment, offset, length):
+        cache_key = (segment, offset)
+        rows = self._blocks.get(cache_key)
+        if rows is None:
+            with open(os.path.join(self._segments_dir, segment), "rb") as f:
+                f.seek(offset)
+                payload = gzip.decompress(f.read(length))
+            rows = [json.loads(line) for line in payload.decode("utf-8").splitlines()]
+            self._blocks.set(cache_key, rows)
+            with self._lock:
+                self.block_reads += 1
+        return rows
+
+    def last_key(self, conversation_id):
+        row = self._index().execute(
+            "SELECT last_created_at, last_id FROM blocks WHERE conversation_id = ? "
+            "ORDER BY last_created_at DESC, last_id DESC LIMIT 1", (conversation_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def max_seq(self, conversation_id):
+        return self._index().execute("SELECT max(max_seq) FROM blocks WHERE conversation_id = ?", (conversation_id,)).fetchone()[0]
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        """Até `limit` mensagens arquivadas com `seq` maior que `seq`, na ordem de gravação."""
+        blocks = self._index().execute(
+            "SELECT segment, offset, length FROM blocks WHERE conversation_id = ? AND max_seq > ?", (conversation_id, seq)
+        ).fetchall()
+        rows = [row for block in blocks for row in self._read_block(*block) if (row.get("seq") or 0) > seq]
+        return sorted(rows, key=lambda row: row["seq"])[:limit]
+
+    def count(self, conversation_id):
+        return self._index().execute("SELECT coalesce(sum(count), 0) FROM blocks WHERE conversation_id = ?", (conversation_id,)).fetchone()[0]
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        """Até `limit` mensagens arquivadas anteriores a `before`, da mais nova para a mais antiga."""
+        result = []
+        for segment, offset, length, _, first_at, first_id, _, _ in self._block_list(conversation_id, "DESC"):
+            if before is not None and (first_at, first_id) >= tuple(before):
+                continue
+            for row in reversed(self._read_block(segment, offset, length)):
+                if before is None or _key(row) < tuple(before):
+                    result.append(row)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+    def messages_after(self, conversation_id, after, limit=200):
+        """Até `limit` mensagens arquivadas posteriores a `after`, em ordem cronológica."""
+        result = []
+        for segment, offset, length, _, _, _, last_at, last_id in self._block_list(conversation_id):
+            if (last_at, last_id) <= tuple(after):
+                continue
+            for row in self._read_block(segment, offset, length):
+                if _key(row) > tuple(after):
+                    result.append(row)
+                    if len(result) >= limit:
+                        return result
+        return result
+
+    def messages_range(self, conversation_id, start, end):
+        result = []
+        position = 0
+        for segment, offset, length, count, *_ in self._block_list(conversation_id):
+            if position + count > start and position <= end:
+                rows = self._read_block(segment, offset, length)
+                result.extend(rows[max(start - position, 0):end - position + 1])
+            position += count
+            if position > end:
+                break
+        return result
+
+    def stats(self):
+        blocks, conversations = self._index().execute("SELECT count(*), count(DISTINCT conversation_id) FROM blocks").fetchone()
+        return {
+            "directory": self.directory,
+            "segments": len(os.listdir(self._segments_dir)),
+            "blocks": blocks,
+            "conversations": conversations,
+            "block_reads": self.block_reads
+        }
+
+
+class ArchivedStorage(Storage):
+    """
+    Junta a camada quente (`hot`, qualquer backend) e o arquivo: as mensagens arquivadas de uma conversa são
+    sempre as mais antigas, então uma leitura começa pela camada quente e só desce ao arquivo quando ela
+    termina — rolar o histórico até o fim é o que busca páginas arquivadas. Escritas vão para `hot`.
+    """
+
+    name = "archived"
+
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    # --- Conversas (só na camada quente) ---
+
+    def upsert_conversation(self, user_id, agent_id):
+        return self.hot.upsert_conversation(user_id, agent_id)
+
+    def get_conversation(self, conversation_id):
+        return self.hot.get_conversation(conversation_id)
+
+    def find_conversation(self, user_id, agent_id):
+        return self.hot.find_conversation(user_id, agent_id)
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        return self.hot.list_conversations(user_id, after, limit)
+
+    def import_conversation(self, row):
+        return self.hot.import_conversation(row)
+
+    def delete_conversation(self, conversation_id):
+        self.hot.delete_conversation(conversation_id)
+        self.archive.forget(conversation_id)
+
+    def update_conversation(self, conversation_id, fields):
+        self.hot.update_conversation(conversation_id, fields)
+
+    # --- Mensagens ---
+
+    def note_pending_write(self, conversation_id):
+        self.hot.note_pending_write(conversation_id)
+
+    def insert_messages(self, rows):
+        return self.hot.insert_messages(rows)
+
+    def import_messages(self, rows):
+        self.hot.import_messages(rows)
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        rows = self.hot.messages_before(conversation_id, before, limit)
+        if len(rows) >= limit:
+            return rows
+        boundary = _key(rows[-1]) if rows else before
+        return rows + self.archive.messages_before(conversation_id, boundary, limit - len(rows))
+
+    def messages_after(self, conversation_id, after, limit=200):
+        archived = []
+        last_archived = self.archive.last_key(conversation_id)
+        if last_archived is not None and tuple(after) < last_archived:
+            archived = self.archive.messages_after(conversation_id, after, limit)
+            if len(archived) >= limit:
+                return archived
+        return archived + self.hot.messages_after(conversation_id, after, limit - len(archived))
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        # Só um cliente que sincronizou antes do arquivamento dessas mensagens desce ao arquivo
+        archived = self.archive.messages_since(conversation_id, seq, limit) if (self.archive.max_seq(conversation_id) or 0) > seq else []
+        rows = archived + self.hot.messages_since(conversation_id, seq, limit)
+        return sorted(rows, key=lambda row: row["seq"])[:limit]
+
+    def latest_seq(self, conversation_id):
+        seqs = [seq for seq in (self.hot.latest_seq(conversation_id), self.archive.max_seq(conversation_id)) if seq is not None]
+        return max(seqs, default=None)
+
+    def messages_range(self, conversation_id, start, end):
+        archived_count = self.archive.count(conversation_id)
+        rows = self.archive.messages_range(conversation_id, start, end) if start < archived_count else []
+        if end >= archived_count:
+            rows += self.hot.messages_range(conversation_id, max(start - archived_count, 0), end - archived_count)
+        return rows
+
+    def count_messages(self, conversation_id):
+        return self.archive.count(conversation_id) + self.hot.count_messages(conversation_id)
+
+    def delete_messages(self, conversation_id, ids=None):
+        removed = self.hot.delete_messages(conversation_id, ids)
+        if ids is None:
+            removed += self.archive.count(conversation_id)
+            self.archive.forget(conversation_id)
+        return removed
+
+    # --- Operação ---
+
+    def ping(self):
+        return self.hot.ping()
+
+    def stats(self):
+        return {"backend": self.name, "hot": self.hot.stats(), "archive": self.archive.stats()}
+
+# --- Job de arquivamento ---
+
+
+def archive_cutoff(days):
+    """created_at limite (ISO, UTC) para arquivar mensagens com mais de `days` dias."""
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).isoformat(timespec="microseconds")
+
+
+def archive_conversation(hot, archive, conversation_id, cutoff, block_size=200):
+    """
+    Move para o arquivo as mensagens da conversa anteriores a `cutoff`, um bloco por vez: o bloco é gravado
+    e indexado antes de as linhas serem apagadas da camada quente. Se o job for interrompido entre os dois
+    passos, a próxima execução só apaga as linhas que já estão no arquivo. Devolve quantas mensagens moveu.
+    """
+    moved = 0
+    last_archived = archive.last_key(conversation_id)
+    while True:
+        page = hot.messages_range(conversation_id, 0, block_size - 1)
+        eligible = [row for row in page if row["created_at"] < cutoff]
+        if not eligible:
+            return moved
+        fresh = [row for row in eligible if last_archived is None or _key(row) > last_archived]
+        if fresh:
+            archive.append(conversation_id, [
+                {column: row.get(column) for column in ("id", "conversation_id", "role", "content", "created_at", "seq")}
+                for row in fresh
+            ])
+            last_archived = _key(fresh[-1])
+        hot.delete_messages(conversation_id, ids=[row["id"] for row in eligible])
+        moved += len(fresh)
+        if len(eligible) < len(page):
+            return moved
+
+
+def archive_old_messages(hot, archive, cutoff, block_size=200, page_size=500):
+    """Arquiva as mensagens antigas de todas as conversas; devolve (conversas com mensagens movidas, mensagens)."""
+    conversations = messages = 0
+    after = None
+    while True:
+        page = hot.list_conversations(after=after, limit=page_size)
+        if not page:
+            return conversations, messages
+        for row in page:
+            moved = archive_conversation(hot, archive, row["id"], cutoff, block_size)
+            if moved:
+                conversations += 1
+                messages += moved
+        after = page[-1]["id"]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Leituras e escritas do caminho das requisições para o modo assíncrono (asgi_app.py).
+
+- AsyncSupabaseStorage: as mesmas consultas do SupabaseStorage, sobre o cliente assíncrono do Supabase
+  (PostgREST em httpx.AsyncClient): a requisição espera o banco sem ocupar uma thread.
+- ThreadedStorage: qualquer outro backend (SQLite, memória, réplicas, shards, arquivo) com cada chamada
+  executada em uma thread (asyncio.to_thread), mantendo toda a lógica do backend síncrono.
+
+As duas expõem só o que as rotas do asgi_app.py usam; a fila write-behind e o resumo continuam
+gravando pelo backend síncrono, em segundo plano.
+"""
+import asyncio
+import os
+
+from storage.base import _Clock, new_id
+from storage.supabase import SupabaseStorage, _CONVERSATION_COLUMNS, _MESSAGE_COLUMNS
+
+
+class AsyncSupabaseStorage:
+    """Consultas do SupabaseStorage como corrotinas, sobre o cliente de `supabase.acreate_client`."""
+
+    name = "supabase-async"
+
+    def __init__(self, client):
+        self.client = client
+        self._clock = _Clock()
+
+    async def upsert_conversation(self, user_id, agent_id):
+        response = await self.client.table('conversations').upsert({'user_id': user_id, 'agent_id': agent_id}, on_conflict='user_id,agent_id').execute()
+        return response.data[0] if response.data else None
+
+    async def get_conversation(self, conversation_id):
+        response = await self.client.table('conversations').select(_CONVERSATION_COLUMNS).eq('id', conversation_id).execute()
+        return response.data[0] if response.data else None
+
+    async def insert_messages(self, rows):
+        rows = [{column: value for column, value in row.items() if column != 'seq'} for row in rows]
+        rows = [dict(row, id=row.get('id') or new_id(), created_at=row.get('created_at') or self._clock.now()) for row in rows]
+        await self.client.table('messages').upsert(rows, on_conflict='id', ignore_duplicates=True).execute()
+        return rows
+
+    async def messages_before(self, conversation_id, before=None, limit=50):
+        query = self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id)
+        if before:
+            created_at, message_id = before
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{message_id}")')
+        return (await query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute()).data
+
+    async def messages_since(self, conversation_id, seq, limit=200):
+        return (await self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id)
+                .gt('seq', seq).order('seq', desc=False).limit(limit).execute()).data
+
+    async def latest_seq(self, conversation_id):
+        rows = (await self.client.table('messages').select('seq').eq('conversation_id', conversation_id)
+                .order('seq', desc=True).limit(1).execute()).data
+        return rows[0]['seq'] if rows else None
+
+    async def messages_range(self, conversation_id, start, end):
+        return (await self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id)
+                .order('created_at', desc=False).order('id', desc=False).range(start, end).execute()).data
+
+    async def delete_messages(self, conversation_id, ids=None):
+        query = self.client.table('messages').delete().eq('conversation_id', conversation_id)
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return 0
+            query = query.in_('id', ids)
+        return len((await query.execute()).data)
+
+    async def ping(self):
+        await self.client.table('conversations').select('id').limit(1).execute()
+        return True
+
+
+class ThreadedStorage:
+    """Backend síncrono com as mesmas corrotinas do AsyncSupabaseStorage, cada uma em uma thread."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = f"{storage.name}-threaded"
+
+    async def _call(self, method, *args, **kwargs):
+        return await asyncio.to_thread(getattr(self.storage, method), *args, **kwargs)
+
+    async def upsert_conversation(self, user_id, agent_id):
+        return await self._call("upsert_conversation", user_id, agent_id)
+
+    async def get_conversation(self, conversation_id):
+        return await self._call("get_conversation", conversation_id)
+
+    async def insert_messages(self, rows):
+        return await self._call("insert_messages", rows)
+
+    async def messages_before(self, conversation_id, before=None, limit=50):
+        return await self._call("messages_before", conversation_id, before, limit)
+
+    async def messages_since(self, conversation_id, seq, limit=200):
+        return await self._call("messages_since", conversation_id, seq, limit)
+
+    async def latest_seq(self, conversation_id):
+        return await self._call("latest_seq", conversation_id)
+
+    async def messages_range(self, conversation_id, start, end):
+        return await self._call("messages_range", conversation_id, start, end)
+
+    async def delete_messages(self, conversation_id, ids=None):
+        return await self._call("delete_messages", conversation_id, ids)
+
+    async def ping(self):
+        return await self._call("ping")
+
+
+async def create_async_storage(storage, http_transport=None, transport_config=None):
+    """
+    Versão assíncrona de `storage` (o backend síncrono criado por create_storage). Só o Supabase simples tem
+    cliente assíncrono; réplicas, shards e arquivo roteiam as chamadas no próprio backend síncrono.
+    Chamada dentro do loop de eventos (o cliente assíncrono do Supabase é criado nele).
+    """
+    if not isinstance(storage, SupabaseStorage):
+        return ThreadedStorage(storage)
+
+    from supabase import acreate_client
+
+    client = await acreate_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SECRET_KEY"))
+    if http_transport is not None:
+        from transport import attach_to_supabase
+        attach_to_supabase(client, http_transport, transport_config)
+    return AsyncSupabaseStorage(client)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import datetime
+import threading
+import time
+import uuid
+
+
+class Storage:
+    """
+    Contrato de acesso a conversas e mensagens usado pelo app.py e pelo summarizer.py.
+
+    Linhas devolvidas são dicts:
+    - conversa: `id`, `user_id`, `agent_id`, `summary`, `summarized_count`
+    - mensagem: `id`, `conversation_id`, `role`, `content`, `created_at`, `seq`
+
+    A ordem das mensagens é sempre (created_at, id); cursores de paginação são tuplas
+    `(created_at, id)` de uma mensagem já lida (o app.py os codifica para o cliente).
+
+    `seq` é atribuído pelo armazenamento no momento da gravação e cresce na ordem em que as mensagens
+    passam a ser visíveis: o `created_at` vem do enfileiramento em cada worker, então uma mensagem com
+    (created_at, id) menor pode chegar depois de outras. A sincronização incremental usa `seq`.
+    """
+
+    name = "base"
+
+    # --- Conversas ---
+
+    def upsert_conversation(self, user_id, agent_id):
+        """Devolve a conversa do par (usuário, agente), criando-a de forma atômica se não existir."""
+        raise NotImplementedError
+
+    def get_conversation(self, conversation_id):
+        """Devolve a conversa ou None."""
+        raise NotImplementedError
+
+    def find_conversation(self, user_id, agent_id):
+        """Devolve a conversa do par (usuário, agente) sem criá-la, ou None."""
+        raise NotImplementedError
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        """Até `limit` conversas (de um usuário ou de todos) com id maior que `after`, em ordem de id."""
+        raise NotImplementedError
+
+    def import_conversation(self, row):
+        """Grava a conversa mantendo o `id` de origem (migrações); substitui uma linha com o mesmo id."""
+        raise NotImplementedError
+
+    def delete_conversation(self, conversation_id):
+        """Apaga a linha da conversa (as mensagens devem ter sido apagadas ou movidas antes)."""
+        raise NotImplementedError
+
+    def update_conversation(self, conversation_id, fields):
+        """Atualiza colunas da conversa (ex.: `summary`, `summarized_count`)."""
+        raise NotImplementedError
+
+    # --- Mensagens ---
+
+    def insert_messages(self, rows):
+        """
+        Grava várias mensagens de uma vez; `id` e `created_at` são gerados quando ausentes. Idempotente por
+        `id`: linhas cujo id já existe são ignoradas (reenvios do write-behind). Devolve as linhas completas.
+        """
+        raise NotImplementedError
+
+    def note_pending_write(self, conversation_id):
+        """
+        Aviso de que uma mensagem da conversa foi aceita e está na fila write-behind, ainda não gravada.
+        Só interessa a backends com réplicas de leitura; os demais não fazem nada.
+        """
+
+    def import_messages(self, rows):
+        """
+        Grava mensagens com `id`, `created_at` e `seq` de origem, ignorando ids que já existem (migrações);
+        linhas sem `seq` recebem um novo.
+        """
+        raise NotImplementedError
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        """Até `limit` mensagens anteriores ao cursor `before` (ou as últimas), da mais nova para a mais antiga."""
+        raise NotImplementedError
+
+    def messages_after(self, conversation_id, after, limit=200):
+        """Até `limit` mensagens posteriores ao cursor `after`, em ordem cronológica."""
+        raise NotImplementedError
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        """Até `limit` mensagens com `seq` maior que `seq`, na ordem de gravação."""
+        raise NotImplementedError
+
+    def latest_seq(self, conversation_id):
+        """Maior `seq` entre as mensagens da conversa (None se vazia)."""
+        raise NotImplementedError
+
+    def messages_range(self, conversation_id, start, end):
+        """Mensagens da posição `start` até `end` (inclusive), em ordem cronológica."""
+        raise NotImplementedError
+
+    def count_messages(self, conversation_id):
+        raise NotImplementedError
+
+    def delete_messages(self, conversation_id, ids=None):
+        """Apaga as mensagens da conversa (todas, ou só as de `ids`); devolve quantas foram removidas."""
+        raise NotImplementedError
+
+    # --- Operação ---
+
+    def ping(self):
+        """Consulta mínima usada para aquecer e verificar a conexão."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+class _Clock:
+    """`created_at` estritamente crescente no processo (mesmo formato do write_behind.py)."""
+
+    def __init__(self):
+        self._last = None
+        self._lock = threading.Lock()
+
+    def now(self):
+        with self._lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            if self._last is not None and now <= self._last:
+                now = self._last + datetime.timedelta(microseconds=1)
+            self._last = now
+            return now.isoformat(timespec="microseconds")
+
+
+class _Sequence:
+    """
+    Valores de `seq`: microssegundos desde a época, estritamente crescentes. Como vêm do relógio, valores de
+    armazenamentos diferentes são comparáveis: uma conversa movida entre shards mantém os `seq` de origem
+    e as mensagens gravadas depois no destino continuam após eles. Usado sob o lock de escrita do backend.
+    """
+
+    def __init__(self, last=0):
+        self.last = last or 0
+
+    def next(self):
+        self.last = max(self.last + 1, time.time_ns() // 1000)
+        return self.last
+
+    def advance(self, seq):
+        self.last = max(self.last, seq)
+
+
+def new_id():
+    return str(uuid.uuid4())
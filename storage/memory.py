@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+
+from storage.base import Storage, _Clock, _Sequence, new_id
+
+
+def _key(row):
+    return (row["created_at"], row["id"])
+
+
+class MemoryStorage(Storage):
+    """Backend em memória (testes, benchmarks e desenvolvimento local): nada sobrevive ao processo."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._conversations = {}
+        self._by_owner = {}
+        self._messages = {}
+        self._message_ids = set()
+        self._lock = threading.Lock()
+        self._clock = _Clock()
+        self._sequence = _Sequence()
+
+    def upsert_conversation(self, user_id, agent_id):
+        with self._lock:
+            conversation_id = self._by_owner.get((user_id, agent_id))
+            if conversation_id is None:
+                conversation_id = new_id()
+                self._conversations[conversation_id] = {
+                    "id": conversation_id, "user_id": user_id, "agent_id": agent_id,
+                    "summary": None, "summarized_count": 0
+                }
+                self._by_owner[(user_id, agent_id)] = conversation_id
+            return dict(self._conversations[conversation_id])
+
+    def get_conversation(self, conversation_id):
+        with self._lock:
+            row = self._conversations.get(conversation_id)
+            return dict(row) if row else None
+
+    def find_conversation(self, user_id, agent_id):
+        with self._lock:
+            conversation_id = self._by_owner.get((user_id, agent_id))
+            return dict(self._conversations[conversation_id]) if conversation_id else None
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        with self._lock:
+            rows = sorted(
+                (row for row in self._conversations.values()
+                 if (user_id is None or row["user_id"] == user_id) and (after is None or row["id"] > after)),
+                key=lambda row: row["id"]
+            )
+            return [dict(row) for row in rows[:limit]]
+
+    def import_conversation(self, row):
+        row = {column: row.get(column) for column in ("id", "user_id", "agent_id", "summary", "summarized_count")}
+        row["summarized_count"] = row["summarized_count"] or 0
+        with self._lock:
+            self._conversations[row["id"]] = row
+            self._by_owner[(row["user_id"], row["agent_id"])] = row["id"]
+        return dict(row)
+
+    def delete_conversation(self, conversation_id):
+        with self._lock:
+            row = self._conversations.pop(conversation_id, None)
+            if row and self._by_owner.get((row["user_id"], row["agent_id"])) == conversation_id:
+                del self._by_owner[(row["user_id"], row["agent_id"])]
+
+    def update_conversation(self, conversation_id, fields):
+        with self._lock:
+            if conversation_id in self._conversations:
+                self._conversations[conversation_id].update(fields)
+
+    def insert_messages(self, rows):
+        inserted = []
+        with self._lock:
+            for row in rows:
+                row = dict(row)
+                row.setdefault("id", new_id())
+                row.setdefault("created_at", self._clock.now())
+                row.pop("seq", None)
+                if row["id"] not in self._message_ids:
+                    row["seq"] = self._sequence.next()
+                    self._add(row)
+                inserted.append(dict(row))
+        return inserted
+
+    def import_messages(self, rows):
+        with self._lock:
+            for row in rows:
+                if row["id"] not in self._message_ids:
+                    row = dict(row)
+                    if row.get("seq") is None:
+                        row["seq"] = self._sequence.next()
+                    else:
+                        self._sequence.advance(row["seq"])
+                    self._add(row)
+
+    def _add(self, row):
+        messages = self._messages.setdefault(row["conversation_id"], [])
+        # Quase sempre é um append: as mensagens chegam em ordem
+        messages.insert(bisect.bisect_right(messages, _key(row), key=_key), row)
+        self._message_ids.add(row["id"])
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        with self._lock:
+            messages = self._messages.get(conversation_id, [])
+            end = bisect.bisect_left(messages, tuple(before), key=_key) if before else len(messages)
+            return [dict(row) for row in reversed(messages[max(end - limit, 0):end])]
+
+    def messages_after(self, conversation_id, after, limit=200):
+        with self._lock:
+            messages = self._messages.get(conversation_id, [])
+            start = bisect.bisect_right(messages, tuple(after), key=_key)
+            return [dict(row) for row in messages[start:start + limit]]
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        with self._lock:
+            rows = sorted((row for row in self._messages.get(conversation_id, []) if row["seq"] > seq), key=lambda row: row["seq"])
+            return [dict(row) for row in rows[:limit]]
+
+    def latest_seq(self, conversation_id):
+        with self._lock:
+            return max((row["seq"] for row in self._messages.get(conversation_id, [])), default=None)
+
+    def messages_range(self, conversation_id, start, end):
+        with self._lock:
+            return [dict(row) for row in self._messages.get(conversation_id, [])[start:end + 1]]
+
+    def count_messages(self, conversation_id):
+        with self._lock:
+            return len(self._messages.get(conversation_id, []))
+
+    def delete_messages(self, conversation_id, ids=None):
+        with self._lock:
+            messages = self._messages.get(conversation_id, [])
+            if ids is None:
+                removed = messages
+                self._messages.pop(conversation_id, None)
+            else:
+                ids = set(ids)
+                removed = [row for row in messages if row["id"] in ids]
+                self._messages[conversation_id] = [row for row in messages if row["id"] not in ids]
+            self._message_ids.difference_update(row["id"] for row in removed)
+            return len(removed)
+
+    def ping(self):
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "conversations": len(self._conversations),
+                "messages": sum(len(messages) for messages in self._messages.values())
+            }
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+from storage.base import Storage
+
+# Marca de uma escrita que não dá para conferir na réplica (limpeza do histórico, resumo, mensagem ainda na
+# fila write-behind): as leituras ficam no primário até a marca expirar ou até uma gravação de mensagens
+# iniciada depois dela deixar uma posição concreta (a réplica que tem essa posição tem também a escrita anterior).
+_UNVERIFIABLE = "sem-cursor"
+
+WATERMARKS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    conversation_id TEXT PRIMARY KEY,
+    position INTEGER,
+    expires_at REAL NOT NULL,
+    unverifiable_at REAL
+);
+"""
+
+
+def _merge(previous, position, since, now):
+    """
+    Combina a marca anterior com uma nova. Uma marca sem posição guarda quando foi feita: (_UNVERIFIABLE, instante).
+    Uma posição concreta só a substitui se foi obtida por uma gravação iniciada (`since`) depois dela.
+    """
+    if position == _UNVERIFIABLE:
+        return (_UNVERIFIABLE, now)
+    if previous is None:
+        return position
+    if isinstance(previous, tuple):
+        return position if since is not None and previous[1] < since else previous
+    return max(previous, position)
+
+
+class LocalWatermarks:
+    """Marcas d'água visíveis só no próprio processo (testes e implantações de um único worker)."""
+
+    def __init__(self, ttl, max_entries=50000):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def mark(self, conversation_id, position, since=None):
+        with self._lock:
+            self._cache.set(conversation_id, _merge(self._cache.get(conversation_id), position, since, time.time()))
+
+    def get(self, conversation_id):
+        mark = self._cache.get(conversation_id)
+        return _UNVERIFIABLE if isinstance(mark, tuple) else mark
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SharedWatermarks:
+    """
+    Marcas d'água compartilhadas pelos workers do nó: um arquivo SQLite (WAL) com a marca e a validade de
+    cada conversa. Uma mensagem gravada pelo flusher de um worker é vista pelas leituras de todos os outros.
+    A combinação com a marca anterior (as mesmas regras de `_merge`) é feita no próprio upsert, então workers
+    concorrentes não se sobrescrevem.
+    """
+
+    def __init__(self, path, ttl, cleanup_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.cleanup_every = cleanup_every
+        self._local = threading.local()
+        self._marks = itertools.count(1)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connection()
+        connection.executescript(WATERMARKS_SCHEMA)
+        try:
+            # Arquivos criados antes da coluna unverifiable_at
+            connection.execute("ALTER TABLE watermarks ADD COLUMN unverifiable_at REAL")
+        except sqlite3.OperationalError:
+            pass
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # As marcas só valem por `ttl` segundos: perdê-las numa queda do nó não compromete nada
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+        return connection
+
+    def mark(self, conversation_id, position, since=None):
+        now = time.time()
+        unverifiable = position == _UNVERIFIABLE
+        connection = self._connection()
+        # No UPDATE, as colunas de `watermarks` ainda têm os valores anteriores
+        connection.execute(
+            "INSERT INTO watermarks (conversation_id, position, expires_at, unverifiable_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (conversation_id) DO UPDATE SET "
+            "position = CASE WHEN watermarks.expires_at <= ? THEN excluded.position "
+            "WHEN excluded.position IS NULL THEN NULL "
+            "WHEN watermarks.position IS NULL THEN "
+            "CASE WHEN watermarks.unverifiable_at < ? THEN excluded.position ELSE NULL END "
+            "ELSE max(watermarks.position, excluded.position) END, "
+            "unverifiable_at = coalesce(excluded.unverifiable_at, watermarks.unverifiable_at), "
+            "expires_at = excluded.expires_at",
+            (conversation_id, None if unverifiable else position, now + self.ttl, now if unverifiable else None,
+             now, since)
+        )
+        if next(self._marks) % self.cleanup_every == 0:
+            connection.execute("DELETE FROM watermarks WHERE expires_at <= ?", (now,))
+
+    def get(self, conversation_id):
+        row = self._connection().execute(
+            "SELECT position FROM watermarks WHERE conversation_id = ? AND expires_at > ?", (conversation_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return _UNVERIFIABLE if row[0] is None else row[0]
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM watermarks WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+class ReplicatedStorage(Storage):
+    """
+    Escritas vão para o primário; leituras vão para as réplicas (em rodízio), exceto quando a conversa
+    foi escrita há pouco (leia-suas-escritas): por qualquer worker do nó com SharedWatermarks, ou só por
+    este processo com LocalWatermarks.
+
+    Cada escrita deixa uma marca d'água por conversa: o `seq` da última mensagem gravada. Enquanto a marca
+    existe, a leitura confere na réplica o maior `seq` da conversa (consulta de uma linha pelo índice): se a
+    réplica já tem a marca, a leitura vai para ela; se não, vai para o primário. Uma mensagem aceita mas
+    ainda na fila write-behind (`note_pending_write`) marca a conversa desde o enfileiramento, sem posição
+    (leituras no primário); quando o flusher a grava, a posição concreta substitui essa marca. A marca expira
+    depois de `max_lag` segundos, o atraso máximo de replicação esperado. Falhas de uma réplica também
+    caem no primário.
+
+    As marcas ficam em `watermarks`: SharedWatermarks para que todos os workers do nó as vejam, ou, por
+    padrão, LocalWatermarks (só o próprio processo).
+    """
+
+    name = "replicated"
+
+    def __init__(self, primary, replicas, max_lag=5.0, max_tracked=50000, watermarks=None):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self._watermarks = LocalWatermarks(max_lag, max_tracked) if watermarks is None else watermarks
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.replica_reads = 0
+        self.caught_up = 0
+        self.replica_errors = 0
+
+    # --- Marcas d'água ---
+
+    def _mark(self, conversation_id, position=_UNVERIFIABLE, since=None):
+        self._watermarks.mark(conversation_id, _UNVERIFIABLE if position is None else position, since)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _replica(self):
+        return self.replicas[next(self._rotation) % len(self.replicas)]
+
+    @staticmethod
+    def _has_caught_up(replica, conversation_id, watermark):
+        latest = replica.latest_seq(conversation_id)
+        return latest is not None and latest >= watermark
+
+    def _read(self, conversation_id, method, *args, **kwargs):
+        """Executa a leitura na réplica quando ela já tem as escritas recentes da conversa; senão, no primário."""
+        watermark = self._watermarks.get(conversation_id)
+        if watermark != _UNVERIFIABLE:
+            replica = self._replica()
+            try:
+                if watermark is None or self._has_caught_up(replica, conversation_id, watermark):
+                    result = getattr(replica, method)(conversation_id, *args, **kwargs)
+                    self._count("replica_reads")
+                    if watermark is not None:
+                        self._count("caught_up")
+                    return result
+            except Exception as e:
+                self._count("replica_errors")
+                print(f"!!! Erro na réplica de leitura ({method}); usando o primário: {e}")
+        self._count("primary_reads")
+        return getattr(self.primary, method)(conversation_id, *args, **kwargs)
+
+    # --- Conversas ---
+
+    def upsert_conversation(self, user_id, agent_id):
+        return self.primary.upsert_conversation(user_id, agent_id)
+
+    def get_conversation(self, conversation_id):
+        return self._read(conversation_id, "get_conversation")
+
+    # Buscas por dono e listagens servem ao roteamento e às migrações: ficam no primário
+    def find_conversation(self, user_id, agent_id):
+        return self.primary.find_conversation(user_id, agent_id)
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        return self.primary.list_conversations(user_id, after, limit)
+
+    def import_conversation(self, row):
+        imported = self.primary.import_conversation(row)
+        self._mark(row["id"])
+        return imported
+
+    def delete_conversation(self, conversation_id):
+        self.primary.delete_conversation(conversation_id)
+        self._mark(conversation_id)
+
+    def update_conversation(self, conversation_id, fields):
+        self.primary.update_conversation(conversation_id, fields)
+        self._mark(conversation_id)
+
+    # --- Mensagens ---
+
+    def note_pending_write(self, conversation_id):
+        self._mark(conversation_id)
+
+    def insert_messages(self, rows):
+        # Marcas sem posição feitas antes deste instante (ex.: as mensagens do lote ainda na fila) são cobertas
+        # pela posição lida depois da gravação
+        started = time.time()
+        inserted = self.primary.insert_messages(rows)
+        # Chamado pelo flusher, fora do caminho das requisições: uma consulta de uma linha por conversa do lote
+        for conversation_id in {row["conversation_id"] for row in rows}:
+            self._mark(conversation_id, self.primary.latest_seq(conversation_id), started)
+        return inserted
+
+    def import_messages(self, rows):
+        self.primary.import_messages(rows)
+        for conversation_id in {row["conversation_id"] for row in rows}:
+            self._mark(conversation_id)
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        return self._read(conversation_id, "messages_before", before, limit)
+
+    def messages_after(self, conversation_id, after, limit=200):
+        return self._read(conversation_id, "messages_after", after, limit)
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        return self._read(conversation_id, "messages_since", seq, limit)
+
+    def latest_seq(self, conversation_id):
+        return self._read(conversation_id, "latest_seq")
+
+    def messages_range(self, conversation_id, start, end):
+        return self._read(conversation_id, "messages_range", start, end)
+
+    def count_messages(self, conversation_id):
+        return self._read(conversation_id, "count_messages")
+
+    def delete_messages(self, conversation_id, ids=None):
+        removed = self.primary.delete_messages(conversation_id, ids)
+        self._mark(conversation_id)
+        return removed
+
+    # --- Operação ---
+
+    def ping(self):
+        self.primary.ping()
+        for replica in self.replicas:
+            replica.ping()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "primary": self.primary.stats(),
+                "replicas": len(self.replicas),
+                "max_lag": self.max_lag,
+                "shared_watermarks": isinstance(self._watermarks, SharedWatermarks),
+                "tracked_conversations": len(self._watermarks),
+                "primary_reads": self.primary_reads,
+                "replica_reads": self.replica_reads,
+                "caught_up": self.caught_up,
+                "replica_errors": self.replica_errors
+            }
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+import threading
+
+from cache import TTLCache
+from storage.base import Storage
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(str(value).encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Hash consistente: cada shard ocupa `vnodes` pontos do anel, e uma chave pertence ao primeiro ponto
+    depois do seu hash. Ao acrescentar um shard, só ~1/N das chaves mudam de lugar (todas para o novo).
+    """
+
+    def __init__(self, names, vnodes=128):
+        self.names = list(names)
+        self.vnodes = vnodes
+        points = sorted((_hash(f"{name}#{i}"), name) for name in self.names for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def shard_for(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardedStorage(Storage):
+    """
+    Conversas e mensagens distribuídas entre vários backends (ex.: projetos Supabase) por user_id.
+
+    - Conversas novas são criadas no shard do usuário no anel (`HashRing`); as operações por
+      conversation_id descobrem o shard da conversa (consulta em cada shard na primeira vez) e guardam
+      a localização por `location_ttl` segundos.
+    - Durante um rebalanceamento (rebalance_shards.py), a conversa de um usuário ainda pode estar no shard
+      antigo: `upsert_conversation` procura nos demais shards antes de criar.
+    - Escritas em uma conversa fora do shard do usuário (à espera do rebalanceamento) são conferidas depois
+      de gravadas: se a conversa já saiu daquele shard, a localização em cache é descartada e as mensagens
+      recém-gravadas vão atrás dela. Conversas no shard do usuário nunca são movidas e não pagam a conferência.
+    """
+
+    name = "sharded"
+
+    def __init__(self, shards, vnodes=128, location_ttl=60, max_locations=100000):
+        self.shards = dict(shards)
+        self.ring = HashRing(self.shards, vnodes=vnodes)
+        self.location_ttl = location_ttl
+        self._locations = TTLCache(max_entries=max_locations, ttl=location_ttl)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.misplaced = 0
+        self.orphaned_messages = 0
+        self.relocated_messages = 0
+
+    # --- Roteamento ---
+
+    def home_of(self, user_id):
+        """Nome do shard do usuário no anel atual."""
+        return self.ring.shard_for(user_id)
+
+    def _remember(self, row, shard_name):
+        # A localização guarda também se a conversa já está no shard do usuário (e não vai mais mudar)
+        if row:
+            self._locations.set(row["id"], (shard_name, shard_name == self.home_of(row["user_id"])))
+        return row
+
+    def forget(self, conversation_id):
+        self._locations.pop(conversation_id)
+
+    def _location(self, conversation_id):
+        """(nome do shard onde a conversa está, se é o shard do usuário), ou None se nenhum a tem."""
+        location = self._locations.get(conversation_id)
+        if location is not None:
+            return location
+        with self._lock:
+            self.lookups += 1
+        for shard_name, shard in self.shards.items():
+            row = shard.get_conversation(conversation_id)
+            if row:
+                location = (shard_name, shard_name == self.home_of(row["user_id"]))
+                self._locations.set(conversation_id, location)
+                return location
+        return None
+
+    def _locate(self, conversation_id):
+        """Shard onde a conversa está (ou None se nenhum a tem)."""
+        location = self._location(conversation_id)
+        return self.shards[location[0]] if location else None
+
+    def _others(self, shard_name):
+        return [(name, shard) for name, shard in self.shards.items() if name != shard_name]
+
+    # --- Conversas ---
+
+    def find_conversation(self, user_id, agent_id):
+        home = self.home_of(user_id)
+        for shard_name, shard in [(home, self.shards[home])] + self._others(home):
+            row = shard.find_conversation(user_id, agent_id)
+            if row:
+                return self._remember(row, shard_name)
+        return None
+
+    def upsert_conversation(self, user_id, agent_id):
+        row = self.find_conversation(user_id, agent_id)
+        if row:
+            if not self._location(row["id"])[1]:
+                with self._lock:
+                    self.misplaced += 1
+            return row
+        home = self.home_of(user_id)
+        return self._remember(self.shards[home].upsert_conversation(user_id, agent_id), home)
+
+    def get_conversation(self, conversation_id):
+        shard = self._locate(conversation_id)
+        return shard.get_conversation(conversation_id) if shard else None
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        # Cada shard devolve a própria página; a união ordenada por id continua sendo uma página por keyset
+        rows = {}
+        for shard in self.shards.values():
+            for row in shard.list_conversations(user_id, after, limit):
+                rows.setdefault(row["id"], row)
+        return [rows[conversation_id] for conversation_id in sorted(rows)[:limit]]
+
+    def import_conversation(self, row):
+        home = self.home_of(row["user_id"])
+        return self._remember(self.shards[home].import_conversation(row), home)
+
+    def delete_conversation(self, conversation_id):
+        shard = self._locate(conversation_id)
+        if shard:
+            shard.delete_conversation(conversation_id)
+        self.forget(conversation_id)
+
+    def update_conversation(self, conversation_id, fields):
+        shard = self._locate(conversation_id)
+        if shard:
+            shard.update_conversation(conversation_id, fields)
+
+    # --- Mensagens ---
+
+    def _discard_orphans(self, count, conversation_id):
+        with self._lock:
+            self.orphaned_messages += count
+        print(f"!!! AVISO: {count} mensagem(ns) de conversa inexistente descartada(s): {conversation_id}")
+
+    def _group(self, rows):
+        """Agrupa as linhas por shard: {nome: (linhas, conversas fora do shard do usuário)}."""
+        groups = {}
+        for row in rows:
+            location = self._location(row["conversation_id"])
+            if location is None:
+                self._discard_orphans(1, row["conversation_id"])
+                continue
+            shard_rows, unsettled = groups.setdefault(location[0], ([], set()))
+            shard_rows.append(row)
+            if not location[1]:
+                unsettled.add(row["conversation_id"])
+        return groups.items()
+
+    def _follow_moved(self, shard_name, rows, unsettled):
+        """
+        Confere, depois da escrita, se as conversas fora do shard do usuário continuam em `shard_name`. Se o
+        rebalanceamento já as moveu, as mensagens recém-gravadas vão para o shard atual (import idempotente).
+        A escrita vem antes da conferência, e o rebalanceamento varre a origem depois de apagar a conversa,
+        então uma mensagem gravada no shard antigo é sempre levada por um dos dois.
+        """
+        source = self.shards[shard_name]
+        for conversation_id in unsettled:
+            if source.get_conversation(conversation_id):
+                continue
+            self.forget(conversation_id)
+            moved = [row for row in rows if row["conversation_id"] == conversation_id]
+            target = self._locate(conversation_id)
+            if target is None:
+                self._discard_orphans(len(moved), conversation_id)
+            else:
+                # Para o destino, são gravações novas: recebem `seq` de lá, depois do que os clientes já sincronizaram
+                target.import_messages([dict(row, seq=None) for row in moved])
+                with self._lock:
+                    self.relocated_messages += len(moved)
+            source.delete_messages(conversation_id, ids=[row["id"] for row in moved])
+
+    def insert_messages(self, rows):
+        inserted = []
+        for shard_name, (shard_rows, unsettled) in self._group(rows):
+            written = self.shards[shard_name].insert_messages(shard_rows) or ()
+            inserted.extend(written)
+            if unsettled:
+                self._follow_moved(shard_name, written, unsettled)
+        return inserted
+
+    def import_messages(self, rows):
+        for shard_name, (shard_rows, unsettled) in self._group(rows):
+            self.shards[shard_name].import_messages(shard_rows)
+            if unsettled:
+                self._follow_moved(shard_name, shard_rows, unsettled)
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        shard = self._locate(conversation_id)
+        return shard.messages_before(conversation_id, before, limit) if shard else []
+
+    def messages_after(self, conversation_id, after, limit=200):
+        shard = self._locate(conversation_id)
+        return shard.messages_after(conversation_id, after, limit) if shard else []
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        shard = self._locate(conversation_id)
+        return shard.messages_since(conversation_id, seq, limit) if shard else []
+
+    def latest_seq(self, conversation_id):
+        shard = self._locate(conversation_id)
+        return shard.latest_seq(conversation_id) if shard else None
+
+    def messages_range(self, conversation_id, start, end):
+        shard = self._locate(conversation_id)
+        return shard.messages_range(conversation_id, start, end) if shard else []
+
+    def count_messages(self, conversation_id):
+        shard = self._locate(conversation_id)
+        return shard.count_messages(conversation_id) if shard else 0
+
+    def delete_messages(self, conversation_id, ids=None):
+        shard = self._locate(conversation_id)
+        return shard.delete_messages(conversation_id, ids) if shard else 0
+
+    # --- Operação ---
+
+    def ping(self):
+        for shard in self.shards.values():
+            shard.ping()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "shards": {name: shard.stats() for name, shard in self.shards.items()},
+                "vnodes": self.ring.vnodes,
+                "cached_locations": len(self._locations),
+                "lookups": self.lookups,
+                "misplaced": self.misplaced,
+                "orphaned_messages": self.orphaned_messages,
+                "relocated_messages": self.relocated_messages
+            }
+
+# --- Rebalanceamento ---
+
+
+def misplaced_conversations(sharded, user_id=None, page_size=500):
+    """Gera (conversa, shard atual, shard de destino) para as conversas fora do shard do usuário no anel."""
+    for shard_name, shard in sharded.shards.items():
+        after = None
+        while True:
+            page = shard.list_conversations(user_id, after, page_size)
+            if not page:
+                break
+            for row in page:
+                target = sharded.home_of(row["user_id"])
+                if target != shard_name:
+                    yield row, shard_name, target
+            after = page[-1]["id"]
+
+
+def move_messages(source, target, conversation_id, page_size=500, keep_seq=True):
+    """
+    Move as mensagens da conversa em páginas (copia mantendo ids e depois apaga na origem). Nas varreduras
+    depois da troca de shard, `keep_seq=False`: as mensagens atrasadas recebem `seq` novo no destino.
+    """
+    moved = 0
+    while True:
+        page = source.messages_range(conversation_id, 0, page_size - 1)
+        if not page:
+            return moved
+        target.import_messages(page if keep_seq else [dict(row, seq=None) for row in page])
+        source.delete_messages(conversation_id, ids=[row["id"] for row in page])
+        moved += len(page)
+
+
+def move_conversation(sharded, row, source_name, target_name, page_size=500):
+    """
+    Move uma conversa para o shard de destino: a linha da conversa (mesmo id) é copiada primeiro, as
+    mensagens vêm em seguida e a conversa é apagada na origem. Uma última varredura, depois de apagar,
+    leva as mensagens que chegaram à origem no meio tempo (ver `ShardedStorage._follow_moved`).
+    Devolve quantas mensagens moveu. Cada passo é idempotente: uma execução interrompida pode ser repetida.
+    """
+    source, target = sharded.shards[source_name], sharded.shards[target_name]
+    target.import_conversation(row)
+    moved = move_messages(source, target, row["id"], page_size)
+    source.delete_conversation(row["id"])
+    sharded.forget(row["id"])
+    return moved + move_messages(source, target, row["id"], page_size, keep_seq=False)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+
+from storage.base import Storage, _Clock, _Sequence, new_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    summary TEXT,
+    summarized_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS conversations_user_agent_key ON conversations (user_id, agent_id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    seq INTEGER
+);
+-- Atende todas as leituras de mensagens: filtro por conversa + ordem/cursor (created_at, id)
+CREATE INDEX IF NOT EXISTS messages_conversation_order ON messages (conversation_id, created_at, id);
+
+-- Último `seq` atribuído (compartilhado pelos processos que abrem o arquivo)
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_CONVERSATION_COLUMNS = "id, user_id, agent_id, summary, summarized_count"
+_MESSAGE_COLUMNS = "id, conversation_id, role, content, created_at, seq"
+_UPDATABLE = ("summary", "summarized_count")
+
+
+class SQLiteStorage(Storage):
+    """
+    Backend SQLite para implantações de um único nó, sem rede no caminho das consultas.
+
+    O banco roda em modo WAL (leitores não bloqueiam o escritor, e vários workers do gunicorn podem
+    abrir o mesmo arquivo), com `synchronous=NORMAL` e `busy_timeout` para esperar pelo lock de escrita
+    em vez de falhar. Cada thread usa a própria conexão.
+
+    O `seq` das mensagens é atribuído dentro da transação de escrita (BEGIN IMMEDIATE): com um único
+    escritor por vez, a ordem de `seq` é exatamente a ordem dos commits.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._clock = _Clock()
+        self._connections = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.connection = connection
+            with self._lock:
+                self._connections += 1
+        return connection
+
+    def _migrate(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Bancos anteriores à coluna `seq`: as mensagens existentes ficam na ordem em que foram gravadas (rowid)
+            if "seq" not in [row[1] for row in connection.execute("PRAGMA table_info(messages)")]:
+                connection.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+                connection.execute("UPDATE messages SET seq = rowid")
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_conversation_seq ON messages (conversation_id, seq)")
+            connection.execute(
+                "INSERT OR IGNORE INTO sequences (name, value) SELECT 'messages', coalesce(max(seq), 0) FROM messages"
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    # --- Conversas ---
+
+    def upsert_conversation(self, user_id, agent_id):
+        connection = self._connection()
+        connection.execute(
+            "INSERT INTO conversations (id, user_id, agent_id, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id, agent_id) DO NOTHING",
+            (new_id(), user_id, agent_id, self._clock.now())
+        )
+        rows = self._query(f"SELECT {_CONVERSATION_COLUMNS} FROM conversations WHERE user_id = ? AND agent_id = ?", (user_id, agent_id))
+        return rows[0] if rows else None
+
+    def get_conversation(self, conversation_id):
+        rows = self._query(f"SELECT {_CONVERSATION_COLUMNS} FROM conversations WHERE id = ?", (conversation_id,))
+        return rows[0] if rows else None
+
+    def find_conversation(self, user_id, agent_id):
+        rows = self._query(f"SELECT {_CONVERSATION_COLUMNS} FROM conversations WHERE user_id = ? AND agent_id = ?", (user_id, agent_id))
+        return rows[0] if rows else None
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return self._query(f"SELECT {_CONVERSATION_COLUMNS} FROM conversations {where}ORDER BY id LIMIT ?", params + [limit])
+
+    def import_conversation(self, row):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO conversations (id, user_id, agent_id, summary, summarized_count, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (row["id"], row["user_id"], row["agent_id"], row.get("summary"), row.get("summarized_count") or 0, self._clock.now())
+        )
+        return self.get_conversation(row["id"])
+
+    def delete_conversation(self, conversation_id):
+        self._connection().execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def update_conversation(self, conversation_id, fields):
+        columns = [column for column in fields if column in _UPDATABLE]
+        if not columns:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        self._connection().execute(
+            f"UPDATE conversations SET {assignments} WHERE id = ?",
+            [fields[column] for column in columns] + [conversation_id]
+        )
+
+    # --- Mensagens ---
+
+    def insert_messages(self, rows):
+        rows = [dict(row, id=row.get("id") or new_id(), created_at=row.get("created_at") or self._clock.now()) for row in rows]
+        self._write_messages(rows, keep_seq=False)
+        return [{column: value for column, value in row.items() if column != "seq"} for row in rows]
+
+    def import_messages(self, rows):
+        self._write_messages(rows, keep_seq=True)
+
+    def _write_messages(self, rows, keep_seq):
+        connection = self._connection()
+        # Uma única transação por lote: um fsync do WAL para todas as linhas
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            sequence = _Sequence(connection.execute("SELECT value FROM sequences WHERE name = 'messages'").fetchone()[0])
+            values = []
+            for row in rows:
+                seq = row.get("seq") if keep_seq else None
+                if seq is None:
+                    seq = sequence.next()
+                else:
+                    sequence.advance(seq)
+                values.append((row["id"], row["conversation_id"], row["role"], row["content"], row["created_at"], seq))
+            connection.executemany(
+                "INSERT OR IGNORE INTO messages (id, conversation_id, role, content, created_at, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                values
+            )
+            connection.execute("UPDATE sequences SET value = ? WHERE name = 'messages'", (sequence.last,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        if before:
+            return self._query(
+                f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?",
+                (conversation_id, before[0], before[1], limit)
+            )
+        return self._query(
+            f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (conversation_id, limit)
+        )
+
+    def messages_after(self, conversation_id, after, limit=200):
+        return self._query(
+            f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND (created_at, id) > (?, ?) "
+            "ORDER BY created_at, id LIMIT ?",
+            (conversation_id, after[0], after[1], limit)
+        )
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        return self._query(
+            f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (conversation_id, seq, limit)
+        )
+
+    def latest_seq(self, conversation_id):
+        return self._connection().execute("SELECT max(seq) FROM messages WHERE conversation_id = ?", (conversation_id,)).fetchone()[0]
+
+    def messages_range(self, conversation_id, start, end):
+        return self._query(
+            f"SELECT {_MESSAGE_COLUMNS} FROM messages WHERE conversation_id = ? ORDER BY created_at, id LIMIT ? OFFSET ?",
+            (conversation_id, max(end - start + 1, 0), start)
+        )
+
+    def count_messages(self, conversation_id):
+        return self._connection().execute("SELECT count(*) FROM messages WHERE conversation_id = ?", (conversation_id,)).fetchone()[0]
+
+    def delete_messages(self, conversation_id, ids=None):
+        if ids is None:
+            return self._connection().execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,)).rowcount
+        ids = list(ids)
+        if not ids:
+            return 0
+        placeholders = ", ".join("?" * len(ids))
+        return self._connection().execute(
+            f"DELETE FROM messages WHERE conversation_id = ? AND id IN ({placeholders})", [conversation_id] + ids
+        ).rowcount
+
+    def ping(self):
+        self._connection().execute("SELECT 1").fetchone()
+        return True
+
+    def stats(self):
+        return {"backend": self.name, "path": self.path, "connections": self._connections}
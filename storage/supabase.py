@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from storage.base import Storage, _Clock, new_id
+
+_CONVERSATION_COLUMNS = "id, user_id, agent_id, summary, summarized_count"
+_MESSAGE_COLUMNS = "id, conversation_id, role, content, created_at, seq"
+
+
+class SupabaseStorage(Storage):
+    """
+    Backend padrão: tabelas `conversations` e `messages` de um projeto Supabase (PostgREST).
+    O `seq` das mensagens é uma coluna identity do Postgres (ver "Esquema do Supabase" no README).
+    """
+
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+        self._clock = _Clock()
+
+    # --- Conversas ---
+
+    def upsert_conversation(self, user_id, agent_id):
+        # Um único upsert atômico (on_conflict em user_id, agent_id): sem conversas duplicadas
+        response = self.client.table('conversations').upsert({'user_id': user_id, 'agent_id': agent_id}, on_conflict='user_id,agent_id').execute()
+        return response.data[0] if response.data else None
+
+    def get_conversation(self, conversation_id):
+        response = self.client.table('conversations').select(_CONVERSATION_COLUMNS).eq('id', conversation_id).execute()
+        return response.data[0] if response.data else None
+
+    def find_conversation(self, user_id, agent_id):
+        response = self.client.table('conversations').select(_CONVERSATION_COLUMNS).eq('user_id', user_id).eq('agent_id', agent_id).execute()
+        return response.data[0] if response.data else None
+
+    def list_conversations(self, user_id=None, after=None, limit=100):
+        query = self.client.table('conversations').select(_CONVERSATION_COLUMNS)
+        if user_id is not None:
+            query = query.eq('user_id', user_id)
+        if after is not None:
+            query = query.gt('id', after)
+        return query.order('id', desc=False).limit(limit).execute().data
+
+    def import_conversation(self, row):
+        fields = {column: row.get(column) for column in ('id', 'user_id', 'agent_id', 'summary', 'summarized_count')}
+        fields['summarized_count'] = fields['summarized_count'] or 0
+        response = self.client.table('conversations').upsert(fields, on_conflict='id').execute()
+        return response.data[0] if response.data else None
+
+    def delete_conversation(self, conversation_id):
+        self.client.table('conversations').delete().eq('id', conversation_id).execute()
+
+    def update_conversation(self, conversation_id, fields):
+        self.client.table('conversations').update(fields).eq('id', conversation_id).execute()
+
+    # --- Mensagens ---
+
+    def insert_messages(self, rows):
+        # Upsert por id ignorando repetidos: um lote reenviado não duplica mensagens
+        rows = [{column: value for column, value in row.items() if column != 'seq'} for row in rows]
+        rows = [dict(row, id=row.get('id') or new_id(), created_at=row.get('created_at') or self._clock.now()) for row in rows]
+        self.client.table('messages').upsert(rows, on_conflict='id', ignore_duplicates=True).execute()
+        return rows
+
+    def import_messages(self, rows):
+        fields = [{column: row[column] for column in ('id', 'conversation_id', 'role', 'content', 'created_at')} for row in rows]
+        # Linhas com `seq` de origem o mantêm; as demais recebem um novo (o default da coluna identity)
+        with_seq = [dict(field, seq=row['seq']) for field, row in zip(fields, rows) if row.get('seq') is not None]
+        without_seq = [field for field, row in zip(fields, rows) if row.get('seq') is None]
+        for batch in (with_seq, without_seq):
+            if batch:
+                self.client.table('messages').upsert(batch, on_conflict='id', ignore_duplicates=True).execute()
+
+    def messages_before(self, conversation_id, before=None, limit=50):
+        query = self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id)
+        if before:
+            created_at, message_id = before
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{message_id}")')
+        return query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute().data
+
+    def messages_after(self, conversation_id, after, limit=200):
+        created_at, message_id = after
+        return self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id) \
+            .or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{message_id}")') \
+            .order('created_at', desc=False).order('id', desc=False).limit(limit).execute().data
+
+    def messages_since(self, conversation_id, seq, limit=200):
+        return self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id) \
+            .gt('seq', seq).order('seq', desc=False).limit(limit).execute().data
+
+    def latest_seq(self, conversation_id):
+        rows = self.client.table('messages').select('seq').eq('conversation_id', conversation_id) \
+            .order('seq', desc=True).limit(1).execute().data
+        return rows[0]['seq'] if rows else None
+
+    def messages_range(self, conversation_id, start, end):
+        return self.client.table('messages').select(_MESSAGE_COLUMNS).eq('conversation_id', conversation_id) \
+            .order('created_at', desc=False).order('id', desc=False).range(start, end).execute().data
+
+    def count_messages(self, conversation_id):
+        response = self.client.table('messages').select('id', count='exact').eq('conversation_id', conversation_id).limit(1).execute()
+        return response.count or 0
+
+    def delete_messages(self, conversation_id, ids=None):
+        query = self.client.table('messages').delete().eq('conversation_id', conversation_id)
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return 0
+            query = query.in_('id', ids)
+        return len(query.execute().data)
+
+    def ping(self):
+        self.client.table('conversations').select('id').limit(1).execute()
+        return True
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Backends locais para os testes (tests/test_storage_*.py) e para o benchmark_storage.py: primário com réplica
+atrasada, shards e arquivo sobre MemoryStorage, sem rede nem dados fora de `directory`.
+"""
+import os
+import threading
+
+from storage.archive import ArchivedStorage, MessageArchive
+from storage.memory import MemoryStorage
+from storage.replicas import ReplicatedStorage, SharedWatermarks
+from storage.sharding import ShardedStorage
+
+
+def make_messages(conversation_id, count, prefix="m"):
+    """`count` mensagens alternando user/assistant, com conteúdo "<prefix>0", "<prefix>1", ..."""
+    return [{"conversation_id": conversation_id, "role": "user" if i % 2 == 0 else "assistant", "content": f"{prefix}{i}"}
+            for i in range(count)]
+
+
+class LaggedPrimary(MemoryStorage):
+    """Primário em memória que replica as mensagens para `replica` com `lag` segundos de atraso."""
+
+    def __init__(self, replica, lag):
+        super().__init__()
+        self.replica = replica
+        self.lag = lag
+
+    def _later(self, fn, *args):
+        timer = threading.Timer(self.lag, fn, args)
+        timer.daemon = True
+        timer.start()
+
+    def insert_messages(self, rows):
+        inserted = super().insert_messages(rows)
+        # Como na replicação do Postgres, a réplica recebe as linhas com o mesmo `seq`
+        self._later(self.replica.import_messages, inserted)
+        return inserted
+
+    def import_messages(self, rows):
+        super().import_messages(rows)
+        self._later(self.replica.import_messages, rows)
+
+    def delete_messages(self, conversation_id, ids=None):
+        removed = super().delete_messages(conversation_id, ids)
+        self._later(self.replica.delete_messages, conversation_id, ids)
+        return removed
+
+
+def create_replicated(lag, directory):
+    replica = MemoryStorage()
+    max_lag = max(lag * 4, 1.0)
+    watermarks = SharedWatermarks(os.path.join(directory, "replica-watermarks.db"), ttl=max_lag)
+    return ReplicatedStorage(LaggedPrimary(replica, lag), [replica], max_lag=max_lag, watermarks=watermarks)
+
+
+def create_sharded(count):
+    return ShardedStorage({f"shard{i}": MemoryStorage() for i in range(count)})
+
+
+def create_archived(directory):
+    return ArchivedStorage(MemoryStorage(), MessageArchive(os.path.join(directory, "archive")))
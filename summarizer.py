@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+SUMMARY_INSTRUCTION = (
+    "Você mantém o resumo de uma conversa entre um usuário e um mentor. "
+    "Atualize o resumo existente incorporando as novas mensagens. "
+    "Preserve fatos sobre o usuário, objetivos, decisões e compromissos assumidos. "
+    "Escreva em português, em no máximo 12 frases."
+)
+
+# Posição da última mensagem resumida ainda não consultada no armazenamento
+_UNKNOWN = object()
+
+
+class ConversationSummarizer:
+    """
+    Mantém um resumo acumulado das mensagens antigas de cada conversa, gravado na própria
+    linha de 'conversations' (colunas `summary` e `summarized_count`).
+
+    A cada `every` mensagens novas gravadas (contadas depois do flush da fila write-behind), um worker em
+    segundo plano incorpora ao resumo as mensagens que ficaram mais antigas que as últimas `keep_recent`,
+    sem bloquear nenhuma requisição. Um histórico longo (ex.: o primeiro resumo de uma conversa antiga) é
+    incorporado em blocos de até `fold_chunk` mensagens e `max_chunk_chars` caracteres por chamada.
+
+    O prompt usa o resumo + apenas as mensagens posteriores à última resumida: `get_summary` devolve
+    também o (created_at, id) dessa mensagem, para que o histórico recente não repita o que o resumo cobre.
+    """
+
+    def __init__(self, client, storage, model, every=20, keep_recent=30, fold_chunk=100, max_chunk_chars=24000,
+                 max_cached=10000):
+        self.client = client
+        self.storage = storage
+        self.model = model
+        self.every = every
+        self.keep_recent = keep_recent
+        self.fold_chunk = fold_chunk
+        self.max_chunk_chars = max_chunk_chars
+        self.max_cached = max_cached
+        self._summaries = OrderedDict()
+        self._new_messages = {}
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+    # --- Leitura (caminho da requisição) ---
+
+    def remember(self, conversation_id, summary, summarized_count=0, until=_UNKNOWN):
+        """Guarda em cache o resumo lido junto com a linha da conversa."""
+        with self._lock:
+            self._summaries[conversation_id] = (summary, summarized_count or 0, until)
+            self._summaries.move_to_end(conversation_id)
+            while len(self._summaries) > self.max_cached:
+                self._summaries.popitem(last=False)
+
+    def get_summary(self, conversation_id):
+        """
+        Devolve (resumo ou None, (created_at, id) da última mensagem resumida ou None), consultando o
+        armazenamento apenas em cache miss.
+        """
+        with self._lock:
+            cached = self._summaries.get(conversation_id)
+        if cached is None:
+            row = self.storage.get_conversation(conversation_id) or {}
+            cached = (row.get('summary'), row.get('summarized_count') or 0, _UNKNOWN)
+            self.remember(conversation_id, *cached)
+
+        summary, summarized_count, until = cached
+        if until is _UNKNOWN:
+            until = None
+            if summary and summarized_count:
+                last = self.storage.messages_range(conversation_id, summarized_count - 1, summarized_count - 1)
+                until = (last[0]['created_at'], last[0]['id']) if last else None
+            with self._lock:
+                # Só completa a entrada se o resumo não mudou enquanto a posição era consultada
+                if self._summaries.get(conversation_id, (None, None, None))[1] == summarized_count:
+                    self._summaries[conversation_id] = (summary, summarized_count, until)
+        return summary, until
+
+    # --- Escrita (segundo plano) ---
+
+    def note_messages(self, rows):
+        """
+        Conta as mensagens de um lote já gravado no armazenamento (chamado pela fila write-behind depois
+        de cada flush) e agenda o resumo das conversas que atingiram o limite.
+        """
+        due = []
+        with self._lock:
+            for row in rows:
+                conversation_id = row['conversation_id']
+                count = self._new_messages.get(conversation_id, 0) + 1
+                if count < self.every or conversation_id in self._scheduled:
+                    self._new_messages[conversation_id] = count
+                    continue
+                self._new_messages[conversation_id] = 0
+                self._scheduled.add(conversation_id)
+                due.append(conversation_id)
+        for conversation_id in due:
+            self._executor.submit(self._summarize, conversation_id)
+
+    def reset(self, conversation_id):
+        """Apaga o resumo da conversa (usado quando o histórico é limpo)."""
+        self.storage.update_conversation(conversation_id, {'summary': None, 'summarized_count': 0})
+        with self._lock:
+            self._new_messages.pop(conversation_id, None)
+        self.remember(conversation_id, None, 0, None)
+
+    def _next_chunk(self, conversation_id, start, end):
+        """Próximo bloco a resumir, das posições [start, end): até `fold_chunk` mensagens e `max_chunk_chars` caracteres."""
+        rows = self.storage.messages_range(conversation_id, start, min(end, start + self.fold_chunk) - 1)
+        chunk, size = [], 0
+        for row in rows:
+            size += len(row['content'])
+            if chunk and size > self.max_chunk_chars:
+                break
+            chunk.append(row)
+        return chunk
+
+    def _fold(self, summary, messages):
+        # Uma mensagem maior que o bloco inteiro entra truncada
+        transcript = "\n".join(f"{message['role']}: {message['content'][:self.max_chunk_chars]}" for message in messages)
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": f"Resumo atual:\n{summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"}
+            ],
+            max_tokens=400,
+            temperature=0.2
+        )
+        return completion.choices[0].message.content
+
+    def _summarize(self, conversation_id):
+        try:
+            row = self.storage.get_conversation(conversation_id)
+            if not row:
+                return
+            summary = row.get('summary')
+            summarized_count = row.get('summarized_count') or 0
+            fold_until = self.storage.count_messages(conversation_id) - self.keep_recent
+
+            # Cada bloco é gravado assim que resumido: uma falha no meio preserva o progresso
+            while fold_until > summarized_count:
+                pending = self._next_chunk(conversation_id, summarized_count, fold_until)
+                if not pending:
+                    break
+                summary = self._fold(summary, pending)
+                summarized_count += len(pending)
+                self.storage.update_conversation(conversation_id, {'summary': summary, 'summarized_count': summarized_count})
+                self.remember(conversation_id, summary, summarized_count, (pending[-1]['created_at'], pending[-1]['id']))
+                print(f">>> Resumo da conversa {conversation_id} atualizado ({summarized_count} mensagens resumidas).")
+
+        except Exception as e:
+            print(f"!!! Erro ao resumir a conversa {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(conversation_id)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+class InvalidToken(ValueError):
+    """Token ausente, malformado, com assinatura inválida ou expirado."""
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def token_subject(token, secret, now=None):
+    """
+    Confere um access token do Supabase Auth (JWT HS256 assinado com o JWT secret do projeto) e devolve
+    o `sub` (id do usuário). Levanta InvalidToken se a assinatura não bater, se o algoritmo não for
+    HS256, se o token tiver expirado ou se não tiver `sub`.
+    """
+    if not secret or not token:
+        raise InvalidToken("token ausente")
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        payload = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+    except (ValueError, TypeError):
+        raise InvalidToken("token malformado")
+    if not isinstance(header, dict) or header.get("alg") != "HS256" or not isinstance(payload, dict):
+        raise InvalidToken("algoritmo não suportado")
+
+    expected = hmac.new(secret.encode("utf-8"), f"{header_b64}.{payload_b64}".encode("ascii"), hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidToken("assinatura inválida")
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)) or exp <= (time.time() if now is None else now):
+        raise InvalidToken("token expirado")
+    subject = payload.get("sub")
+    if not isinstance(subject, str) or not subject:
+        raise InvalidToken("token sem sub")
+    return subject
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import uuid
+
+import pytest
+
+# Os módulos do app ficam na raiz do repositório (sem pacote instalável)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import SQLiteStorage, MemoryStorage, create_storage  # noqa: E402
+from storage.testing import create_archived, create_replicated, create_sharded  # noqa: E402
+
+REPLICA_LAG = 0.2
+
+# O supabase só entra com STORAGE_TEST_SUPABASE=1: usa o projeto do .env (cria e apaga dados de teste)
+STORAGE_BACKENDS = ["memory", "sqlite", "replicated", "sharded", "archived", pytest.param("supabase", marks=pytest.mark.skipif(
+    os.getenv("STORAGE_TEST_SUPABASE") != "1", reason="defina STORAGE_TEST_SUPABASE=1 para testar o projeto do .env"))]
+
+
+def make_storage(backend, directory):
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(os.path.join(directory, "quantum.db"))
+    if backend == "replicated":
+        return create_replicated(REPLICA_LAG, directory)
+    if backend == "sharded":
+        return create_sharded(3)
+    if backend == "archived":
+        return create_archived(directory)
+    # Projeto do .env, sem a camada de arquivo: ARCHIVE_DIR não entra no teste
+    from dotenv import load_dotenv
+    load_dotenv()
+    return create_storage(backend, archived=False)
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def storage(request, tmp_path):
+    return make_storage(request.param, str(tmp_path))
+
+
+@pytest.fixture
+def user():
+    # Único por teste: no supabase, os dados de execuções anteriores continuam no projeto
+    return f"contrato-{uuid.uuid4().hex[:12]}"
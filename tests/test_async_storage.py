@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import uuid
+
+from storage.async_storage import create_async_storage
+from storage.testing import make_messages
+
+
+async def _exercise(storage, user):
+    async_storage = await create_async_storage(storage)
+    conversation = await async_storage.upsert_conversation(user, "agente")
+    assert (await async_storage.upsert_conversation(user, "agente"))["id"] == conversation["id"]
+    conversation_id = conversation["id"]
+    assert await async_storage.get_conversation(str(uuid.uuid4())) is None
+    assert await async_storage.latest_seq(conversation_id) is None
+
+    inserted = await async_storage.insert_messages(make_messages(conversation_id, 5))
+    assert (await async_storage.get_conversation(conversation_id))["user_id"] == user
+    await async_storage.insert_messages(inserted[3:])
+    latest = await async_storage.messages_before(conversation_id, limit=2)
+    assert [row["content"] for row in latest] == ["m4", "m3"], "messages_before: da mais nova para a mais antiga"
+    older = await async_storage.messages_before(conversation_id, (latest[-1]["created_at"], latest[-1]["id"]), limit=10)
+    assert [row["content"] for row in older] == ["m2", "m1", "m0"], "insert_messages é idempotente por id"
+
+    seq = older[0]["seq"]
+    assert [row["content"] for row in await async_storage.messages_since(conversation_id, seq)] == ["m3", "m4"]
+    assert await async_storage.latest_seq(conversation_id) == latest[0]["seq"]
+    assert [row["content"] for row in await async_storage.messages_range(conversation_id, 1, 2)] == ["m1", "m2"]
+
+    assert await async_storage.delete_messages(conversation_id, []) == 0
+    assert await async_storage.delete_messages(conversation_id, [latest[0]["id"]]) == 1
+    assert await async_storage.delete_messages(conversation_id) == 4
+    assert await async_storage.ping()
+
+
+def test_async_storage(storage, user):
+    # Mesmas respostas do backend síncrono, pelo cliente assíncrono (supabase) ou em threads (demais)
+    asyncio.run(_exercise(storage, user))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+
+from batch import BatchRunner
+
+
+def _read_all(runner, job_id, offset=0):
+    """Lê os resultados de um job como o cliente faria: repetindo com o próximo offset até terminar."""
+    results = []
+    while True:
+        lines, offset, status, finished = runner.read_results(job_id, offset)
+        results.extend(json.loads(line) for line in lines.splitlines())
+        if finished:
+            return results, offset, status
+
+
+def test_read_results_returns_only_what_is_written_and_resumes_from_offset(tmp_path):
+    release = threading.Event()
+
+    def run_item(item):
+        if item["q"] == "lento":
+            release.wait(5)
+        return {"answer": item["q"]}
+
+    runner = BatchRunner(run_item, str(tmp_path), max_workers=2, max_read_bytes=40)
+    job_id = runner.submit_job([{"q": "x" * 60}, {"q": "lento"}])
+
+    # O item lento ainda não terminou: a leitura volta na hora, sem marcar o fim
+    first = []
+    offset = 0
+    while len(first) < 1:
+        lines, offset, status, finished = runner.read_results(job_id, offset)
+        first.extend(json.loads(line) for line in lines.splitlines())
+        assert status == "running" and not finished
+
+    release.set()
+    rest, _, status = _read_all(runner, job_id, offset)
+    assert status == "done"
+    assert sorted(result["index"] for result in first + rest) == [0, 1]
+
+
+def test_read_results_of_unknown_job_is_none(tmp_path):
+    runner = BatchRunner(lambda item: {}, str(tmp_path))
+    assert runner.read_results("0" * 32) is None
+    assert runner.read_results("../etc/passwd") is None
+
+
+def test_dead_owner_ends_with_error_line(tmp_path):
+    runner = BatchRunner(lambda item: {"answer": "ok"}, str(tmp_path))
+    job_id = runner.submit_job([{"q": "a"}])
+    _, offset, _ = _read_all(runner, job_id)
+
+    # Simula um dono morto que deixou uma linha pela metade
+    meta = runner._read_meta(job_id)
+    runner._write_meta(job_id, dict(meta, status="running", pid=2 ** 22 + 1))
+    with open(runner._paths(job_id)[1], "a", encoding="utf-8") as f:
+        f.write('{"index": 1')
+
+    results, _, status = _read_all(runner, job_id, offset)
+    assert status == "failed"
+    assert [result.get("error") for result in results] == ["O worker que executava o job parou de responder"]
+
+
+def test_stats_counts_queued_and_running_items(tmp_path):
+    release = threading.Event()
+    runner = BatchRunner(lambda item: {"ok": release.wait(5)}, str(tmp_path), max_workers=1)
+    job_id = runner.submit_job([{}, {}, {}])
+
+    assert _wait_for_stats(runner, {"queued": 2, "running": 1})
+    release.set()
+    _read_all(runner, job_id)
+    stats = runner.stats()
+    assert (stats["queued"], stats["running"], stats["items_submitted"], stats["items_done"]) == (0, 0, 3, 3)
+
+
+def _wait_for_stats(runner, expected, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = runner.stats()
+        if all(stats[key] == value for key, value in expected.items()):
+            return True
+        time.sleep(0.001)
+    return False
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, ttl=60, clock=clock)
+    cache.set("a", 1)
+
+    clock.advance(59.9)
+    assert cache.get("a") == 1
+
+    clock.advance(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_ttl_per_entry_and_no_expiry():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, ttl=60, clock=clock)
+    cache.set("curta", 1, ttl=5)
+    cache.set("eterna", 2, ttl=0)
+
+    clock.advance(10)
+    assert cache.get("curta") is None
+
+    clock.advance(10 ** 9)
+    assert cache.get("eterna") == 2
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(max_entries=3, ttl=60, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+
+    # Ler "a" o torna o mais recente: o próximo despejo leva "b"
+    assert cache.get("a") == "a"
+    cache.set("d", "d")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+
+    # Depois das leituras, a ordem de uso é a, c, d: "a" é o próximo a sair
+    cache.set("e", "e")
+    assert cache.get("a") is None
+
+    # Regravar "c" também conta como uso; agora "d" é o mais antigo
+    cache.set("c", "c2")
+    cache.set("f", "f")
+    assert cache.get("d") is None
+    assert [cache.get(key) for key in ("c", "e", "f")] == ["c2", "e", "f"]
+    assert cache.stats()["evictions"] == 3
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from semantic_cache import HashingEmbedder, SemanticCache
+from test_cache import FakeClock
+
+
+def _cache(**kwargs):
+    return SemanticCache(HashingEmbedder(), **dict({"threshold": 0.9, "max_entries": 10}, **kwargs))
+
+
+def test_similar_question_hits_and_different_question_misses():
+    cache = _cache()
+    cache.add("allex", "Como faço para abrir uma empresa?", "resposta")
+
+    answer, score = cache.lookup("allex", "como faço para abrir uma empresa")
+    assert answer == "resposta" and score >= 0.9
+
+    answer, score = cache.lookup("allex", "Qual a melhor dieta para emagrecer?")
+    assert answer is None and score < 0.9
+
+    # O índice é por agente
+    assert cache.lookup("lucas", "Como faço para abrir uma empresa?") == (None, 0.0)
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_threshold_is_the_boundary():
+    cache = _cache()
+    cache.add("allex", "abrir empresa", "resposta")
+    _, score = cache.lookup("allex", "abrir uma empresa nova")
+
+    strict, loose = _cache(threshold=min(score + 1e-3, 1.0)), _cache(threshold=score - 1e-3)
+    for cache in (strict, loose):
+        cache.add("allex", "abrir empresa", "resposta")
+    assert strict.lookup("allex", "abrir uma empresa nova")[0] is None
+    assert loose.lookup("allex", "abrir uma empresa nova")[0] == "resposta"
+
+
+def test_entry_expires_after_ttl_and_its_slot_is_reused():
+    clock = FakeClock()
+    cache = _cache(ttl=60, max_entries=2, clock=clock)
+    cache.add("allex", "abrir empresa", "antiga")
+
+    clock.advance(59.9)
+    assert cache.lookup("allex", "abrir empresa")[0] == "antiga"
+    cache.add("allex", "emagrecer com saúde", "dieta")
+
+    clock.advance(0.1)
+    assert cache.lookup("allex", "abrir empresa")[0] is None
+
+    # O índice está cheio, mas a entrada vencida dá lugar à nova sem despejar a válida
+    cache.add("allex", "investir em ações", "bolsa")
+    assert cache.stats()["evictions"] == 0
+    assert cache.lookup("allex", "emagrecer com saúde")[0] == "dieta"
+    assert cache.lookup("allex", "investir em ações")[0] == "bolsa"
+
+
+def test_prompt_version_change_invalidates_the_agent_index():
+    cache = _cache()
+    cache.add("allex", "abrir empresa", "com o prompt antigo", version="v1")
+    cache.add("lucas", "abrir empresa", "outro agente", version="v1")
+    assert cache.lookup("allex", "abrir empresa", version="v1")[0] == "com o prompt antigo"
+
+    # Recarga (ou rollback) dos prompts: a resposta gerada com a versão anterior não volta
+    assert cache.lookup("allex", "abrir empresa", version="v2")[0] is None
+    cache.add("allex", "abrir empresa", "com o prompt novo", version="v2")
+    assert cache.lookup("allex", "abrir empresa", version="v2")[0] == "com o prompt novo"
+    assert cache.lookup("allex", "abrir empresa", version="v1")[0] is None
+    assert cache.stats()["invalidations"] == 2
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+THREADS = 16
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("tempo esgotado")
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight, key, fn):
+    """Dispara THREADS chamadas de `flight.do(key, fn)`; devolve (resultados, exceções, threads)."""
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            value = flight.do(key, fn)
+            with lock:
+                results.append(value)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    return results, errors, threads
+
+
+def test_concurrent_calls_with_same_key_execute_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    results, errors, threads = _run_concurrently(flight, "chave", fn)
+    # Só libera a primeira chamada depois que todas as outras já estão esperando por ela
+    _wait_for(lambda: flight.stats()["coalesced"] == THREADS - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert not errors
+    assert len(results) == THREADS and all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "executed": 1, "coalesced": THREADS - 1}
+
+
+def test_waiters_receive_the_same_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("falhou")
+
+    results, errors, threads = _run_concurrently(flight, "chave", fn)
+    _wait_for(lambda: flight.stats()["coalesced"] == THREADS - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert not results
+    assert len(errors) == THREADS and all(error is errors[0] for error in errors)
+
+
+def test_new_call_after_completion_executes_again():
+    flight = SingleFlight()
+    assert flight.do("chave", lambda: 1) == 1
+    assert flight.do("chave", lambda: 2) == 2
+    with pytest.raises(KeyError):
+        flight.do("outra", lambda: {}["x"])
+    assert flight.stats()["executed"] == 3
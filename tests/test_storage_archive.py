@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from storage.archive import archive_cutoff, archive_conversation
+from storage.testing import make_messages
+
+
+def _key(row):
+    return (row["created_at"], row["id"])
+
+
+@pytest.mark.parametrize("storage", ["archived"], indirect=True)
+def test_archive(storage, user):
+    conversation_id = storage.upsert_conversation(user, "agente")["id"]
+    old = [dict(row, created_at=f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}.000000+00:00")
+           for i, row in enumerate(make_messages(conversation_id, 500, "velha"))]
+    storage.insert_messages(old)
+    storage.insert_messages(make_messages(conversation_id, 30, "nova"))
+    expected = [row["id"] for row in storage.messages_range(conversation_id, 0, 1000)]
+
+    moved = archive_conversation(storage.hot, storage.archive, conversation_id, archive_cutoff(1), block_size=64)
+    assert moved == 500 and storage.hot.count_messages(conversation_id) == 30
+    assert storage.count_messages(conversation_id) == 530
+    assert archive_conversation(storage.hot, storage.archive, conversation_id, archive_cutoff(1)) == 0, "repetir não duplica"
+
+    reads = storage.archive.block_reads
+    latest = storage.messages_before(conversation_id, limit=20)
+    assert all(row["content"].startswith("nova") for row in latest)
+    assert storage.archive.block_reads == reads, "a página mais recente não toca no arquivo"
+
+    walked, cursor = [], None
+    while True:
+        page = storage.messages_before(conversation_id, cursor, limit=51)
+        walked.extend(row["id"] for row in page)
+        if len(page) < 51:
+            break
+        cursor = _key(page[-1])
+    assert list(reversed(walked)) == expected, "rolar até o início junta as duas camadas sem lacunas"
+    assert storage.archive.block_reads - reads == 8, "cada bloco é descomprimido uma única vez"
+
+    assert [row["id"] for row in storage.messages_range(conversation_id, 490, 509)] == expected[490:510]
+    boundary = storage.messages_range(conversation_id, 480, 480)[0]
+    assert [row["id"] for row in storage.messages_after(conversation_id, _key(boundary), 40)] == expected[481:521]
+
+    assert storage.delete_messages(conversation_id) == 530
+    assert storage.count_messages(conversation_id) == 0 and storage.messages_before(conversation_id) == []
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import uuid
+
+from storage.testing import make_messages
+
+
+def test_conversations(storage, user):
+    first = storage.upsert_conversation(user, "agente")
+    again = storage.upsert_conversation(user, "agente")
+    other = storage.upsert_conversation(user, "outro")
+    assert first["id"] == again["id"], "upsert deve devolver a mesma conversa para o mesmo par"
+    assert other["id"] != first["id"], "agentes diferentes devem ter conversas diferentes"
+    assert (first.get("summarized_count") or 0) == 0 and first.get("summary") is None
+
+    storage.update_conversation(first["id"], {"summary": "resumo", "summarized_count": 4})
+    row = storage.get_conversation(first["id"])
+    assert row["summary"] == "resumo" and row["summarized_count"] == 4
+    assert storage.get_conversation(str(uuid.uuid4())) is None
+
+
+def test_messages(storage, user):
+    conversation_id = storage.upsert_conversation(user, "agente")["id"]
+    inserted = storage.insert_messages(make_messages(conversation_id, 7))
+    assert len(inserted) == 7 and all(row.get("id") and row.get("created_at") for row in inserted)
+    assert storage.count_messages(conversation_id) == 7
+    storage.insert_messages(inserted[4:])
+    assert storage.count_messages(conversation_id) == 7, "insert_messages é idempotente por id (lote reenviado)"
+
+    latest = storage.messages_before(conversation_id, limit=3)
+    assert [row["content"] for row in latest] == ["m6", "m5", "m4"], "messages_before: da mais nova para a mais antiga"
+    older = storage.messages_before(conversation_id, (latest[-1]["created_at"], latest[-1]["id"]), limit=10)
+    assert [row["content"] for row in older] == ["m3", "m2", "m1", "m0"], "o cursor before é exclusivo"
+
+    newer = storage.messages_after(conversation_id, (older[-1]["created_at"], older[-1]["id"]), limit=2)
+    assert [row["content"] for row in newer] == ["m1", "m2"], "messages_after: cronológica, cursor exclusivo"
+    assert storage.messages_after(conversation_id, (latest[0]["created_at"], latest[0]["id"])) == []
+
+    assert [row["content"] for row in storage.messages_range(conversation_id, 2, 4)] == ["m2", "m3", "m4"]
+    assert set(latest[0]) >= {"id", "conversation_id", "role", "content", "created_at", "seq"}
+
+
+def test_given_timestamps(storage, user):
+    """Linhas com `created_at` atribuído (write-behind) mantêm a ordem dada, não a de chegada."""
+    conversation_id = storage.upsert_conversation(user, "agente")["id"]
+    rows = make_messages(conversation_id, 3)
+    for row, second in zip(rows, ("03", "01", "02")):
+        row["created_at"] = f"2024-01-01T00:00:{second}.000000+00:00"
+    storage.insert_messages(rows)
+    ordered = storage.messages_range(conversation_id, 0, 10)
+    assert [row["content"] for row in ordered] == ["m1", "m2", "m0"]
+
+
+def test_commit_order(storage, user):
+    """`seq` segue a ordem de gravação: uma mensagem com created_at anterior gravada depois ainda aparece em messages_since."""
+    conversation_id = storage.upsert_conversation(user, "ordem")["id"]
+    assert storage.latest_seq(conversation_id) is None
+    rows = make_messages(conversation_id, 3)
+    for row, second in zip(rows, ("01", "02", "03")):
+        row["created_at"] = f"2024-01-01T00:00:{second}.000000+00:00"
+    storage.insert_messages([rows[0], rows[2]])
+    synced = storage.latest_seq(conversation_id)
+    assert [row["content"] for row in storage.messages_since(conversation_id, 0)] == ["m0", "m2"]
+
+    storage.insert_messages([rows[1]])
+    assert storage.latest_seq(conversation_id) > synced, "toda gravação avança a versão da conversa"
+    assert [row["content"] for row in storage.messages_since(conversation_id, synced)] == ["m1"], \
+        "a mensagem atrasada chega depois do cursor de quem já sincronizou"
+
+    imported = dict(make_messages(conversation_id, 1, "importada")[0], id=str(uuid.uuid4()),
+                    created_at="2024-01-01T00:00:04.000000+00:00", seq=storage.latest_seq(conversation_id) + 1000)
+    storage.import_messages([imported])
+    assert storage.latest_seq(conversation_id) == imported["seq"], "import mantém o seq de origem"
+    storage.insert_messages(make_messages(conversation_id, 1, "depois"))
+    assert storage.messages_since(conversation_id, imported["seq"])[0]["content"] == "depois0"
+
+
+def test_delete(storage, user):
+    conversation_id = storage.upsert_conversation(user, "agente")["id"]
+    keep_id = storage.upsert_conversation(user, "outro")["id"]
+    storage.insert_messages(make_messages(conversation_id, 4) + make_messages(keep_id, 2))
+    assert storage.delete_messages(conversation_id) == 4
+    assert storage.count_messages(conversation_id) == 0 and storage.messages_before(conversation_id) == []
+    assert storage.count_messages(keep_id) == 2, "apagar uma conversa não pode afetar as outras"
+    assert storage.get_conversation(conversation_id) is not None, "a conversa continua existindo"
+
+
+def test_listing_and_import(storage, user):
+    created = [storage.upsert_conversation(user, agent)["id"] for agent in ("a", "b", "c")]
+    assert storage.find_conversation(user, "b")["id"] == created[1]
+    assert storage.find_conversation(user, "inexistente") is None
+
+    first = storage.list_conversations(user_id=user, limit=2)
+    rest = storage.list_conversations(user_id=user, after=first[-1]["id"], limit=10)
+    assert [row["id"] for row in first + rest] == sorted(created), "listagem por keyset em ordem de id"
+
+    imported_id = str(uuid.uuid4())
+    storage.import_conversation({"id": imported_id, "user_id": user, "agent_id": "importado", "summary": "s", "summarized_count": 2})
+    assert storage.get_conversation(imported_id)["summary"] == "s"
+    rows = [dict(row, id=str(uuid.uuid4()), created_at=f"2024-01-01T00:00:0{i}.000000+00:00")
+            for i, row in enumerate(make_messages(imported_id, 3))]
+    storage.import_messages(rows)
+    storage.import_messages(rows[1:])
+    assert [row["id"] for row in storage.messages_range(imported_id, 0, 10)] == [row["id"] for row in rows], \
+        "import mantém ids e created_at e ignora repetidos"
+
+    assert storage.delete_messages(imported_id, ids=[rows[0]["id"]]) == 1
+    assert storage.count_messages(imported_id) == 2
+    storage.delete_messages(imported_id)
+    storage.delete_conversation(imported_id)
+    assert storage.get_conversation(imported_id) is None and storage.find_conversation(user, "importado") is None
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import time
+import uuid
+
+import pytest
+
+from storage.replicas import _UNVERIFIABLE, LocalWatermarks, ReplicatedStorage, SharedWatermarks
+from storage.testing import make_messages
+
+
+@pytest.fixture(params=["local", "shared"])
+def watermarks(request, tmp_path):
+    if request.param == "local":
+        return LocalWatermarks(ttl=60)
+    return SharedWatermarks(str(tmp_path / "watermarks.db"), ttl=60)
+
+
+def test_concrete_positions_keep_the_highest(watermarks):
+    watermarks.mark("c", 5)
+    watermarks.mark("c", 3)
+    assert watermarks.get("c") == 5
+
+
+def test_write_after_a_concrete_position_cannot_be_verified(watermarks):
+    watermarks.mark("c", 5, time.time())
+    watermarks.mark("c", _UNVERIFIABLE)
+    assert watermarks.get("c") == _UNVERIFIABLE
+
+
+def test_concrete_position_from_a_later_write_replaces_a_pending_mark(watermarks):
+    # Mensagem na fila write-behind; depois o flusher a grava e lê a posição
+    watermarks.mark("c", _UNVERIFIABLE)
+    time.sleep(0.001)
+    watermarks.mark("c", 7, time.time())
+    assert watermarks.get("c") == 7
+
+
+def test_pending_mark_made_during_the_write_is_kept(watermarks):
+    # A gravação começou antes da nova mensagem ir para a fila: a posição lida não cobre essa mensagem
+    started = time.time()
+    time.sleep(0.001)
+    watermarks.mark("c", _UNVERIFIABLE)
+    watermarks.mark("c", 7, started)
+    assert watermarks.get("c") == _UNVERIFIABLE
+
+    # Uma posição sem instante de início (ex.: importação) nunca substitui a marca
+    watermarks.mark("c", 8)
+    assert watermarks.get("c") == _UNVERIFIABLE
+
+
+@pytest.mark.parametrize("storage", ["replicated"], indirect=True)
+def test_read_your_writes(storage, user):
+    primary, replica = storage.primary, storage.replicas[0]
+    conversation_id = storage.upsert_conversation(user, "agente")["id"]
+    storage.insert_messages(make_messages(conversation_id, 2))
+    assert replica.count_messages(conversation_id) == 0, "a réplica deveria estar atrasada"
+    assert [row["content"] for row in storage.messages_before(conversation_id)] == ["m1", "m0"], "leia-suas-escritas"
+
+    # Outro worker do nó: mesmo primário e réplica, mesmo arquivo de marcas, nenhum estado em memória em comum
+    other = ReplicatedStorage(primary, [replica], max_lag=storage.max_lag,
+                              watermarks=SharedWatermarks(storage._watermarks.path, ttl=storage.max_lag))
+    assert [row["content"] for row in other.messages_before(conversation_id)] == ["m1", "m0"], "marcas compartilhadas"
+    pending_id = storage.upsert_conversation(user, "pendente")["id"]
+    storage.note_pending_write(pending_id)
+    other.messages_before(pending_id)
+    assert other.stats()["primary_reads"] == 2, "mensagem ainda na fila já manda as leituras ao primário"
+
+    before = storage.stats()["replica_reads"]
+    storage.messages_before(str(uuid.uuid4()))
+    assert storage.stats()["replica_reads"] == before + 1, "conversas sem escrita recente leem da réplica"
+
+    time.sleep(primary.lag * 2)
+    caught_up = storage.stats()["caught_up"]
+    assert storage.count_messages(conversation_id) == 2
+    assert storage.stats()["caught_up"] == caught_up + 1, "réplica em dia deve voltar a atender a conversa"
+
+    storage.delete_messages(conversation_id)
+    assert storage.messages_before(conversation_id) == [], "a limpeza do histórico também é lida do primário"
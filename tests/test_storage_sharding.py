@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from storage import MemoryStorage, ShardedStorage
+from storage.sharding import misplaced_conversations, move_conversation, move_messages
+from storage.testing import make_messages
+
+
+@pytest.mark.parametrize("storage", ["sharded"], indirect=True)
+def test_rebalance(storage, user):
+    users = [f"{user}-{i}" for i in range(60)]
+    for shard_user in users:
+        conversation_id = storage.upsert_conversation(shard_user, "agente")["id"]
+        assert storage._locations.get(conversation_id) == (storage.home_of(shard_user), True)
+        storage.insert_messages(make_messages(conversation_id, 3))
+
+    grown = ShardedStorage(dict(storage.shards, novo=MemoryStorage()), vnodes=storage.ring.vnodes)
+    moving = [move for move in misplaced_conversations(grown) if move[0]["user_id"].startswith(user)]
+    assert moving and all(target == "novo" for _, _, target in moving), "só o shard novo recebe conversas"
+    assert len(moving) < len(users) / 2, "hash consistente: só uma fração dos usuários muda de shard"
+
+    # Um usuário ainda não migrado continua encontrando a própria conversa
+    pending_row, _, _ = moving[0]
+    assert grown.upsert_conversation(pending_row["user_id"], "agente")["id"] == pending_row["id"]
+
+    # Outro worker (já com o anel novo) guarda em cache a localização antiga de duas conversas
+    worker = ShardedStorage(grown.shards, vnodes=storage.ring.vnodes)
+    (late_row, late_source, _) = moving[1]
+    for row in (pending_row, late_row):
+        worker.get_conversation(row["id"])
+    assert worker._locations.get(pending_row["id"]) == (moving[0][1], False)
+
+    # Uma escrita chega à origem entre a cópia das mensagens e a remoção da conversa
+    source_shard = grown.shards[late_source]
+    delete_conversation = source_shard.delete_conversation
+
+    def delete_after_racing_write(conversation_id):
+        if conversation_id == late_row["id"]:
+            worker.insert_messages(make_messages(conversation_id, 1, "corrida"))
+        delete_conversation(conversation_id)
+
+    source_shard.delete_conversation = delete_after_racing_write
+    try:
+        for row, source, target in moving:
+            expected = 4 if row["id"] == late_row["id"] else 3
+            assert move_conversation(grown, row, source, target, page_size=2) == expected, "varredura depois de apagar"
+    finally:
+        del source_shard.delete_conversation
+
+    # ...e outra chega depois da migração, pela localização antiga em cache
+    worker.insert_messages(make_messages(pending_row["id"], 1, "atrasada"))
+    assert worker.relocated_messages == 1, "a escrita conferida segue a conversa para o shard novo"
+    swept = sum(move_messages(grown.shards[source], grown.shards[target], row["id"]) for row, source, target in moving)
+    assert swept == 0, "nenhuma mensagem fica para trás no shard antigo"
+
+    for shard_user in users:
+        row = grown.find_conversation(shard_user, "agente")
+        assert grown._locations.get(row["id"]) == (grown.home_of(shard_user), True), "conversa no shard do usuário"
+        expected = 4 if row["id"] in (pending_row["id"], late_row["id"]) else 3
+        assert grown.count_messages(row["id"]) == expected
+        assert sum(1 for shard in grown.shards.values() if shard.get_conversation(row["id"])) == 1
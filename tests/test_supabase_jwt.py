@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from supabase_jwt import InvalidToken, token_subject
+
+SECRET = "segredo-do-projeto"
+NOW = 1_700_000_000
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def _token(payload, secret=SECRET, alg="HS256"):
+    signing_input = f"{_b64({'alg': alg, 'typ': 'JWT'})}.{_b64(payload)}"
+    signature = hmac.new(secret.encode("utf-8"), signing_input.encode("ascii"), hashlib.sha256).digest()
+    return f"{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode('ascii')}"
+
+
+def test_valid_token_returns_subject():
+    assert token_subject(_token({"sub": "user-1", "exp": NOW + 60}), SECRET, now=NOW) == "user-1"
+
+
+@pytest.mark.parametrize("token", [
+    _token({"sub": "user-1", "exp": NOW + 60}, secret="outro"),
+    _token({"sub": "user-1", "exp": NOW}),
+    _token({"sub": "user-1"}),
+    _token({"exp": NOW + 60}),
+    _token({"sub": "user-1", "exp": NOW + 60}, alg="none"),
+    "nao.e.um-token",
+    "",
+])
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(InvalidToken):
+        token_subject(token, SECRET, now=NOW)
+
+
+def test_missing_secret_rejects_every_token():
+    with pytest.raises(InvalidToken):
+        token_subject(_token({"sub": "user-1", "exp": NOW + 60}), None, now=NOW)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import json
+
+from storage import SQLiteStorage
+from write_behind import WriteBehindQueue
+
+
+def _queue(tmp_path, writer, **kwargs):
+    return WriteBehindQueue(writer, spool_dir=str(tmp_path / "spool"), flush_interval=3600, retry_backoff=0,
+                            max_retries=1, fsync=False, **kwargs)
+
+
+def _dead_letters(queue):
+    with open(queue.dead_letter_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_poison_row_goes_to_dead_letter_and_does_not_block_the_queue(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "quantum.db"))
+    conversation_id = storage.upsert_conversation("user", "agente")["id"]
+    queue = _queue(tmp_path, storage.insert_messages)
+
+    bad = queue.enqueue({"conversation_id": conversation_id, "role": "user", "content": {"x": 1}})
+    good = queue.enqueue({"conversation_id": conversation_id, "role": "assistant", "content": "resposta"})
+
+    assert queue.flush() == 1
+    assert [row["id"] for row in storage.messages_range(conversation_id, 0, 10)] == [good["id"]]
+    stats = queue.stats()
+    assert stats["depth"] == 0 and stats["dead_lettered"] == 1
+    dead = _dead_letters(queue)
+    assert [entry["row"]["id"] for entry in dead] == [bad["id"]] and dead[0]["error"]
+
+    # O spool não guarda mais a linha descartada: ela não volta depois de um reinício
+    assert queue.flush() == 0
+    with open(queue._spool_path, encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_lone_failing_row_is_dead_lettered_only_when_the_probe_passes(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "quantum.db"))
+    conversation_id = storage.upsert_conversation("user", "agente")["id"]
+    healthy = [False]
+
+    def probe():
+        if not healthy[0]:
+            raise ConnectionError("fora do ar")
+
+    queue = _queue(tmp_path, storage.insert_messages, probe=probe)
+    queue.enqueue({"conversation_id": conversation_id, "role": "user", "content": {"x": 1}})
+
+    assert queue.flush() == 0
+    assert queue.stats()["depth"] == 1 and queue.stats()["dead_lettered"] == 0
+
+    healthy[0] = True
+    assert queue.flush() == 0
+    assert queue.stats()["depth"] == 0 and queue.stats()["dead_lettered"] == 1
+
+
+def test_outage_keeps_every_row_pending(tmp_path):
+    down = [True]
+    written = []
+
+    def writer(rows):
+        if down[0]:
+            raise ConnectionError("fora do ar")
+        written.extend(rows)
+
+    queue = _queue(tmp_path, writer, probe=lambda: writer([]))
+    rows = [queue.enqueue({"conversation_id": "c", "role": "user", "content": f"m{i}"}) for i in range(3)]
+
+    assert queue.flush() == 0
+    assert queue.stats()["depth"] == 3 and queue.stats()["dead_lettered"] == 0
+
+    down[0] = False
+    assert queue.flush() == 3
+    assert [row["id"] for row in written] == [row["id"] for row in rows]
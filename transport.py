@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+import httpx
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+class TransportConfig:
+    """Parâmetros do pool de conexões HTTP compartilhado (lidos do ambiente)."""
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", 100))
+        self.max_keepalive = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", 20))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+        self.http2 = _env_bool("HTTP2_ENABLED", True)
+        self.connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+        self.keepwarm_interval = float(os.getenv("HTTP_KEEPWARM_INTERVAL", 45))
+
+    @property
+    def limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    @property
+    def timeout(self):
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+def build_transport(config, asynchronous=False):
+    """
+    Cria o transporte (pool de conexões) compartilhado pelos clientes da OpenAI e do Supabase.
+    HTTP/2 exige o pacote 'h2'; sem ele, o pool usa HTTP/1.1.
+    """
+    transport_class = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+    try:
+        return transport_class(http2=config.http2, limits=config.limits)
+    except ImportError:
+        print("!!! AVISO: Pacote 'h2' não instalado. Pool HTTP usará HTTP/1.1.")
+        return transport_class(http2=False, limits=config.limits)
+
+
+def build_http_client(transport, config):
+    """Cliente httpx para a OpenAI sobre o transporte compartilhado."""
+    if isinstance(transport, httpx.AsyncHTTPTransport):
+        return httpx.AsyncClient(transport=transport, timeout=config.timeout)
+    return httpx.Client(transport=transport, timeout=config.timeout)
+
+
+def attach_to_supabase(supabase, transport, config):
+    """
+    Troca a sessão httpx do PostgREST do cliente Supabase por uma que usa o transporte compartilhado,
+    mantendo a URL base e os cabeçalhos de autenticação originais.
+    """
+    postgrest = supabase.postgrest
+    session = postgrest.session
+    postgrest.session = type(session)(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=config.timeout,
+        follow_redirects=True,
+        transport=transport
+    )
+    if isinstance(session, httpx.Client):
+        session.close()
+
+
+def pool_stats(transport):
+    """
+    Resumo das conexões do pool (ativas, ociosas, HTTP/2). O httpx não expõe o pool do httpcore
+    publicamente: se os atributos internos mudarem de versão, devolve só {"unavailable": motivo}.
+    """
+    try:
+        pool = getattr(transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        origins = {getattr(connection, "_origin", None) for connection in connections}
+        return {
+            "connections": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+            "available": sum(1 for connection in connections if connection.is_available()),
+            "http2": sum(1 for connection in connections if "HTTP/2" in connection.info()),
+            "origins": sorted(str(origin) for origin in origins if origin is not None)
+        }
+    except Exception as e:
+        return {"unavailable": f"{type(e).__name__}: {e}"}
+
+
+class KeepWarm:
+    """
+    Executa as funções de aquecimento na subida do worker e depois periodicamente,
+    para que as conexões TLS não expirem durante períodos ociosos.
+    """
+
+    def __init__(self, warmers, interval):
+        self.warmers = warmers
+        self.interval = interval
+        self.last_run = None
+        self._thread = None
+
+    def warm(self):
+        for name, warmer in self.warmers.items():
+            started = time.perf_counter()
+            try:
+                warmer()
+                print(f">>> Conexão com {name} aquecida em {(time.perf_counter() - started) * 1000:.0f} ms.")
+            except Exception as e:
+                print(f"!!! Falha ao aquecer conexão com {name}: {e}")
+        self.last_run = time.time()
+
+    def start(self):
+        self.warm()
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="keepwarm", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.warm()
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+import datetime
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def _read_rows(spool):
+    # Linhas de spools anteriores aos ids ganham um agora: o reenvio delas ainda é "pelo menos uma vez"
+    return [dict({"id": str(uuid.uuid4())}, **json.loads(line)) for line in spool if line.strip()]
+
+
+class WriteBehindQueue:
+    """
+    Persistência write-behind: cada linha é gravada primeiro em um spool local (arquivo append-only,
+    uma linha JSON por registro) e confirmada ao cliente; um flusher em segundo plano envia as linhas
+    ao banco em inserts de várias linhas quando o lote atinge `batch_size` ou a cada `flush_interval` segundos.
+
+    - Ordem: um único flusher envia as linhas na ordem de chegada, e `created_at` é atribuído no
+      enfileiramento (estritamente crescente no processo), então a ordem por conversa se mantém.
+    - Falhas: o lote é reenviado até `max_retries` vezes com espera exponencial; se ainda falhar, cada
+      linha é gravada sozinha, para que uma linha inválida não segure as demais. As que falham sozinhas
+      enquanto o banco responde (outra linha foi gravada, ou `probe()` passa) têm mais uma rodada de
+      tentativas e, se ainda falharem, vão para o spool de descarte (`dead-letter.jsonl`, com o erro).
+      Se nenhuma linha passa e o banco não responde, é uma queda: tudo continua no spool para o próximo ciclo.
+    - Reinício: cada worker trava o próprio spool (flock); na subida, os spools sem dono
+      (de workers que morreram) são reenviados e apagados. A entrega é "pelo menos uma vez".
+    - Reenvios: cada linha recebe um `id` (UUID) no enfileiramento e o writer grava de forma idempotente
+      por id, então repetir um lote (parcial ou não) ou um spool recuperado não duplica mensagens.
+    - Regravação: o spool é substituído de forma atômica (arquivo temporário + fsync + os.replace), então
+      uma queda no meio da regravação deixa o spool antigo inteiro, nunca um arquivo truncado.
+    - `on_flush`, se informado, é chamado com cada lote logo depois de gravado no banco (ex.: para contar
+      mensagens só quando elas já são visíveis para quem lê do armazenamento).
+    """
+
+    def __init__(self, writer, spool_dir, batch_size=200, flush_interval=0.5, max_retries=3,
+                 retry_backoff=0.5, fsync=True, on_flush=None, probe=None):
+        self.writer = writer
+        self.on_flush = on_flush
+        self.probe = probe
+        self.spool_dir = spool_dir
+        self.dead_letter_path = os.path.join(spool_dir, "dead-letter.jsonl")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.fsync = fsync
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_timestamp = None
+        self._spool = None
+        self._spool_path = None
+        self._thread = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.dead_lettered = 0
+        self.replayed = 0
+        self.last_error = None
+        self.last_flush = None
+
+    # --- Spool local ---
+
+    def _open_spool(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool_path = os.path.join(self.spool_dir, f"spool-{os.getpid()}.jsonl")
+        self._spool = open(self._spool_path, "a+", encoding="utf-8")
+        fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Em containers o pid se repete entre reinícios: linhas deixadas com este mesmo nome também voltam
+        self._spool.seek(0)
+        rows = _read_rows(self._spool)
+        if rows:
+            self._pending.extend(rows)
+            self.replayed += len(rows)
+            print(f">>> Spool {os.path.basename(self._spool_path)} recuperado: {len(rows)} linha(s) reenfileirada(s).")
+
+    def _append_to_spool(self, row):
+        self._spool.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+
+    def _rewrite_spool(self):
+        # Chamado com self._lock: o spool passa a conter apenas as linhas ainda pendentes. O novo arquivo
+        # é travado antes de assumir o nome do spool, então nunca parece órfão para outro worker.
+        temp_path = os.path.join(self.spool_dir, f".spool-{os.getpid()}.tmp")
+        spool = open(temp_path, "w", encoding="utf-8")
+        try:
+            fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            for row in self._pending:
+                spool.write(json.dumps(row, ensure_ascii=False) + "\n")
+            spool.flush()
+            if self.fsync:
+                os.fsync(spool.fileno())
+            os.replace(temp_path, self._spool_path)
+        except BaseException:
+            spool.close()
+            raise
+        if self.fsync:
+            directory = os.open(self.spool_dir, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self._spool.close()
+        self._spool = spool
+
+    def _dead_letter(self, failed):
+        """Acrescenta as linhas descartadas, com o erro de cada uma, ao spool de descarte (compartilhado pelos workers)."""
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter:
+            fcntl.flock(dead_letter, fcntl.LOCK_EX)
+            for row, error in failed:
+                dead_letter.write(json.dumps({"row": row, "error": error, "failed_at": now}, ensure_ascii=False, default=str) + "\n")
+            dead_letter.flush()
+            if self.fsync:
+                os.fsync(dead_letter.fileno())
+
+    def _replay_orphans(self):
+        """Carrega as linhas dos spools de workers que não estão mais vivos (arquivo sem trava)."""
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "spool-*.jsonl"))):
+            if path == self._spool_path:
+                continue
+            try:
+                orphan = open(path, "r+", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # O dono pode ter substituído o spool entre o open e o flock: este arquivo já não é o spool
+                if os.fstat(orphan.fileno()).st_ino != os.stat(path).st_ino:
+                    raise BlockingIOError
+            except (BlockingIOError, FileNotFoundError):
+                orphan.close()
+                continue
+            with orphan:
+                rows = _read_rows(orphan)
+                with self._lock:
+                    self._pending.extend(rows)
+                    self._rewrite_spool()
+                os.remove(path)
+            self.replayed += len(rows)
+            print(f">>> Spool {os.path.basename(path)} recuperado: {len(rows)} linha(s) reenfileirada(s).")
+
+    # --- API ---
+
+    def start(self):
+        """Abre o spool deste processo, recupera spools órfãos e inicia o flusher."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._open_spool()
+            self._thread = threading.Thread(target=self._loop, name="write-behind", daemon=True)
+        self._replay_orphans()
+        self._thread.start()
+
+    def enqueue(self, row):
+        """Grava a linha no spool e a enfileira; devolve a linha com `id` e `created_at` atribuídos."""
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            row = dict(row, id=row.get("id") or str(uuid.uuid4()), created_at=self._next_timestamp())
+            self._append_to_spool(row)
+            self._pending.append(row)
+            self.enqueued += 1
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+        return row
+
+    def discard(self, predicate):
+        """Remove da fila as linhas pendentes que satisfazem `predicate` (ex.: conversa apagada)."""
+        with self._flush_lock, self._lock:
+            remaining = [row for row in self._pending if not predicate(row)]
+            removed = len(self._pending) - len(remaining)
+            if removed:
+                self._pending = remaining
+                self._rewrite_spool()
+            return removed
+
+    def flush(self):
+        """Envia as linhas pendentes em lotes de até `batch_size`; devolve quantas foram gravadas."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                if not batch:
+                    break
+                if self._write_with_retries(batch):
+                    done, failed = batch, []
+                else:
+                    done, failed = self._isolate(batch)
+                    if not done and not failed:
+                        break
+                    if failed:
+                        self._dead_letter(failed)
+                finished = {row["id"] for row in done} | {row["id"] for row, _ in failed}
+                with self._lock:
+                    self._pending = [row for row in self._pending if row["id"] not in finished]
+                    self._rewrite_spool()
+                    self.dead_lettered += len(failed)
+                written += len(done)
+                if done and self.on_flush:
+                    try:
+                        self.on_flush(done)
+                    except Exception as e:
+                        print(f"!!! Erro no callback on_flush da fila write-behind: {e}")
+        return written
+
+    def stats(self):
+        with self._lock:
+            oldest = self._pending[0]["created_at"] if self._pending else None
+            return {
+                "depth": len(self._pending),
+                "oldest_pending": oldest,
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "dead_lettered": self.dead_lettered,
+                "replayed": self.replayed,
+                "last_error": self.last_error,
+                "last_flush": self.last_flush
+            }
+
+    # --- Flusher ---
+
+    def _next_timestamp(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if self._last_timestamp is not None and now <= self._last_timestamp:
+            now = self._last_timestamp + datetime.timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now.isoformat()
+
+    def _write(self, batch):
+        self.writer(batch)
+        self.batches += 1
+        self.flushed += len(batch)
+        self.last_flush = time.time()
+
+    def _write_with_retries(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write(batch)
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        self.failed_batches += 1
+        print(f"!!! Erro ao gravar lote de {len(batch)} linha(s): {self.last_error}")
+        return False
+
+    def _reachable(self):
+        if self.probe is None:
+            return False
+        try:
+            self.probe()
+            return True
+        except Exception:
+            return False
+
+    def _isolate(self, batch):
+        """
+        Grava as linhas de um lote que falhou uma a uma. Devolve (gravadas, [(linha, erro) descartadas]);
+        ([], []) quando o banco parece fora do ar e o lote inteiro deve esperar o próximo ciclo.
+        """
+        done, failed = [], []
+        for row in batch:
+            try:
+                self._write([row])
+                done.append(row)
+            except Exception as e:
+                failed.append((row, str(e)))
+        if not failed or (not done and not self._reachable()):
+            return done, []
+        dead = []
+        for row, error in failed:
+            if self._write_with_retries([row]):
+                done.append(row)
+            else:
+                dead.append((row, self.last_error or error))
+                print(f"!!! Linha {row.get('id')} enviada ao spool de descarte: {self.last_error or error}")
+        order = {row["id"]: index for index, row in enumerate(batch)}
+        return sorted(done, key=lambda row: order[row["id"]]), dead
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"!!! Erro no flusher write-behind: {e}")